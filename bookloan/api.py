@@ -8,7 +8,7 @@ from datetime import timedelta
 REST_FRAMEWORK = {
     # Default authentication classes
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'library.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',  # For browsable API
     ],
     
@@ -35,14 +35,10 @@ REST_FRAMEWORK = {
     ],
     
     # Throttling (rate limiting)
+    # Tiers are configured in API_THROTTLING below
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'library.throttling.TieredRateThrottle',
     ],
-    'DEFAULT_THROTTLE_RATES': {
-        'anon': '100/hour',
-        'user': '1000/hour'
-    },
     
     # Exception handling
     'EXCEPTION_HANDLER': 'rest_framework.views.exception_handler',
@@ -97,6 +93,27 @@ API_THROTTLING = {
     'BURST_RATE': '60/min',
     'SUSTAINED_RATE': '1000/hour',
     'ADMIN_RATE': '5000/hour',
+    'CACHE_ALIAS': 'shared',  # counters must be shared by all workers
+}
+
+# POST /api/batch/ (see library/batch.py)
+API_BATCH = {
+    'MAX_REQUESTS': 20,
+    'MAX_WORKERS': 4,  # threads for {"concurrent": true}
+}
+
+# GET /api/typeahead/ (see library/typeahead.py); each worker holds its own index
+API_TYPEAHEAD = {
+    'LIMIT': 10,
+    'MEMORY_BUDGET': 64 * 1024 * 1024,  # bytes; least borrowed entries are dropped beyond it
+    'MAX_AGE': 15 * 60,  # rebuild after this many seconds, picking up other workers' writes
+}
+
+# Idempotency-Key support on loan writes (see library/idempotency.py)
+API_IDEMPOTENCY = {
+    'HEADER': 'Idempotency-Key',
+    'TTL': 24 * 60 * 60,  # how long a retry can replay the first response
+    'CACHE_ALIAS': 'shared',  # retries may land on another worker
 }
 
 # Token Authentication Settings
@@ -104,6 +121,7 @@ TOKEN_AUTH = {
     'TOKEN_TTL': timedelta(days=30),  # Token expires after 30 days
     'AUTO_REFRESH': True,
     'REFRESH_THRESHOLD': timedelta(days=7),  # Refresh if less than 7 days left
+    'CACHE_TIMEOUT': 300,  # Seconds a token lookup stays cached
 }
 
 # API Response Formats
@@ -0,0 +1,322 @@
+"""
+Two-tier cache backend for BookLoan.
+
+The L1 tier is a small in-process LRU with a short TTL, so hot keys are served
+without a network round trip. The L2 tier is the shared Redis cache configured
+under the ``L2_ALIAS`` option, so every gunicorn worker sees the same data.
+
+Writes and deletes publish the affected key on a Redis channel; every process
+listening on that channel evicts its L1 copy, which keeps the L1s coherent.
+
+Django creates a backend instance per thread, so the L1 lives at module
+level, one per ``LOCATION``, and every instance with that location shares it.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+_CLEAR_ALL = '*'
+
+
+class LocalLRU:
+    """Thread-safe in-process LRU with a per-entry TTL"""
+
+    def __init__(self, max_entries=1024, timeout=5):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.origin = uuid.uuid4().hex
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        """Store a value; the TTL is capped by the L1 timeout"""
+        ttl = self.timeout if timeout is None else min(timeout, self.timeout)
+        if ttl <= 0:
+            self.delete(key)
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class InvalidationBus:
+    """
+    Redis pub/sub channel used to evict L1 entries across processes.
+
+    Messages are ``<origin>:<key>``; the L1 that published a message
+    ignores it because it has already updated itself locally.
+    """
+
+    def __init__(self, client, channel):
+        self.client = client
+        self.channel = channel
+        self._listeners = weakref.WeakSet()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def register(self, local):
+        self._listeners.add(local)
+        self._ensure_listening()
+
+    def publish(self, origin, key):
+        if self._thread is None and self._listeners:
+            # The listener was lost in a fork
+            self._ensure_listening()
+        try:
+            self.client.publish(self.channel, f'{origin}:{key}')
+        except Exception:
+            logger.warning('Could not publish cache invalidation for %s', key, exc_info=True)
+
+    def _ensure_listening(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._handle})
+            self._thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def _handle(self, message):
+        data = message['data']
+        if isinstance(data, bytes):
+            data = data.decode()
+        origin, _, key = data.partition(':')
+        for local in list(self._listeners):
+            if local.origin == origin:
+                continue
+            if key == _CLEAR_ALL:
+                local.clear()
+            else:
+                local.delete(key)
+
+    def stop(self):
+        with self._lock:
+            if self._thread is not None:
+                self._thread.stop()
+                self._thread = None
+
+    def after_fork(self):
+        """Forget the parent's listener thread and the L1 data it kept fresh"""
+        self._lock = threading.Lock()
+        self._thread = None
+        for local in list(self._listeners):
+            local._lock = threading.Lock()
+            local.clear()
+
+
+# One bus per (redis url, channel) per process, shared by every TieredCache
+_buses = {}
+_buses_lock = threading.Lock()
+
+# One L1 per TieredCache location per process, shared by the per-thread instances
+_locals = {}
+_locals_lock = threading.Lock()
+
+
+def _after_fork():
+    global _buses_lock, _locals_lock
+    _buses_lock = threading.Lock()
+    _locals_lock = threading.Lock()
+    for bus in _buses.values():
+        bus.after_fork()
+    for local in _locals.values():
+        local._lock = threading.Lock()
+        local.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def get_local_cache(location, max_entries, timeout):
+    """Return the process-wide L1 for a TieredCache location"""
+    with _locals_lock:
+        if location not in _locals:
+            _locals[location] = LocalLRU(max_entries=max_entries, timeout=timeout)
+        return _locals[location]
+
+
+def get_invalidation_bus(l2, channel):
+    """Return the process-wide bus for a Redis L2 cache, or None"""
+    client_factory = getattr(getattr(l2, '_cache', None), 'get_client', None)
+    servers = getattr(l2, '_servers', None)
+    if client_factory is None or not servers:
+        return None
+    bus_key = (servers[0], channel)
+    with _buses_lock:
+        if bus_key not in _buses:
+            _buses[bus_key] = InvalidationBus(client_factory(write=True), channel)
+        return _buses[bus_key]
+
+
+class TieredCache(BaseCache):
+    """
+    Cache backend with an in-process LRU (L1) in front of a shared cache (L2)
+
+    LOCATION names the process-wide L1; aliases sharing it share their L1.
+
+    OPTIONS:
+        L2_ALIAS: cache alias used as the shared tier (default ``shared``)
+        L1_MAX_ENTRIES: maximum number of keys kept per process
+        L1_TIMEOUT: maximum seconds a key lives in L1
+        CHANNEL: pub/sub channel for invalidation messages
+    """
+
+    def __init__(self, location, params):
+        options = params.get('OPTIONS', {})
+        super().__init__(params)
+        self._l2_alias = options.get('L2_ALIAS', 'shared')
+        self._channel = options.get('CHANNEL', 'bookloan:cache:invalidate')
+        self._local = get_local_cache(
+            location,
+            max_entries=options.get('L1_MAX_ENTRIES', 1024),
+            timeout=options.get('L1_TIMEOUT', 5),
+        )
+        self._bus = _MISSING
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    @property
+    def bus(self):
+        if self._bus is _MISSING:
+            self._bus = get_invalidation_bus(self.l2, self._channel)
+            if self._bus is not None:
+                self._bus.register(self._local)
+        return self._bus
+
+    def _remember(self, key, value, timeout=None):
+        # Subscribe before caching anything locally, so no invalidation is missed
+        self.bus
+        self._local.set(key, value, timeout)
+
+    def _invalidate(self, key):
+        self._local.delete(key)
+        if self.bus is not None:
+            self.bus.publish(self._local.origin, key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version)
+        if added:
+            self._invalidate(self.make_and_validate_key(key, version))
+        return added
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        value = self._local.get(local_key)
+        if value is not _MISSING:
+            CACHE_REQUESTS.inc(tier='l1', result='hit')
+            return value
+        CACHE_REQUESTS.inc(tier='l1', result='miss')
+        value = self.l2.get(key, _MISSING, version)
+        if value is _MISSING:
+            CACHE_REQUESTS.inc(tier='l2', result='miss')
+            return default
+        CACHE_REQUESTS.inc(tier='l2', result='hit')
+        self._remember(local_key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version)
+        local_key = self.make_and_validate_key(key, version)
+        self._invalidate(local_key)
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.l2.default_timeout
+        self._remember(local_key, value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        touched = self.l2.touch(key, timeout, version)
+        self._invalidate(self.make_and_validate_key(key, version))
+        return touched
+
+    def delete(self, key, version=None):
+        deleted = self.l2.delete(key, version)
+        self._invalidate(self.make_and_validate_key(key, version))
+        return deleted
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._local.get(self.make_and_validate_key(key, version))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        CACHE_REQUESTS.inc(len(found), tier='l1', result='hit')
+        CACHE_REQUESTS.inc(len(missing), tier='l1', result='miss')
+        if missing:
+            fetched = self.l2.get_many(missing, version)
+            CACHE_REQUESTS.inc(len(fetched), tier='l2', result='hit')
+            CACHE_REQUESTS.inc(len(missing) - len(fetched), tier='l2', result='miss')
+            for key, value in fetched.items():
+                self._remember(self.make_and_validate_key(key, version), value)
+            found.update(fetched)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version)
+        for key in data:
+            self._invalidate(self.make_and_validate_key(key, version))
+        return failed
+
+    def delete_many(self, keys, version=None):
+        self.l2.delete_many(keys, version)
+        for key in keys:
+            self._invalidate(self.make_and_validate_key(key, version))
+
+    def has_key(self, key, version=None):
+        if self._local.get(self.make_and_validate_key(key, version)) is not _MISSING:
+            return True
+        return self.l2.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version)
+        self._invalidate(self.make_and_validate_key(key, version))
+        return value
+
+    def clear(self):
+        self.l2.clear()
+        self._invalidate(_CLEAR_ALL)
+        self._local.clear()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
@@ -0,0 +1,149 @@
+"""
+Compression of API responses and static files
+
+API
+    ``CompressionMiddleware`` (bookloan.middleware) compresses JSON responses
+    larger than ``COMPRESSION['MIN_SIZE']`` with brotli when the client
+    accepts it and the ``brotli`` package is installed, gzip otherwise.
+
+Static files
+    ``CompressedManifestStaticFilesStorage`` gives collected files hashed
+    names (``app.3f2a9c1b7d4e.js``) and writes ``.br``/``.gz`` variants next
+    to them. ``serve_precompressed`` serves the smallest variant the client
+    accepts and marks hashed files as cacheable forever.
+"""
+
+import gzip
+import mimetypes
+import posixpath
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.views.static import serve
+
+try:
+    import brotli
+except ImportError:  # optional: pip install bookloan[compression]
+    brotli = None
+
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+FAR_FUTURE = 'public, max-age=31536000, immutable'
+
+
+def compression_settings():
+    return {
+        'ENABLED': True,
+        'MIN_SIZE': 1024,
+        'CONTENT_TYPES': ('application/json',),
+        'GZIP_LEVEL': 6,
+        'BROTLI_QUALITY': 5,
+        'STATIC_EXTENSIONS': ('.js', '.css', '.html', '.svg', '.json', '.map', '.txt', '.xml', '.ico'),
+        'STATIC_QUALITY': 11,
+        'IMMUTABLE_PATTERN': r'\.[0-9a-f]{12}\.\w+$',
+        **getattr(settings, 'COMPRESSION', {}),
+    }
+
+
+def available_encodings():
+    """Encodings this process can produce, preferred first"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding, encodings):
+    """Pick the first of ``encodings`` the Accept-Encoding header allows"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        match = re.search(r'q=([0-9.]+)', params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding, level=None):
+    config = compression_settings()
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['BROTLI_QUALITY'] if level is None else level)
+    # mtime=0 keeps the output deterministic (stable ETags and build artifacts)
+    return gzip.compress(data, compresslevel=config['GZIP_LEVEL'] if level is None else level, mtime=0)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Hashed static files plus precompressed .br/.gz variants"""
+
+    # Fall back to the plain name for files missing from the manifest
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed_names = []
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if not dry_run and not isinstance(processed, Exception):
+                processed_names.extend([name, hashed_name] if hashed_name else [name])
+        if dry_run:
+            return
+        for name in dict.fromkeys(processed_names):
+            for variant in self.compress_file(name):
+                yield name, variant, True
+
+    def compress_file(self, name):
+        config = compression_settings()
+        if not name.endswith(tuple(config['STATIC_EXTENSIONS'])) or not self.exists(name):
+            return []
+        with self.open(name) as original:
+            data = original.read()
+        if len(data) < config['MIN_SIZE']:
+            return []
+        written = []
+        for encoding in available_encodings():
+            compressed = compress(data, encoding, level=config['STATIC_QUALITY'] if encoding == 'br' else 9)
+            if len(compressed) >= len(data):
+                continue
+            variant = name + SUFFIXES[encoding]
+            if self.exists(variant):
+                self.delete(variant)
+            self._save(variant, ContentFile(compressed))
+            written.append(variant)
+        return written
+
+
+def serve_precompressed(request, path, document_root=None, show_indexes=False):
+    """
+    ``django.views.static.serve`` that prefers precompressed variants
+
+    Looks for ``<path>.br`` and ``<path>.gz`` next to the file and serves the
+    first one the client accepts, with the original Content-Type.
+    """
+    config = compression_settings()
+    path = posixpath.normpath(path).lstrip('/')
+    variants = [
+        encoding for encoding, suffix in SUFFIXES.items()
+        if Path(safe_join(document_root, path + suffix)).is_file()
+    ]
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'), variants)
+    if encoding is None:
+        response = serve(request, path, document_root, show_indexes)
+    else:
+        response = serve(request, path + SUFFIXES[encoding], document_root)
+        content_type, _ = mimetypes.guess_type(path)
+        response.headers['Content-Type'] = content_type or 'application/octet-stream'
+        response.headers['Content-Encoding'] = encoding
+    if variants:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    if re.search(config['IMMUTABLE_PATTERN'], path):
+        response.headers['Cache-Control'] = FAR_FUTURE
+    return response
@@ -0,0 +1,74 @@
+"""
+Database routing for read replicas.
+
+Reads go to a replica only while a safe-method (GET/HEAD/OPTIONS) request is
+being served. Anything else - writes, reads after a write in the same request,
+reads inside a transaction and code running outside a request, such as
+management commands - uses the primary.
+
+After a write, ``ReplicaRoutingMiddleware`` sets a short-lived cookie so the
+same client keeps reading from the primary for ``DATABASE_REPLICA_LAG``
+seconds, long enough for the replicas to catch up.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+
+_use_replicas = ContextVar('bookloan_use_replicas', default=False)
+_pinned = ContextVar('bookloan_pinned_to_primary', default=False)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICA_ALIASES', [])
+
+
+def pin_to_primary():
+    """Send every following query of the current request to the primary"""
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def replica_reads():
+    """Allow reads in this context to be served by replicas"""
+    use_token = _use_replicas.set(True)
+    pinned_token = _pinned.set(False)
+    try:
+        yield
+    finally:
+        _use_replicas.reset(use_token)
+        _pinned.reset(pinned_token)
+
+
+class PrimaryReplicaRouter:
+    """Route safe-method reads to replicas, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if not replicas or not _use_replicas.get() or _pinned.get():
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
@@ -0,0 +1,27 @@
+"""
+gunicorn configuration for the api-worker profile
+
+    DJANGO_SETTINGS_MODULE=bookloan.settings_api_worker \
+        gunicorn bookloan.wsgi -c bookloan/gunicorn_api_worker.py
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', os.cpu_count() or 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    # The application is preloaded at this point; warm it before the first fork
+    from bookloan.prefork import warm_up
+    warm_up()
+
+
+def post_fork(server, worker):
+    from bookloan.prefork import after_fork
+    after_fork()
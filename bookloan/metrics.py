@@ -0,0 +1,279 @@
+"""
+Prometheus metrics for BookLoan
+
+Recording is cheap enough for the hot path: every thread writes into its own
+shard (a plain dict registered once per thread), so incrementing a counter
+or observing a latency takes no lock. Shards are only merged when /metrics
+is scraped. When a thread exits its shard is folded into a single shard of
+retired values, so short-lived threads don't pile up shards.
+
+Under gunicorn each worker has its own registry. With
+``METRICS['MULTIPROCESS_DIR']`` set, workers write a snapshot of their
+values to ``metrics-<pid>.json`` in that directory at most every
+``FLUSH_INTERVAL`` seconds, and a scrape served by any worker sums the
+snapshots of all of them.
+
+Circulation gauges (active loans, overdue loans, books with no copy
+available) come from ``CirculationCounter``, which is maintained as loans
+change, so a scrape never counts rows. Loans become overdue through
+``manage.py mark_overdue`` (core.overdue), which adjusts the counters too.
+"""
+
+import itertools
+import json
+import math
+import os
+import threading
+import time
+import weakref
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def metrics_settings():
+    return {
+        'ENABLED': True,
+        'AUTH_TOKEN': None,
+        'MULTIPROCESS_DIR': None,
+        'FLUSH_INTERVAL': 5,
+        'BUCKETS': DEFAULT_BUCKETS,
+        **getattr(settings, 'METRICS', {}),
+    }
+
+
+class Counter:
+
+    kind = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = (self.name, tuple(str(labels[name]) for name in self.labelnames))
+        shard = self.registry.shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+
+class Histogram(Counter):
+    """Histogram stored as [count per bucket..., +Inf count, sum]"""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=None):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets or metrics_settings()['BUCKETS']))
+
+    def observe(self, value, **labels):
+        key = (self.name, tuple(str(labels[name]) for name in self.labelnames))
+        shard = self.registry.shard()
+        series = shard.get(key)
+        if series is None:
+            series = shard[key] = [0] * (len(self.buckets) + 2)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            index = len(self.buckets)
+        series[index] += 1
+        series[-1] += value
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+
+class ShardOwner:
+    """Held in a thread's locals; its collection marks the thread's exit"""
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        # Reentrant: a shard can be retired by garbage collection while the lock is held
+        self._lock = threading.RLock()
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            # Preloaded workers must not report the master's values as their own
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._local = threading.local()
+        self._shards = {}
+        self._retired = {}
+        self._shard_ids = itertools.count()
+        self._last_flush = time.monotonic()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=None):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            shard_id = next(self._shard_ids)
+            with self._lock:
+                self._shards[shard_id] = values
+            # The thread-local owner goes away with the thread
+            owner = self._local.owner = ShardOwner()
+            weakref.finalize(owner, self._retire, shard_id)
+            return values
+
+    def _retire(self, shard_id):
+        """Fold an exited thread's shard into the retired values"""
+        with self._lock:
+            values = self._shards.pop(shard_id, None)
+            if values is None:
+                return
+            for key, value in values.items():
+                self._retired[key] = self.metrics[key[0]].merge(self._retired.get(key), value)
+
+    def snapshot(self):
+        """Merge every thread's shard into {(name, labels): value}"""
+        merged = {}
+        with self._lock:
+            shards = [self._retired, *self._shards.values()]
+        for shard in shards:
+            for key, value in shard.copy().items():
+                merged[key] = self.metrics[key[0]].merge(merged.get(key), value)
+        return merged
+
+    def snapshot_path(self, directory, pid=None):
+        return Path(directory) / f'metrics-{pid or os.getpid()}.json'
+
+    def flush(self, directory):
+        path = self.snapshot_path(directory)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        rows = [[name, list(labels), value] for (name, labels), value in self.snapshot().items()]
+        with open(tmp, 'w') as output:
+            json.dump(rows, output)
+        os.replace(tmp, path)
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        config = metrics_settings()
+        directory = config['MULTIPROCESS_DIR']
+        if directory and time.monotonic() - self._last_flush >= config['FLUSH_INTERVAL']:
+            self.flush(directory)
+
+    def collect(self):
+        """Values of this process, or of every worker in multiprocess mode"""
+        directory = metrics_settings()['MULTIPROCESS_DIR']
+        if not directory:
+            return self.snapshot()
+        self.flush(directory)
+        merged = {}
+        for path in Path(directory).glob('metrics-*.json'):
+            try:
+                rows = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in rows:
+                if name not in self.metrics:
+                    continue
+                key = (name, tuple(labels))
+                merged[key] = self.metrics[name].merge(merged.get(key), value)
+        return merged
+
+    def render(self, gauges=None):
+        """Prometheus text exposition of all metrics plus ``gauges``"""
+        values = self.collect()
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            series = sorted((labels, value) for (name, labels), value in values.items() if name == metric.name)
+            for labels, value in series:
+                pairs = list(zip(metric.labelnames, labels))
+                if metric.kind == 'counter':
+                    lines.append(f'{metric.name}{format_labels(pairs)} {format_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (math.inf,), value):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else format_value(bound)
+                    lines.append(f'{metric.name}_bucket{format_labels(pairs + [("le", le)])} {cumulative}')
+                lines.append(f'{metric.name}_sum{format_labels(pairs)} {format_value(value[-1])}')
+                lines.append(f'{metric.name}_count{format_labels(pairs)} {cumulative}')
+        for name, (documentation, value) in (gauges or {}).items():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (
+        name + '="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    'bookloan_http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'status'),
+)
+LATENCY = registry.histogram(
+    'bookloan_http_request_duration_seconds', 'HTTP request latency by route', ('route',),
+)
+DB_QUERIES = registry.counter(
+    'bookloan_db_queries_total', 'Database queries run while serving each route', ('route',),
+)
+CACHE_REQUESTS = registry.counter(
+    'bookloan_cache_requests_total', 'Cache lookups by tier and result', ('tier', 'result'),
+)
+
+
+def circulation_gauges():
+    from core.models import CirculationCounter
+
+    counters = CirculationCounter.as_dict()
+    return {
+        'bookloan_active_loans': ('Loans currently out', counters.get(CirculationCounter.ACTIVE_LOANS, 0)),
+        'bookloan_overdue_loans': ('Loans past their due date', counters.get(CirculationCounter.OVERDUE_LOANS, 0)),
+        'bookloan_zero_availability_books': (
+            'Books with no copy available', counters.get(CirculationCounter.ZERO_AVAILABILITY_BOOKS, 0),
+        ),
+    }
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, optionally protected by a bearer token"""
+    token = metrics_settings()['AUTH_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(circulation_gauges()), content_type=CONTENT_TYPE)
@@ -0,0 +1,205 @@
+"""
+Project-wide middleware for BookLoan
+"""
+
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from . import compression, metrics
+from .db_routers import is_pinned, replica_aliases, replica_reads
+
+logger = logging.getLogger('bookloan.performance')
+
+
+def pool_stats(alias='default'):
+    """Return psycopg pool statistics for a database alias, or {} without a pool"""
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is None:
+        return {}
+    stats = pool.get_stats()
+    return {
+        'size': stats.get('pool_size', 0),
+        'available': stats.get('pool_available', 0),
+        'waiting': stats.get('requests_waiting', 0),
+    }
+
+
+class QueryCounter:
+    """Execute wrapper counting queries and their total duration"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def count_queries(counter):
+    """Install ``counter`` as an execute wrapper on every database connection"""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(counter))
+    return stack
+
+
+class PerformanceMiddleware:
+    """
+    Log request duration, query count and database connection usage
+
+    Enabled by ``API_LOGGING['LOG_PERFORMANCE']``. The timings are also
+    returned in a ``Server-Timing`` header so they show up in browser tools.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'API_LOGGING', {}).get('LOG_PERFORMANCE', False)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        reused = connections['default'].connection is not None
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with count_queries(counter):
+            response = self.get_response(request)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        pool = pool_stats()
+        response['Server-Timing'] = (
+            f'app;dur={elapsed:.1f}, db;dur={counter.duration * 1000:.1f};desc="{counter.count} queries"'
+        )
+        logger.info(
+            '%s %s %s %.1fms queries=%d db=%.1fms conn=%s%s',
+            request.method,
+            request.path,
+            response.status_code,
+            elapsed,
+            counter.count,
+            counter.duration * 1000,
+            'reused' if reused else 'new',
+            ''.join(f' pool_{key}={value}' for key, value in pool.items()),
+        )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Record request counts, latency and query counts per route
+
+    Routes are labelled with the URL name (``api:book-detail``), or the pattern for
+    unnamed routes, never the request path, so the number of series stays bounded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = metrics.metrics_settings()['ENABLED']
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with count_queries(counter):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        route = (match.view_name or match.route) if match is not None else 'unmatched'
+        metrics.REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+        metrics.LATENCY.observe(elapsed, route=route)
+        metrics.DB_QUERIES.inc(counter.count, route=route)
+        metrics.registry.maybe_flush()
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Compress large JSON responses with brotli or gzip
+
+    Only responses of ``COMPRESSION['CONTENT_TYPES']`` larger than
+    ``COMPRESSION['MIN_SIZE']`` are compressed; small payloads are not worth
+    the CPU and compressing HTML would expose CSRF tokens to BREACH.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = compression.compression_settings()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self.config['ENABLED'] or response.streaming or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in self.config['CONTENT_TYPES']:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.config['MIN_SIZE']:
+            return response
+        encoding = compression.choose_encoding(
+            request.headers.get('Accept-Encoding'), compression.available_encodings(),
+        )
+        if encoding is None:
+            return response
+        compressed = compression.compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        if response.has_header('ETag') and not response['ETag'].startswith('W/'):
+            response['ETag'] = 'W/' + response['ETag']
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve safe-method requests from read replicas
+
+    Clients that wrote recently carry a cookie that keeps them on the primary
+    for ``DATABASE_REPLICA_LAG`` seconds, so they always read their own writes.
+    """
+
+    cookie_name = 'bookloan_primary'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        use_replicas = (
+            replica_aliases()
+            and request.method in self.safe_methods
+            and self.cookie_name not in request.COOKIES
+        )
+        if not use_replicas:
+            response = self.get_response(request)
+            # Views that only read (e.g. /api/batch/) mark the request read_only
+            wrote = request.method not in self.safe_methods and not getattr(request, 'read_only', False)
+        else:
+            with replica_reads():
+                response = self.get_response(request)
+                wrote = is_pinned()
+
+        if wrote and replica_aliases():
+            response.set_cookie(
+                self.cookie_name, '1',
+                max_age=getattr(settings, 'DATABASE_REPLICA_LAG', 5),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
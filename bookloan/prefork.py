@@ -0,0 +1,50 @@
+"""
+Preloading and forking support for gunicorn
+
+With ``preload_app`` the master imports the project once and workers are
+forked from it, so they start without importing anything and share the
+imported code pages. ``warm_up()`` runs in the master before the first
+fork; ``after_fork()`` runs in every worker.
+"""
+
+import gc
+
+from django.db import connections
+
+
+def warm_up():
+    """Import everything the first request would, then prepare to fork"""
+    from django.urls import get_resolver
+    from rest_framework.settings import api_settings
+
+    # Resolving the URLconf imports every view, serializer and filter module
+    get_resolver().url_patterns
+    get_resolver()._populate()
+    for setting in (
+        'DEFAULT_RENDERER_CLASSES',
+        'DEFAULT_PARSER_CLASSES',
+        'DEFAULT_AUTHENTICATION_CLASSES',
+        'DEFAULT_PERMISSION_CLASSES',
+        'DEFAULT_THROTTLE_CLASSES',
+        'DEFAULT_PAGINATION_CLASS',
+        'DEFAULT_FILTER_BACKENDS',
+    ):
+        getattr(api_settings, setting)
+
+    # Workers must never share the master's sockets
+    connections.close_all()
+
+    # Move preloaded objects out of the collector's generations so that
+    # collections in workers do not touch (and copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+
+def after_fork():
+    """Drop state inherited from the master"""
+    # Connections were closed before forking; clear any reference left behind
+    for connection in connections.all(initialized_only=True):
+        connection.connection = None
+    # Caches reconnect lazily; redis-py pools detect the new pid on their own
+    from django.core.cache import caches
+    caches.close_all()
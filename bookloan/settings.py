@@ -1,7 +1,7 @@
 from datetime import timedelta
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -29,17 +29,22 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'django_filters',
+    'rest_framework.authtoken',
     'django_extensions',
     'core',
     'library',
 ]
 
 MIDDLEWARE = [
+    'bookloan.middleware.MetricsMiddleware',
+    'bookloan.middleware.PerformanceMiddleware',
+    'bookloan.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bookloan.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,9 +81,180 @@ DATABASES = {
         'PASSWORD': config('DATABASE_PASSWORD', 'pass123'),
         'HOST': config('DATABASE_HOST', 'localhost'),
         'PORT': config('DATABASE_PORT', '5432'),
+        # Keep connections open between requests and check them before reuse
+        'CONN_MAX_AGE': config('DATABASE_CONN_MAX_AGE', 60, cast=int),
+        'CONN_HEALTH_CHECKS': config('DATABASE_CONN_HEALTH_CHECKS', True, cast=bool),
+        'OPTIONS': {},
     }
 }
 
+# Optional psycopg 3 connection pool (requires the ``pool`` extra: psycopg[pool]).
+# Django does not allow persistent connections together with a pool, so the
+# pool replaces CONN_MAX_AGE when enabled.
+DATABASE_POOL = config('DATABASE_POOL', False, cast=bool)
+
+if DATABASE_POOL:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': config('DATABASE_POOL_MIN_SIZE', 2, cast=int),
+        'max_size': config('DATABASE_POOL_MAX_SIZE', 10, cast=int),
+        'timeout': config('DATABASE_POOL_TIMEOUT', 10, cast=int),
+    }
+
+# Read replicas
+# Comma-separated replica hosts; each one gets a ``replica_<n>`` alias that
+# shares the primary's credentials. Safe-method requests read from replicas,
+# clients that just wrote stay on the primary for DATABASE_REPLICA_LAG seconds.
+
+DATABASE_REPLICA_LAG = config('DATABASE_REPLICA_LAG', 5, cast=int)
+DATABASE_REPLICA_ALIASES = []
+
+for index, host in enumerate(config('DATABASE_REPLICAS', '', cast=Csv())):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICA_ALIASES.append(alias)
+
+DATABASE_ROUTERS = ['bookloan.db_routers.PrimaryReplicaRouter']
+
+# Cache
+# Two tiers: a per-process LRU (L1) in front of a shared Redis cache (L2).
+# Set CACHE_BACKEND=locmem to fall back to Django's local memory cache in development.
+
+REDIS_URL = config('REDIS_URL', 'redis://localhost:6379/0')
+CACHE_BACKEND = config('CACHE_BACKEND', 'tiered')
+
+if CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bookloan-default',
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bookloan-shared',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'bookloan.cache.TieredCache',
+            'KEY_PREFIX': 'bookloan',
+            'OPTIONS': {
+                'L2_ALIAS': 'shared',
+                'L1_MAX_ENTRIES': config('CACHE_L1_MAX_ENTRIES', 1024, cast=int),
+                'L1_TIMEOUT': config('CACHE_L1_TIMEOUT', 5, cast=int),
+                'CHANNEL': 'bookloan:cache:invalidate',
+            },
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'bookloan',
+        },
+    }
+
+# Outbox worker (python manage.py run_worker)
+
+OUTBOX = {
+    'BATCH_SIZE': config('OUTBOX_BATCH_SIZE', 100, cast=int),
+    'MAX_ATTEMPTS': config('OUTBOX_MAX_ATTEMPTS', 8, cast=int),
+    'BACKOFF_BASE': 2,  # retry after 2, 4, 8... seconds
+    'BACKOFF_MAX': 300,
+    'LEASE': 60,  # seconds a claimed event is reserved for one worker
+}
+
+# Due-date reminders (python manage.py send_reminders)
+
+REMINDERS = {
+    'DAYS_AHEAD': config('REMINDERS_DAYS_AHEAD', 3, cast=int),
+    'SENDER': config('REMINDERS_SENDER', 'core.reminders.ConsoleSender'),
+    'FILE_PATH': BASE_DIR / 'reminders.log',
+    'SUBJECT': 'Your library loans',
+    'FROM_EMAIL': config('DEFAULT_FROM_EMAIL', 'library@localhost'),
+}
+
+# Overdue marking (python manage.py mark_overdue, daily)
+
+OVERDUE = {
+    'BATCH_SIZE': 1000,
+}
+
+# Loan archive (python manage.py archive_loans)
+
+LOAN_ARCHIVE = {
+    'CUTOFF_DAYS': config('LOAN_ARCHIVE_CUTOFF_DAYS', 365, cast=int),
+    'BATCH_SIZE': 1000,
+}
+
+# Availability snapshots (python manage.py snapshot_availability)
+
+AVAILABILITY_HISTORY = {
+    'SETTLE_SECONDS': 60,  # events of transactions still open this long after they started are missed
+}
+
+# Availability reconciliation (python manage.py reconcile_inventory)
+
+INVENTORY = {
+    'CHUNK_SIZE': 5000,  # drifted books fixed per transaction
+}
+
+# Changes feed for incremental sync (GET /api/changes/, see core/changes.py)
+# Run python manage.py compact_changes daily; tokens older than
+# RETENTION_DAYS are refused and those clients reload the full lists.
+
+CHANGES = {
+    'SETTLE_SECONDS': 5,  # longer-running write transactions could be missed by a sync
+    'PAGE_SIZE': 500,
+    'RETENTION_DAYS': 30,
+}
+
+# "Patrons also borrowed" neighbors (python manage.py build_recommendations)
+
+RECOMMENDATIONS = {
+    'TOP_K': config('RECOMMENDATIONS_TOP_K', 10, cast=int),
+    'MIN_SHARED_READERS': 2,
+    'MAX_HISTORY': 500,
+}
+
+# Admin changelists of large tables (see library/changelist.py)
+# Above ESTIMATE_THRESHOLD rows the count comes from planner statistics;
+# filter choices and date drill-down bounds are cached for CACHE_TIMEOUT.
+
+ADMIN_CHANGELIST = {
+    'ESTIMATE_THRESHOLD': config('ADMIN_ESTIMATE_THRESHOLD', 100_000, cast=int),
+    'CACHE_TIMEOUT': 600,
+}
+
+# Profiling of API views (see library/profiling.py)
+# Staff users can send an ``X-Profile: 1`` header to get a cProfile + SQL report.
+# PROFILING_SAMPLING=true samples stacks into flamegraph-compatible files.
+
+PROFILING = {
+    'ENABLED': config('PROFILING_ENABLED', True, cast=bool),
+    'HEADER': 'X-Profile',
+    'SAMPLING': config('PROFILING_SAMPLING', False, cast=bool),
+    'SAMPLE_INTERVAL': 0.005,
+    'SAMPLE_FILE': BASE_DIR / 'profiles' / 'stacks-{pid}.txt',
+    'FLUSH_INTERVAL': 30,
+}
+
+# Prometheus metrics
+# /metrics serves request, latency, query and cache metrics plus circulation
+# gauges. Under gunicorn point METRICS_MULTIPROCESS_DIR at a directory shared
+# by the workers (cleared on deploy) so a scrape sums every worker.
+
+METRICS = {
+    'ENABLED': config('METRICS_ENABLED', True, cast=bool),
+    'AUTH_TOKEN': config('METRICS_AUTH_TOKEN', None),
+    'MULTIPROCESS_DIR': config('METRICS_MULTIPROCESS_DIR', None),
+    'FLUSH_INTERVAL': 5,
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -119,7 +295,49 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# collectstatic writes hashed names plus .br/.gz variants (bookloan.compression)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'bookloan.compression.CompressedManifestStaticFilesStorage'},
+}
+
+# Serve STATIC_ROOT from Django (precompressed, far-future cached) outside
+# DEBUG, for deployments without a front proxy serving static files
+SERVE_STATIC = config('SERVE_STATIC', False, cast=bool)
+
+# Response compression for API JSON; brotli needs `pip install bookloan[compression]`
+COMPRESSION = {
+    'ENABLED': config('COMPRESSION_ENABLED', True, cast=bool),
+    'MIN_SIZE': 1024,
+    'CONTENT_TYPES': ('application/json',),
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Logging
+# https://docs.djangoproject.com/en/5.2/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'bookloan': {
+            'handlers': ['console'],
+            'level': config('LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+# REST framework and API settings (authentication, permissions, pagination,
+# throttle tiers). Worker-only changes live in settings_api_worker.
+from .api import *  # noqa: E402,F401,F403
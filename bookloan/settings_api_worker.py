@@ -0,0 +1,62 @@
+"""
+"api-worker" settings profile for processes that only serve the JSON API
+
+    DJANGO_SETTINGS_MODULE=bookloan.settings_api_worker \
+        gunicorn bookloan.wsgi -c bookloan/gunicorn_api_worker.py
+
+Starts from the full settings and drops what only the browser UI needs:
+the admin, sessions, messages, staticfiles and django_extensions apps, their
+middleware, the browsable API and session authentication. The URLconf
+(bookloan.urls_api) routes /api/ and /metrics only and imports no debug
+tooling, so cold starts import and initialize noticeably less.
+"""
+
+from decouple import Csv, config
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK, TEMPLATES
+
+DEBUG = config('DEBUG', False, cast=bool)
+
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', 'localhost,127.0.0.1', cast=Csv())
+
+UI_APPS = {
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'django_extensions',
+}
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in UI_APPS]
+
+# Token-authenticated API: no sessions, so no CSRF, messages or session-based user
+UI_MIDDLEWARE = {
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+}
+
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in UI_MIDDLEWARE]
+
+ROOT_URLCONF = 'bookloan.urls_api'
+
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        'OPTIONS': {
+            'context_processors': [
+                processor for processor in TEMPLATES[0]['OPTIONS']['context_processors']
+                if not processor.startswith('django.contrib.messages')
+            ],
+        },
+    },
+]
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_AUTHENTICATION_CLASSES': ['library.authentication.CachedTokenAuthentication'],
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
@@ -0,0 +1,66 @@
+"""
+Settings for running the test suite without Postgres or Redis
+
+    python manage.py test --settings=bookloan.settings_test
+    pytest                       # pyproject.toml points pytest-django here
+    pytest -m scale              # also run the production-sized scale tests
+
+The database is in-memory SQLite. Durability is irrelevant for a database
+that disappears with the process, so the connection PRAGMAs trade it for
+speed: no fsync, journal and temp tables in memory, a larger page cache.
+``replica_0`` is a second connection mirroring it, so replica routing can be
+tested against a real connection; it is only routed to where a test lists it
+in DATABASE_REPLICA_ALIASES.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import API_LOGGING
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+        'TEST': {'NAME': ':memory:'},
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=MEMORY;'
+                'PRAGMA synchronous=OFF;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-262144;'  # 256 MiB
+            ),
+        },
+    },
+}
+DATABASES['replica_0'] = {
+    **DATABASES['default'],
+    'TEST': {'NAME': ':memory:', 'MIRROR': 'default'},
+}
+DATABASE_REPLICA_ALIASES = []
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bookloan-default',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bookloan-shared',
+    },
+}
+
+# Hashing test passwords with PBKDF2 dominates user-heavy tests
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+API_LOGGING = {**API_LOGGING, 'LOG_PERFORMANCE': False}
+
+METRICS = {'ENABLED': True, 'MULTIPROCESS_DIR': None}
+
+PROFILING = {'ENABLED': True, 'SAMPLING': False}
+
+# Tests tagged with django.test.tag('scale') seed production-sized data;
+# they only run when asked for (pytest -m scale, or manage.py test --tag scale)
+TEST_RUNNER = 'core.testing.ScaleAwareRunner'
@@ -1,10 +1,13 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
-from django.views.static import serve
 import os
+import re
+
+from .compression import serve_precompressed
+from .metrics import metrics_view
 
 # Admin View that serves Vue.js app
 class VueAdminView(TemplateView):
@@ -20,6 +23,9 @@ urlpatterns = [
     
     # API Routes
     path('api/', include('library.urls')),
+
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
     
     # Vue.js Admin Interface (replaces Django admin)
     path('admin/', VueAdminView.as_view(), name='vue_admin'),
@@ -28,20 +34,27 @@ urlpatterns = [
     path('', TemplateView.as_view(template_name='frontend/index.html'), name='frontend_home'),
 ]
 
-# Serve static files during development
+# Serve static files during development, or when SERVE_STATIC is on;
+# precompressed .br/.gz variants from collectstatic are used when accepted
 if settings.DEBUG:
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     
     # Serve Vue.js admin files during development
     admin_static_path = os.path.join(settings.BASE_DIR, 'static', 'admin')
     if os.path.exists(admin_static_path):
         urlpatterns += [
-            path('static/admin/<path:path>', serve, {
+            path('static/admin/<path:path>', serve_precompressed, {
                 'document_root': admin_static_path,
             }),
         ]
 
+if settings.DEBUG or getattr(settings, 'SERVE_STATIC', False):
+    urlpatterns += [
+        re_path(rf'^{re.escape(settings.STATIC_URL.lstrip("/"))}(?P<path>.*)$', serve_precompressed, {
+            'document_root': settings.STATIC_ROOT,
+        }),
+    ]
+
 # Add debug toolbar if installed
 if settings.DEBUG:
     try:
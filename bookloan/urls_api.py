@@ -0,0 +1,15 @@
+"""
+URLconf of the api-worker profile (bookloan.settings_api_worker)
+
+Only the JSON API and the metrics endpoint: no admin, Vue templates, static
+files or debug tooling.
+"""
+
+from django.urls import include, path
+
+from .metrics import metrics_view
+
+urlpatterns = [
+    path('api/', include('library.urls')),
+    path('metrics', metrics_view, name='metrics'),
+]
@@ -0,0 +1,18 @@
+"""
+pytest hooks shared by every app
+
+Tests tagged with ``django.test.tag('scale')`` get the ``scale`` marker, so
+the same tag drives both runners: ``pytest -m scale`` here and
+``manage.py test --tag scale`` with Django's runner.
+"""
+
+import pytest
+
+from core.testing import SCALE_TAG
+
+
+def pytest_collection_modifyitems(items):
+    for item in items:
+        tags = set(getattr(getattr(item, 'cls', None), 'tags', ())) | set(getattr(item.obj, 'tags', ()))
+        if SCALE_TAG in tags:
+            item.add_marker(pytest.mark.scale)
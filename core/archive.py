@@ -0,0 +1,91 @@
+"""
+Archiving of closed loans
+
+Returned loans older than a cutoff are moved from BookLoan to
+BookLoanArchive in small batches, so the live table - and every status,
+due_date and created_at query against it - only holds recent loans.
+
+On PostgreSQL the archive is range-partitioned by loan_date; yearly
+partitions are created on demand before rows are moved into them.
+
+Archiving is not deletion: the moved rows are removed without the
+per-row delete signals, so they leave no tombstones in the changes feed
+(core.changes) and clients that synced them keep them as returned loans.
+Nothing else listens for the deletion of a returned loan.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import BookLoan, BookLoanArchive
+
+ARCHIVED_FIELDS = [
+    'id', 'user_id', 'book_id', 'copy_id', 'branch_id', 'loan_date', 'due_date', 'return_date',
+    'status', 'notes', 'fine_amount', 'created_at', 'updated_at',
+]
+
+
+def archive_settings():
+    return {
+        'CUTOFF_DAYS': 365,
+        'BATCH_SIZE': 1000,
+        **getattr(settings, 'LOAN_ARCHIVE', {}),
+    }
+
+
+def partition_name(year):
+    return f'{BookLoanArchive._meta.db_table}_{year}'
+
+
+def ensure_partitions(years):
+    """Create yearly archive partitions on PostgreSQL (no-op elsewhere)"""
+    if connection.vendor != 'postgresql':
+        return
+    table = BookLoanArchive._meta.db_table
+    with connection.cursor() as cursor:
+        for year in sorted(set(years)):
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {partition_name(year)} PARTITION OF {table} '
+                f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+            )
+
+
+def archivable_loans(cutoff):
+    """Returned loans closed before ``cutoff``"""
+    return BookLoan.objects.filter(status='returned', return_date__lt=cutoff)
+
+
+def archive_batch(cutoff, batch_size):
+    """Move one batch of closed loans to the archive; returns rows moved"""
+    with transaction.atomic():
+        candidates = archivable_loans(cutoff).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        rows = list(candidates.values(*ARCHIVED_FIELDS)[:batch_size])
+        if not rows:
+            return 0
+        ensure_partitions(row['loan_date'].year for row in rows)
+        BookLoanArchive.objects.bulk_create(
+            [BookLoanArchive(**row) for row in rows],
+            ignore_conflicts=True,
+        )
+        # One DELETE, without fetching the rows back for post_delete
+        moved = BookLoan.objects.filter(id__in=[row['id'] for row in rows])
+        moved._raw_delete(moved.db)
+    return len(rows)
+
+
+def archive_closed_loans(cutoff=None, batch_size=None):
+    """Archive every closed loan older than the cutoff, yielding batch sizes"""
+    config = archive_settings()
+    if cutoff is None:
+        cutoff = timezone.now().date() - timedelta(days=config['CUTOFF_DAYS'])
+    batch_size = batch_size or config['BATCH_SIZE']
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        if not moved:
+            break
+        yield moved
@@ -0,0 +1,137 @@
+"""
+Changes feed for incremental sync
+
+Every save and delete of a Book or BookLoan appends a ChangeRecord
+(core.signals); its auto-increment id is the feed's sequence, and its
+``changed_at`` is the row's ``updated_at``. A client keeps the token of
+its last sync and asks for what changed after it (``GET /api/changes/``);
+for each changed object only the latest record counts, so the response
+holds each row once, or a tombstone if it was deleted. Loans moved to the
+archive (core.archive) are not reported: they did not change.
+
+Sequence numbers are handed out when records are inserted, not when
+their transactions commit, so a record can become visible after one
+with a higher id. The feed therefore only serves records older than
+``CHANGES['SETTLE_SECONDS']``: writes outliving that window could be
+missed by a client that synced in between.
+
+``compact_changes()`` (``manage.py compact_changes``) deletes records
+superseded by a later one for the same object, and tombstones older
+than ``RETENTION_DAYS``. A token older than that may have missed a
+deletion, so it is refused and the client has to resync from the lists.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Book, BookLoan, ChangeRecord
+
+MODELS = {ChangeRecord.BOOK: Book, ChangeRecord.LOAN: BookLoan}
+
+
+def changes_settings():
+    return {
+        'SETTLE_SECONDS': 5,
+        'PAGE_SIZE': 500,
+        'RETENTION_DAYS': 30,
+        **getattr(settings, 'CHANGES', {}),
+    }
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class ExpiredToken(InvalidToken):
+    pass
+
+
+def make_token(sequence, issued=None):
+    """Opaque sync token: the last sequence seen and when the token was issued"""
+    return f'{sequence}.{int(issued if issued is not None else time.time())}'
+
+
+def parse_token(token):
+    """The sequence of ``token``; raises InvalidToken or ExpiredToken"""
+    try:
+        sequence, issued = (int(part) for part in token.split('.'))
+    except ValueError:
+        raise InvalidToken(f'Malformed sync token: {token!r}')
+    if sequence < 0:
+        raise InvalidToken(f'Malformed sync token: {token!r}')
+    if issued < time.time() - changes_settings()['RETENTION_DAYS'] * 24 * 60 * 60:
+        raise ExpiredToken('Sync token is older than the change retention; resync from the full lists')
+    return sequence
+
+
+def record(model, object_id, deleted=False, changed_at=None):
+    """Append a change of one object"""
+    return ChangeRecord.objects.create(
+        model=model, object_id=object_id, deleted=deleted, changed_at=changed_at or timezone.now(),
+    )
+
+
+def record_many(model, object_ids, changed_at=None):
+    """Append changes of several objects written without save() (bulk_update, update())"""
+    changed_at = changed_at or timezone.now()
+    ChangeRecord.objects.bulk_create(
+        ChangeRecord(model=model, object_id=object_id, changed_at=changed_at) for object_id in object_ids
+    )
+
+
+def settled_sequence():
+    """The sequence a client holding everything served so far can resume from"""
+    cutoff = timezone.now() - timedelta(seconds=changes_settings()['SETTLE_SECONDS'])
+    unsettled = ChangeRecord.objects.filter(changed_at__gte=cutoff).order_by('id').values_list('id', flat=True).first()
+    if unsettled is not None:
+        return unsettled - 1
+    return ChangeRecord.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def read_changes(since, limit=None):
+    """
+    Changes after sequence ``since``
+
+    Returns ``(changed, deleted, last_sequence, more)``: ``changed`` and
+    ``deleted`` map each model key to object ids, ``last_sequence`` is the
+    sequence to resume from and ``more`` whether a full page was read.
+    """
+    limit = limit or changes_settings()['PAGE_SIZE']
+    cutoff = timezone.now() - timedelta(seconds=changes_settings()['SETTLE_SECONDS'])
+    records = list(
+        ChangeRecord.objects.filter(id__gt=since).order_by('id')
+        .values_list('id', 'model', 'object_id', 'deleted', 'changed_at')[:limit]
+    )
+    latest = {}
+    last_sequence = since
+    for sequence, model, object_id, deleted, changed_at in records:
+        if changed_at >= cutoff:
+            # Too recent: lower ids may still be committing, so stop and serve the rest next time
+            return *split(latest), last_sequence, False
+        latest[model, object_id] = deleted
+        last_sequence = sequence
+    return *split(latest), last_sequence, len(records) == limit
+
+
+def split(latest):
+    changed = {model: [] for model in MODELS}
+    deleted = {model: [] for model in MODELS}
+    for (model, object_id), is_deleted in latest.items():
+        (deleted if is_deleted else changed)[model].append(object_id)
+    return changed, deleted
+
+
+def compact_changes(now=None):
+    """Delete superseded records and expired tombstones; returns the number deleted"""
+    now = now or timezone.now()
+    superseded = ChangeRecord.objects.filter(Exists(ChangeRecord.objects.filter(
+        model=OuterRef('model'), object_id=OuterRef('object_id'), id__gt=OuterRef('id'),
+    )))
+    removed, _ = superseded.delete()
+    horizon = now - timedelta(days=changes_settings()['RETENTION_DAYS'])
+    expired, _ = ChangeRecord.objects.filter(deleted=True, changed_at__lt=horizon).delete()
+    return removed + expired
@@ -0,0 +1,261 @@
+"""
+Fixture factories for production-sized datasets
+
+``seed_library()`` creates users, books and loans with realistic shapes:
+
+* book popularity follows a Zipf-like curve, so a few titles take most
+  loans and most titles are rarely borrowed;
+* most loans are returned, a minority are out, overdue or pending;
+* returned loans spread over the last three years, open loans are recent,
+  overdue loans are past their due date;
+* every book has enough copies for its open loans, and
+  ``available_copies`` matches them.
+
+Rows are generated column by column (one ``random.choices`` call per
+column) and written in large ``executemany`` batches of the INSERT that
+``bulk_create`` would emit. ``bulk_create`` itself compiles every value
+through the ORM, roughly 100µs per row, which makes a million loans take
+minutes; values here are adapted once with the backend's adapters, so a
+million loans take seconds. Like ``bulk_create`` this bypasses ``save()``:
+no loan events are recorded, and the circulation counters are recounted
+once at the end.
+"""
+
+import random
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate, islice
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Book, BookLoan, CirculationCounter
+
+# Share of loans per status
+STATUS_WEIGHTS = {'returned': 80, 'active': 14, 'overdue': 4, 'pending': 2}
+
+OPEN_STATUSES = ('active', 'overdue')
+
+# Days between loan_date and today, per status
+LOAN_AGE_DAYS = {
+    'returned': (15, 3 * 365),
+    'active': (0, 13),
+    'overdue': (15, 90),
+    'pending': (0, 2),
+}
+
+LOAN_PERIOD = 14
+
+ZIPF_EXPONENT = 0.9
+
+TITLE_WORDS = (
+    'Shadow', 'River', 'Garden', 'Empire', 'Winter', 'Glass', 'Silent', 'Iron', 'Summer',
+    'Lost', 'Hidden', 'Broken', 'Golden', 'Night', 'Ocean', 'Stone', 'Paper', 'Crimson',
+)
+SURNAMES = (
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Costa', 'Almeida',
+    'Smith', 'Johnson', 'Brown', 'Garcia', 'Martin', 'Tanaka', 'Kim', 'Novak',
+)
+
+
+def zipf_cum_weights(count, exponent=ZIPF_EXPONENT):
+    """Cumulative weights of ranks 1..count under a Zipf-like popularity curve"""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+# (name, CREATE INDEX statement) of a table's plain secondary indexes
+INDEX_DEFINITIONS_SQL = {
+    'sqlite': "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL",
+    'postgresql': (
+        'SELECT indexname, indexdef FROM pg_indexes i WHERE tablename = %s '
+        'AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)'
+    ),
+}
+
+
+@contextmanager
+def deferred_indexes(model):
+    """
+    Drop the secondary indexes of ``model`` and rebuild them on exit
+
+    Building an index once over loaded rows is several times faster than
+    updating it on every insert. Indexes backing constraints are kept.
+    """
+    sql = INDEX_DEFINITIONS_SQL.get(connection.vendor)
+    if sql is None:
+        yield
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [model._meta.db_table])
+        indexes = cursor.fetchall()
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {quote(name)}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for _, definition in indexes:
+                cursor.execute(definition)
+
+
+def insert_rows(model, fields, rows, batch_size=20000):
+    """
+    INSERT already adapted ``rows`` of ``fields`` with executemany
+
+    Returns the primary keys of the new rows, in insertion order.
+    """
+    opts = model._meta
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(opts.get_field(name).column) for name in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    sql = f'INSERT INTO {quote(opts.db_table)} ({columns}) VALUES ({placeholders})'
+    last_pk = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    rows = iter(rows)
+    with connection.cursor() as cursor:
+        while batch := list(islice(rows, batch_size)):
+            cursor.executemany(sql, batch)
+    return list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True))
+
+
+def seed_users(count):
+    """Create readers; returns their ids"""
+    start = User.objects.count()
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    return insert_rows(
+        User,
+        ['username', 'email', 'password', 'first_name', 'last_name',
+         'is_superuser', 'is_staff', 'is_active', 'date_joined'],
+        (
+            (f'reader{start + i}', f'reader{start + i}@example.com', '!', '', '', False, False, True, now)
+            for i in range(count)
+        ),
+    )
+
+
+def seed_books(copies_out, rng):
+    """
+    Create one book per entry of ``copies_out``; returns their ids
+
+    ``copies_out[i]`` is the number of open loans the i-th book will get,
+    so its total and available copies can be made consistent with them.
+    """
+    start = Book.objects.count()
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = []
+    for i, out in enumerate(copies_out):
+        number = start + i
+        total = out + rng.randint(0 if out else 1, 3)
+        rows.append((
+            f'The {TITLE_WORDS[number % len(TITLE_WORDS)]} {TITLE_WORDS[number // 7 % len(TITLE_WORDS)]} {number}',
+            f'{SURNAMES[number % len(SURNAMES)]} {number % 997}',
+            f'{9780000000000 + number}',
+            total,
+            total - out,
+            now,
+            now,
+        ))
+    return insert_rows(
+        Book, ['title', 'author', 'isbn', 'total_copies', 'available_copies', 'created_at', 'updated_at'], rows,
+    )
+
+
+def loan_columns(count, books, users, rng):
+    """
+    Generate the book index, user index and status of ``count`` loans
+
+    A reader has at most one open (pending, active, overdue) loan of a
+    book; colliding rows move to the next user, which keeps the popularity
+    curve intact. Returned loans never collide.
+    """
+    book_indexes = rng.choices(range(books), cum_weights=zipf_cum_weights(books), k=count)
+    statuses = rng.choices(list(STATUS_WEIGHTS), weights=list(STATUS_WEIGHTS.values()), k=count)
+    user_indexes = rng.choices(range(users), k=count)
+
+    seen = set()
+    for i, (book, status) in enumerate(zip(book_indexes, statuses)):
+        if status not in BookLoan.OPEN_STATUSES:
+            continue
+        user = user_indexes[i]
+        for _ in range(users):
+            if (user, book) not in seen:
+                break
+            user = (user + 1) % users
+        else:
+            raise ValueError(f'Not enough users for {count} open loans; pass more users')
+        seen.add((user, book))
+        user_indexes[i] = user
+    return book_indexes, user_indexes, statuses
+
+
+def seed_loans(book_ids, user_ids, book_indexes, user_indexes, statuses, today, rng):
+    """Create loans from generated columns; returns the number created"""
+    ops = connection.ops
+    fine_field = BookLoan._meta.get_field('fine_amount')
+
+    def adapt_fine(value):
+        return ops.adapt_decimalfield_value(Decimal(value), fine_field.max_digits, fine_field.decimal_places)
+
+    no_fine = adapt_fine('0.00')
+    now = ops.adapt_datetimefield_value(timezone.now())
+    # Adapting each distinct date once is much cheaper than once per row
+    dates = {
+        offset: ops.adapt_datefield_value(today + timedelta(days=offset))
+        for offset in range(-LOAN_AGE_DAYS['returned'][1], 3 * LOAN_PERIOD)
+    }
+
+    random = rng.random
+
+    def rows():
+        for book, user, status in zip(book_indexes, user_indexes, statuses):
+            low, high = LOAN_AGE_DAYS[status]
+            loaned = -(low + int(random() * (high - low + 1)))
+            due = loaned + LOAN_PERIOD
+            returned = None
+            fine = no_fine
+            if status == 'returned':
+                returned = dates[loaned + 1 + int(random() * (LOAN_PERIOD + 7))]
+            elif status == 'overdue':
+                fine = adapt_fine(f'{-due * 0.5:.2f}')
+            elif status == 'active' and random() < 0.2:
+                due += LOAN_PERIOD  # renewed
+            yield (
+                user_ids[user], book_ids[book], dates[loaned], dates[due], returned,
+                status, '', fine, now, now,
+            )
+
+    with deferred_indexes(BookLoan):
+        return len(insert_rows(
+            BookLoan,
+            ['user', 'book', 'loan_date', 'due_date', 'return_date',
+             'status', 'notes', 'fine_amount', 'created_at', 'updated_at'],
+            rows(),
+        ))
+
+
+def seed_library(loans=1_000_000, books=None, users=None, today=None, seed=0):
+    """
+    Seed users, books and ``loans`` loans; returns a summary dict
+
+    By default there is one book per 20 loans and one user per 10 loans
+    (at least 1000, so the most popular books of small datasets can still
+    get a distinct reader per loan).
+    """
+    rng = random.Random(seed)
+    books = books or max(loans // 20, 10)
+    users = users or max(loans // 10, 1000)
+    today = today or timezone.now().date()
+
+    book_indexes, user_indexes, statuses = loan_columns(loans, books, users, rng)
+    copies_out = Counter(book for book, status in zip(book_indexes, statuses) if status in OPEN_STATUSES)
+
+    with transaction.atomic():
+        user_ids = seed_users(users)
+        book_ids = seed_books([copies_out[book] for book in range(books)], rng)
+        created = seed_loans(book_ids, user_ids, book_indexes, user_indexes, statuses, today, rng)
+        counters = CirculationCounter.recount()
+
+    return {'users': users, 'books': books, 'loans': created, **counters}
@@ -0,0 +1,53 @@
+"""
+Next-available-date forecast per book
+
+A book with no copies on the shelf comes back when the first of its open
+loans (active or overdue) is due. That date is the head of the book's
+due-date queue, read from the ``(book, status, due_date)`` index: one
+index seek per open status, never a scan of the book's loan history.
+
+Books with copies available forecast ``None`` (available now), as do
+books with no open loans to wait for. The date can be in the past when
+the next copy is overdue.
+"""
+
+from django.db.models import Case, DateField, Min, OuterRef, Subquery, Value, When
+
+from .models import BookLoan
+
+OPEN_STATUSES = ('active', 'overdue')
+
+
+def next_due_date():
+    """Earliest open-loan due date of the outer book, for ``annotate()``"""
+    return Subquery(
+        BookLoan.objects.filter(book=OuterRef('pk'), status__in=OPEN_STATUSES)
+        .order_by().values('book').annotate(next_due=Min('due_date')).values('next_due'),
+        output_field=DateField(),
+    )
+
+
+def with_forecast(queryset):
+    """
+    Annotate a Book queryset with ``next_available_date``
+
+    The forecast is part of the books' own SELECT, so a page of books costs
+    no extra query; the due-date lookup only runs for books with no copies.
+    """
+    return queryset.annotate(next_available_date=Case(
+        When(available_copies__gt=0, then=Value(None, output_field=DateField())),
+        default=next_due_date(),
+        output_field=DateField(),
+    ))
+
+
+def next_available_dates(books):
+    """Forecast for already loaded books, in one query; returns {book_id: date or None}"""
+    waiting = [book.pk for book in books if book.available_copies <= 0]
+    forecasts = dict.fromkeys((book.pk for book in books), None)
+    if waiting:
+        forecasts.update(
+            BookLoan.objects.filter(book_id__in=waiting, status__in=OPEN_STATUSES)
+            .order_by().values('book').annotate(next_due=Min('due_date')).values_list('book', 'next_due')
+        )
+    return forecasts
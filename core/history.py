@@ -0,0 +1,100 @@
+"""
+Point-in-time availability from the loan event log
+
+The number of copies of a book out at time T is the latest snapshot taken
+at or before T plus the copy deltas of the events recorded between that
+snapshot and T. ``take_snapshots()`` runs periodically (manage.py
+snapshot_availability), so each query replays a bounded number of events.
+
+An event's ``occurred_at`` is set when it is inserted, not when its
+transaction commits, so a snapshot taken at "now" could miss an event
+stamped just before it that was still uncommitted, and that event would
+then be skipped by every later replay. Snapshots are therefore taken
+``AVAILABILITY_HISTORY['SETTLE_SECONDS']`` in the past, once the events up
+to that point have committed.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Book, BookAvailabilitySnapshot, LoanEvent
+
+COPIES_OUT_DELTA = Case(
+    *[When(kind=kind, then=Value(delta)) for kind, delta in LoanEvent.COPIES_OUT_DELTA.items()],
+    default=Value(0),
+    output_field=IntegerField(),
+)
+
+
+def history_settings():
+    return {
+        'SETTLE_SECONDS': 60,
+        **getattr(settings, 'AVAILABILITY_HISTORY', {}),
+    }
+
+
+def copies_out_at(book_id, at):
+    """Return (copies_out, snapshot_taken_at, events_replayed) for a book at a time"""
+    snapshot = (
+        BookAvailabilitySnapshot.objects
+        .filter(book_id=book_id, taken_at__lte=at)
+        .order_by('-taken_at')
+        .values('taken_at', 'copies_out')
+        .first()
+    )
+    events = LoanEvent.objects.filter(book_id=book_id, occurred_at__lte=at)
+    if snapshot is not None:
+        events = events.filter(occurred_at__gt=snapshot['taken_at'])
+    replay = events.aggregate(delta=Coalesce(Sum(COPIES_OUT_DELTA), 0), count=Sum(Value(1)))
+    base = snapshot['copies_out'] if snapshot else 0
+    return (
+        base + replay['delta'],
+        snapshot['taken_at'] if snapshot else None,
+        replay['count'] or 0,
+    )
+
+
+def take_snapshots(at=None, batch_size=1000):
+    """Snapshot every book that had events since its last snapshot; returns the count"""
+    settled = timezone.now() - timedelta(seconds=history_settings()['SETTLE_SECONDS'])
+    at = min(at, settled) if at else settled
+    latest = BookAvailabilitySnapshot.objects.filter(
+        book=OuterRef('pk'), taken_at__lte=at,
+    ).order_by('-taken_at')
+    books = Book.objects.annotate(
+        snapshot_at=Subquery(latest.values('taken_at')[:1]),
+        snapshot_out=Subquery(latest.values('copies_out')[:1]),
+    )
+    events_since = LoanEvent.objects.filter(book=OuterRef('pk'), occurred_at__lte=at)
+    pending = books.annotate(
+        delta=Subquery(
+            events_since.filter(occurred_at__gt=OuterRef('snapshot_at'))
+            .values('book').annotate(total=Sum(COPIES_OUT_DELTA)).values('total')
+        ),
+        delta_from_start=Subquery(
+            events_since.values('book').annotate(total=Sum(COPIES_OUT_DELTA)).values('total')
+        ),
+    )
+
+    created = 0
+    snapshots = []
+    for book in pending.values('id', 'snapshot_at', 'snapshot_out', 'delta', 'delta_from_start').iterator():
+        if book['snapshot_at'] is None:
+            if book['delta_from_start'] is None:
+                continue
+            copies_out = book['delta_from_start']
+        else:
+            if book['delta'] is None:
+                continue
+            copies_out = book['snapshot_out'] + book['delta']
+        snapshots.append(BookAvailabilitySnapshot(book_id=book['id'], taken_at=at, copies_out=copies_out))
+        if len(snapshots) >= batch_size:
+            created += len(BookAvailabilitySnapshot.objects.bulk_create(snapshots, ignore_conflicts=True))
+            snapshots = []
+    if snapshots:
+        created += len(BookAvailabilitySnapshot.objects.bulk_create(snapshots, ignore_conflicts=True))
+    return created
@@ -0,0 +1,114 @@
+"""
+Reconciliation of book availability
+
+``available_copies`` is adjusted incrementally in several places (the
+outbox handler, desk returns, admin actions), so a missed or doubled
+adjustment leaves it out of step with the loans. The true value is
+``total_copies`` minus the book's open (active or overdue) loans.
+
+``reconcile_inventory()`` computes that for every book in one grouped
+query, streamed in id order, and compares it with the stored value chunk
+by chunk. Each chunk's drifted books are fixed in one short transaction
+that locks only those rows, re-reads them and leaves alone any book whose
+availability moved since the aggregate was read, or that has a loan
+status change still waiting in the outbox (the handler will adjust it,
+so fixing it now would count that change twice). Those books are
+reported as skipped and are picked up by the next run.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import changes
+from .models import Book, ChangeRecord, CirculationCounter, LoanEvent, OutboxEvent
+from .outbox import LOAN_STATUS_CHANGED
+
+
+def inventory_settings():
+    return {
+        'CHUNK_SIZE': 5000,
+        # Drifted books listed in the report
+        'REPORT_LIMIT': 50,
+        **getattr(settings, 'INVENTORY', {}),
+    }
+
+
+def expected_availability():
+    """(book_id, total_copies, available_copies, open_loans) of every book, by id"""
+    return (
+        Book.objects.order_by('id')
+        .values_list('id', 'total_copies', 'available_copies')
+        .annotate(open_loans=Count('bookloan', filter=Q(bookloan__status__in=LoanEvent.OUT_STATUSES)))
+        .iterator(chunk_size=inventory_settings()['CHUNK_SIZE'])
+    )
+
+
+def books_with_pending_changes(book_ids):
+    """Books among ``book_ids`` with a loan status change not yet handled"""
+    return set(
+        OutboxEvent.objects.filter(topic=LOAN_STATUS_CHANGED, status='pending', payload__book_id__in=book_ids)
+        .values_list('payload__book_id', flat=True)
+    )
+
+
+def fix_chunk(drifted, report, dry_run):
+    """Write the expected availability of ``drifted`` ({book_id: (seen, expected)})"""
+    with transaction.atomic():
+        # Locked in id order, so concurrent writers can't deadlock against us
+        current = (
+            Book.objects.select_for_update().filter(id__in=list(drifted))
+            .order_by('id').only('id', 'available_copies').in_bulk()
+        )
+        pending = books_with_pending_changes(list(drifted))
+        now = timezone.now()
+        books = []
+        for book_id, (seen, expected) in drifted.items():
+            book = current.get(book_id)
+            if book is None or book.available_copies != seen or book_id in pending:
+                report['skipped'] += 1
+                continue
+            book.available_copies = expected
+            book.updated_at = now
+            books.append(book)
+        if books and not dry_run:
+            Book.objects.bulk_update(books, ['available_copies', 'updated_at'])
+            changes.record_many(ChangeRecord.BOOK, [book.id for book in books], now)
+            # bulk_update bypasses Book.save(), which keeps this counter
+            zeroed = sum((book.available_copies == 0) - (drifted[book.id][0] == 0) for book in books)
+            if zeroed:
+                CirculationCounter.adjust(zero_availability_books=zeroed)
+        report['fixed'] += len(books)
+
+
+def reconcile_inventory(dry_run=False, chunk_size=None):
+    """
+    Set ``available_copies`` to ``total_copies`` minus open loans where it drifted
+
+    Returns a report dict: books checked, drifted, fixed and skipped,
+    overcommitted books (more open loans than copies) and the first
+    drifted books as (book_id, stored, expected). With ``dry_run`` the
+    report is the same but nothing is written.
+    """
+    config = inventory_settings()
+    chunk_size = chunk_size or config['CHUNK_SIZE']
+    report = {'checked': 0, 'drifted': 0, 'fixed': 0, 'skipped': 0, 'overcommitted': 0, 'drift': []}
+    drifted = {}
+    for book_id, total, available, open_loans in expected_availability():
+        report['checked'] += 1
+        if open_loans > total:
+            report['overcommitted'] += 1
+        expected = max(total - open_loans, 0)
+        if available == expected:
+            continue
+        report['drifted'] += 1
+        if len(report['drift']) < config['REPORT_LIMIT']:
+            report['drift'].append((book_id, available, expected))
+        drifted[book_id] = (available, expected)
+        if len(drifted) >= chunk_size:
+            fix_chunk(drifted, report, dry_run)
+            drifted = {}
+    if drifted:
+        fix_chunk(drifted, report, dry_run)
+    return report
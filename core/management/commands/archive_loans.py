@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import archive
+
+
+class Command(BaseCommand):
+    help = 'Move returned loans older than a cutoff to the loan archive in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=None,
+                            help='Archive loans returned more than this many days ago '
+                                 '(default: LOAN_ARCHIVE["CUTOFF_DAYS"])')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows moved per transaction (default: LOAN_ARCHIVE["BATCH_SIZE"])')
+
+    def handle(self, *args, **options):
+        days = options['older_than']
+        if days is None:
+            days = archive.archive_settings()['CUTOFF_DAYS']
+        cutoff = timezone.now().date() - timedelta(days=days)
+
+        total = 0
+        for moved in archive.archive_closed_loans(cutoff, options['batch_size']):
+            total += moved
+            self.stdout.write(f'Archived {total} loan(s)...')
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} loan(s) returned before {cutoff}'))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Precompute "patrons also borrowed" neighbors from loans changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild every book instead of refreshing changed ones')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        build = recommendations.refresh_neighbors(full=options['full'])
+        kind = 'full' if build.full else 'incremental'
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated neighbors of {build.books_updated} book(s) ({kind}) in {time.monotonic() - start:.1f}s'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import changes
+
+
+class Command(BaseCommand):
+    help = 'Drop superseded change records and tombstones past the retention of the changes feed'
+
+    def handle(self, *args, **options):
+        deleted = changes.compact_changes()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} change record(s)'))
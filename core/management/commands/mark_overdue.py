@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core import overdue
+
+
+class Command(BaseCommand):
+    help = 'Mark active loans past their due date as overdue, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Loans marked per transaction (default: OVERDUE["BATCH_SIZE"])')
+
+    def handle(self, *args, **options):
+        total = 0
+        for marked in overdue.mark_overdue(batch_size=options['batch_size']):
+            total += marked
+            self.stdout.write(f'Marked {total} loan(s)...')
+        self.stdout.write(self.style.SUCCESS(f'Marked {total} loan(s) overdue'))
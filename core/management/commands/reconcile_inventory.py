@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import inventory
+
+
+class Command(BaseCommand):
+    help = 'Reset available_copies to total_copies minus open loans where they drifted apart'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drift without changing anything')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Drifted books fixed per transaction (default: INVENTORY["CHUNK_SIZE"])')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        report = inventory.reconcile_inventory(dry_run=options['dry_run'], chunk_size=options['chunk_size'])
+
+        for book_id, stored, expected in report['drift']:
+            self.stdout.write(f'Book {book_id}: available_copies {stored} -> {expected}')
+        if report['drifted'] > len(report['drift']):
+            self.stdout.write(f"... and {report['drifted'] - len(report['drift'])} more")
+        if report['overcommitted']:
+            self.stdout.write(self.style.WARNING(
+                f"{report['overcommitted']} book(s) have more open loans than copies"
+            ))
+        if report['skipped']:
+            self.stdout.write(self.style.WARNING(
+                f"{report['skipped']} book(s) changed during the run or have pending loan events; "
+                'run again to reconcile them'
+            ))
+        verb = 'Would fix' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {report['checked']} book(s), {report['drifted']} drifted; "
+            f"{verb} {report['fixed']} in {time.monotonic() - start:.1f}s"
+        ))
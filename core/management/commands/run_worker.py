@@ -0,0 +1,55 @@
+import signal
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from core import outbox
+
+
+class Command(BaseCommand):
+    help = 'Process outbox events (loan side effects) in the background'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Events claimed per batch (default: OUTBOX["BATCH_SIZE"])')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when there is nothing to do')
+        parser.add_argument('--lag-interval', type=float, default=30.0,
+                            help='Seconds between lag reports')
+        parser.add_argument('--once', action='store_true',
+                            help='Process the events that are due now and exit')
+
+    def handle(self, *args, **options):
+        worker_id = uuid.uuid4().hex
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.stdout.write(f'Outbox worker {worker_id} started')
+        last_report = 0.0
+        total_processed = total_failed = 0
+
+        while self.running:
+            processed, failed = outbox.process_batch(options['batch_size'], worker_id)
+            total_processed += processed
+            total_failed += failed
+
+            if time.monotonic() - last_report >= options['lag_interval'] or options['once']:
+                self.report(total_processed, total_failed)
+                last_report = time.monotonic()
+
+            if processed + failed == 0:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS('Outbox worker stopped'))
+
+    def report(self, processed, failed):
+        self.stdout.write(
+            f'processed={processed} failed={failed} lag={outbox.lag():.1f}s'
+        )
+
+    def stop(self, signum, frame):
+        self.running = False
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import reminders
+
+
+class Command(BaseCommand):
+    help = 'Send one reminder digest per user for loans due soon or overdue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Remind about loans due in this many days (default: REMINDERS["DAYS_AHEAD"])')
+        parser.add_argument('--sender', default=None,
+                            help='Dotted path of the sender class (default: REMINDERS["SENDER"])')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Messages handed to the sender at once')
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        sender = reminders.get_sender(options['sender'])
+        recipients, sent, skipped = reminders.send_reminders(
+            sender,
+            days_ahead=options['days'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {sent} reminder(s) to {recipients} user(s) in {time.monotonic() - start:.1f}s'
+        ))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} user(s) without an email address'))
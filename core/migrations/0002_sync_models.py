@@ -0,0 +1,112 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='book',
+            options={'ordering': ['title', 'author'], 'verbose_name': 'Book', 'verbose_name_plural': 'Books'},
+        ),
+        migrations.AlterModelOptions(
+            name='bookloan',
+            options={'ordering': ['-created_at'], 'verbose_name': 'Book Loan', 'verbose_name_plural': 'Book Loans'},
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='total_copies',
+            field=models.PositiveIntegerField(default=1, verbose_name='Total Copies'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='bookloan',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='bookloan',
+            name='fine_amount',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=6, verbose_name='Fine Amount'),
+        ),
+        migrations.AddField(
+            model_name='bookloan',
+            name='notes',
+            field=models.TextField(blank=True, help_text='Additional notes about this loan', verbose_name='Notes'),
+        ),
+        migrations.AddField(
+            model_name='bookloan',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='bookloan',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='author',
+            field=models.CharField(max_length=100, verbose_name='Author'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='available_copies',
+            field=models.PositiveIntegerField(default=1, verbose_name='Available Copies'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='isbn',
+            field=models.CharField(max_length=13, unique=True, verbose_name='ISBN'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='title',
+            field=models.CharField(max_length=200, verbose_name='Title'),
+        ),
+        migrations.AlterField(
+            model_name='bookloan',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.book', verbose_name='Book'),
+        ),
+        migrations.AlterField(
+            model_name='bookloan',
+            name='due_date',
+            field=models.DateField(help_text='Date when the book should be returned', verbose_name='Due Date'),
+        ),
+        migrations.AlterField(
+            model_name='bookloan',
+            name='loan_date',
+            field=models.DateField(default=django.utils.timezone.now, verbose_name='Loan Date'),
+        ),
+        migrations.AlterField(
+            model_name='bookloan',
+            name='return_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Return Date'),
+        ),
+        migrations.AlterField(
+            model_name='bookloan',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('active', 'Active'), ('returned', 'Returned'), ('overdue', 'Overdue')], default='pending', max_length=20, verbose_name='Status'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import migrations
+
+
+def student_loans_to_users(apps, schema_editor):
+    """Give every student a user account and move their loans to it"""
+    Student = apps.get_model('core', 'Student')
+    BookLoan = apps.get_model('core', 'BookLoan')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    for student in Student.objects.order_by('id').iterator():
+        first_name, _, last_name = student.full_name.partition(' ')
+        user, _ = User.objects.get_or_create(
+            username=student.student_id,
+            defaults={
+                'email': student.email,
+                'first_name': first_name[:150],
+                'last_name': last_name[:150],
+                'password': make_password(None),
+            },
+        )
+        BookLoan.objects.filter(student_id=student.id).update(user=user)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_sync_models'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(student_loans_to_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_student_loans_to_users'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookloan',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='bookloan',
+            unique_together={('user', 'book', 'status')},
+        ),
+        migrations.RemoveField(
+            model_name='bookloan',
+            name='student',
+        ),
+        migrations.DeleteModel(
+            name='Student',
+        ),
+        migrations.RemoveField(
+            model_name='book',
+            name='published_date',
+        ),
+    ]
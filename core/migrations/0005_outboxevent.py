@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:39
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_remove_student'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=100, verbose_name='Topic')),
+                ('payload', models.JSONField(default=dict, verbose_name='Payload')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Earliest time the event may be processed (retry backoff)', verbose_name='Available At')),
+                ('claimed_by', models.CharField(blank=True, max_length=32, verbose_name='Claimed By')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Locked Until')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Outbox Event',
+                'verbose_name_plural': 'Outbox Events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='outbox_pending_idx')],
+            },
+        ),
+    ]
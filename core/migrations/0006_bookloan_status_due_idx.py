@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_outboxevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookloan',
+            index=models.Index(fields=['status', 'due_date'], name='bookloan_status_due_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+PARTITIONED_TABLE_SQL = """
+DROP TABLE core_bookloanarchive;
+CREATE TABLE core_bookloanarchive (
+    id bigint NOT NULL,
+    loan_date date NOT NULL,
+    due_date date NOT NULL,
+    return_date date NULL,
+    status varchar(20) NOT NULL,
+    notes text NOT NULL,
+    fine_amount numeric(6, 2) NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    updated_at timestamp with time zone NOT NULL,
+    archived_at timestamp with time zone NOT NULL,
+    book_id bigint NOT NULL,
+    user_id integer NOT NULL,
+    PRIMARY KEY (id, loan_date)
+) PARTITION BY RANGE (loan_date);
+CREATE TABLE core_bookloanarchive_default PARTITION OF core_bookloanarchive DEFAULT;
+CREATE INDEX loanarchive_user_idx ON core_bookloanarchive (user_id, loan_date);
+CREATE INDEX loanarchive_book_idx ON core_bookloanarchive (book_id, loan_date);
+"""
+
+
+def partition_archive_table(apps, schema_editor):
+    """Recreate the (still empty) archive table range-partitioned by loan_date on PostgreSQL"""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(PARTITIONED_TABLE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_bookloan_status_due_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookLoanArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('loan_date', models.DateField(verbose_name='Loan Date')),
+                ('due_date', models.DateField(verbose_name='Due Date')),
+                ('return_date', models.DateField(blank=True, null=True, verbose_name='Return Date')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('active', 'Active'), ('returned', 'Returned'), ('overdue', 'Overdue')], max_length=20, verbose_name='Status')),
+                ('notes', models.TextField(blank=True, verbose_name='Notes')),
+                ('fine_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=6, verbose_name='Fine Amount')),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='core.book', verbose_name='Book')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Archived Book Loan',
+                'verbose_name_plural': 'Archived Book Loans',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'loan_date'], name='loanarchive_user_idx'), models.Index(fields=['book', 'loan_date'], name='loanarchive_book_idx')],
+            },
+        ),
+        migrations.RunPython(partition_archive_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_bookloanarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookAvailabilitySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(verbose_name='Taken At')),
+                ('copies_out', models.IntegerField(verbose_name='Copies Out')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability_snapshots', to='core.book', verbose_name='Book')),
+            ],
+            options={
+                'verbose_name': 'Book Availability Snapshot',
+                'verbose_name_plural': 'Book Availability Snapshots',
+                'ordering': ['-taken_at'],
+                'constraints': [models.UniqueConstraint(fields=('book', 'taken_at'), name='availability_snapshot_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LoanEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('loan_id', models.BigIntegerField(verbose_name='Loan ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Checkout'), (2, 'Return'), (3, 'Renew'), (4, 'Overdue')], verbose_name='Kind')),
+                ('occurred_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Occurred At')),
+                ('book', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.book', verbose_name='Book')),
+            ],
+            options={
+                'verbose_name': 'Loan Event',
+                'verbose_name_plural': 'Loan Events',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['book', 'occurred_at'], name='loanevent_book_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:45
+
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    """Start the maintained counters from the current data"""
+    Book = apps.get_model('core', 'Book')
+    BookLoan = apps.get_model('core', 'BookLoan')
+    CirculationCounter = apps.get_model('core', 'CirculationCounter')
+    CirculationCounter.objects.bulk_create([
+        CirculationCounter(name='active_loans', value=BookLoan.objects.filter(status='active').count()),
+        CirculationCounter(name='overdue_loans', value=BookLoan.objects.filter(status='overdue').count()),
+        CirculationCounter(name='zero_availability_books', value=Book.objects.filter(available_copies=0).count()),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_loanevent_availability_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Name')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Value')),
+            ],
+            options={
+                'verbose_name': 'Circulation Counter',
+                'verbose_name_plural': 'Circulation Counters',
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
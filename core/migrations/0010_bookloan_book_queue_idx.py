@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_circulationcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookloan',
+            index=models.Index(fields=['book', 'status', 'due_date'], name='bookloan_book_queue_idx'),
+        ),
+    ]
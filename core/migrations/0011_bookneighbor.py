@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_bookloan_book_queue_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NeighborBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(verbose_name='Started At')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished At')),
+                ('full', models.BooleanField(default=False, verbose_name='Full Rebuild')),
+                ('books_updated', models.PositiveIntegerField(default=0, verbose_name='Books Updated')),
+            ],
+            options={
+                'verbose_name': 'Neighbor Build',
+                'verbose_name_plural': 'Neighbor Builds',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Rank')),
+                ('score', models.FloatField(verbose_name='Score')),
+                ('shared_readers', models.PositiveIntegerField(verbose_name='Shared Readers')),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='core.book', verbose_name='Book')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.book', verbose_name='Neighbor')),
+            ],
+            options={
+                'verbose_name': 'Book Neighbor',
+                'verbose_name_plural': 'Book Neighbors',
+                'ordering': ['book', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('book', 'rank'), name='book_neighbor_rank_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_bookneighbor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCopy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('barcode', models.CharField(max_length=64, unique=True, verbose_name='Barcode')),
+                ('status', models.CharField(choices=[('available', 'Available'), ('on_loan', 'On Loan'), ('maintenance', 'In Maintenance'), ('lost', 'Lost')], default='available', max_length=20, verbose_name='Status')),
+                ('location', models.CharField(blank=True, help_text='Shelf or room where the copy is kept', max_length=100, verbose_name='Location')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='copies', to='core.book', verbose_name='Book')),
+            ],
+            options={
+                'verbose_name': 'Book Copy',
+                'verbose_name_plural': 'Book Copies',
+                'ordering': ['barcode'],
+            },
+        ),
+        migrations.AddField(
+            model_name='bookloan',
+            name='copy',
+            field=models.ForeignKey(blank=True, help_text='The copy handed out, for loans made by scanning a barcode', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loans', to='core.bookcopy', verbose_name='Copy'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_bookcopy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Branch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=20, unique=True, verbose_name='Code')),
+                ('name', models.CharField(max_length=100, verbose_name='Name')),
+                ('address', models.CharField(blank=True, max_length=200, verbose_name='Address')),
+            ],
+            options={
+                'verbose_name': 'Branch',
+                'verbose_name_plural': 'Branches',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='bookcopy',
+            name='branch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='copies', to='core.branch', verbose_name='Branch'),
+        ),
+        migrations.AddField(
+            model_name='bookloan',
+            name='branch',
+            field=models.ForeignKey(blank=True, help_text='Branch the book is checked out from', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loans', to='core.branch', verbose_name='Branch'),
+        ),
+        migrations.CreateModel(
+            name='StockTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('copies', models.PositiveIntegerField(verbose_name='Copies')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.book', verbose_name='Book')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Created By')),
+                ('from_branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfers_out', to='core.branch', verbose_name='From Branch')),
+                ('to_branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfers_in', to='core.branch', verbose_name='To Branch')),
+            ],
+            options={
+                'verbose_name': 'Stock Transfer',
+                'verbose_name_plural': 'Stock Transfers',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_copies', models.PositiveIntegerField(default=0, verbose_name='Total Copies')),
+                ('available_copies', models.PositiveIntegerField(default=0, verbose_name='Available Copies')),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stock', to='core.book', verbose_name='Book')),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock', to='core.branch', verbose_name='Branch')),
+            ],
+            options={
+                'verbose_name': 'Book Stock',
+                'verbose_name_plural': 'Book Stock',
+                'ordering': ['branch', 'book'],
+                'indexes': [models.Index(condition=models.Q(('available_copies__gt', 0)), fields=['branch', 'book'], name='book_stock_available_idx')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'branch'), name='book_stock_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_branches'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookloan',
+            index=models.Index(fields=['loan_date'], name='bookloan_loan_date_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_bookloan_loan_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeRecord',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(choices=[('book', 'Book'), ('loan', 'Book Loan')], max_length=10, verbose_name='Model')),
+                ('object_id', models.BigIntegerField(verbose_name='Object ID')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Deleted')),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Changed At')),
+            ],
+            options={
+                'verbose_name': 'Change Record',
+                'verbose_name_plural': 'Change Records',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['model', 'object_id', 'id'], name='change_object_idx'), models.Index(fields=['changed_at'], name='change_changed_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_change_records'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='bookloan',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='bookloan',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'active', 'overdue'])), fields=('user', 'book'), name='bookloan_one_open_loan'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+COUNTERS = ('active_loans', 'overdue_loans', 'zero_availability_books')
+SHARDS = 16
+
+
+def create_shards(apps, schema_editor):
+    """Create every counter's shard rows, so adjusting one is a single UPDATE"""
+    CirculationCounter = apps.get_model('core', 'CirculationCounter')
+    CirculationCounter.objects.bulk_create(
+        [CirculationCounter(name=f'{name}:{shard}') for name in COUNTERS for shard in range(1, SHARDS)],
+        ignore_conflicts=True,
+    )
+
+
+def drop_shards(apps, schema_editor):
+    """Fold the shards back into the base rows"""
+    CirculationCounter = apps.get_model('core', 'CirculationCounter')
+    for name in COUNTERS:
+        shards = CirculationCounter.objects.filter(name__startswith=f'{name}:')
+        total = sum(shards.values_list('value', flat=True))
+        shards.delete()
+        CirculationCounter.objects.filter(name=name).update(value=models.F('value') + total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_bookloan_one_open_loan'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_shards, drop_shards),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+from django.db.models import Count, Q
+
+
+def stock_from_copies(apps, schema_editor):
+    """Create the stock rows of branches holding copies but no stock yet"""
+    BookCopy = apps.get_model('core', 'BookCopy')
+    BookStock = apps.get_model('core', 'BookStock')
+    counts = (
+        BookCopy.objects.filter(branch__isnull=False).order_by()
+        .values_list('book_id', 'branch_id')
+        .annotate(total=Count('id'), available=Count('id', filter=Q(status='available')))
+    )
+    BookStock.objects.bulk_create(
+        [
+            BookStock(book_id=book_id, branch_id=branch_id, total_copies=total, available_copies=available)
+            for book_id, branch_id, total, available in counts.iterator()
+        ],
+        batch_size=5000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_circulation_counter_shards'),
+    ]
+
+    operations = [
+        migrations.RunPython(stock_from_copies, migrations.RunPython.noop),
+    ]
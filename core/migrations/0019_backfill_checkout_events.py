@@ -0,0 +1,34 @@
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+CHECKOUT = 1
+
+
+def backfill_checkout_events(apps, schema_editor):
+    """Log a checkout for loans that were already out when the event log started"""
+    BookLoan = apps.get_model('core', 'BookLoan')
+    LoanEvent = apps.get_model('core', 'LoanEvent')
+    untracked = (
+        BookLoan.objects.filter(status__in=('active', 'overdue'))
+        .exclude(Exists(LoanEvent.objects.filter(loan_id=OuterRef('pk'))))
+        .order_by('pk')
+        .values_list('pk', 'book_id', 'created_at')
+    )
+    events = []
+    for loan_id, book_id, created_at in untracked.iterator(chunk_size=5000):
+        events.append(LoanEvent(loan_id=loan_id, book_id=book_id, kind=CHECKOUT, occurred_at=created_at))
+        if len(events) >= 5000:
+            LoanEvent.objects.bulk_create(events)
+            events = []
+    LoanEvent.objects.bulk_create(events)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_stock_from_copies'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_checkout_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_backfill_checkout_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookloanarchive',
+            name='branch',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.branch', verbose_name='Branch'),
+        ),
+        migrations.AddField(
+            model_name='bookloanarchive',
+            name='copy',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.bookcopy', verbose_name='Copy'),
+        ),
+    ]
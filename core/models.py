@@ -1,4 +1,6 @@
-from django.db import models
+import random
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
@@ -31,6 +33,211 @@ class Book(models.Model):
         """Get total number of times this book has been loaned"""
         return self.bookloan_set.count()
 
+    def save(self, *args, **kwargs):
+        """Keep the zero-availability counter in step with available_copies"""
+        was_unavailable = getattr(self, '_stored_unavailable', False)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            is_unavailable = self.available_copies == 0
+            if is_unavailable != was_unavailable:
+                CirculationCounter.adjust(zero_availability_books=1 if is_unavailable else -1)
+        self._stored_unavailable = self.available_copies == 0
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'available_copies' in field_names:
+            instance._stored_unavailable = instance.available_copies == 0
+        return instance
+
+
+class Branch(models.Model):
+    """A library branch holding its own stock of books"""
+    code = models.CharField(max_length=20, unique=True, verbose_name="Code")
+    name = models.CharField(max_length=100, verbose_name="Name")
+    address = models.CharField(max_length=200, blank=True, verbose_name="Address")
+
+    class Meta:
+        verbose_name = "Branch"
+        verbose_name_plural = "Branches"
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class BookStock(models.Model):
+    """
+    Copies of a book held at one branch
+
+    Book.total_copies and available_copies remain the library-wide totals;
+    stock rows split them per branch and are adjusted alongside them.
+    """
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        db_index=False,  # covered by the (book, branch) constraint
+        related_name='stock',
+        verbose_name="Book"
+    )
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.CASCADE,
+        related_name='stock',
+        verbose_name="Branch"
+    )
+    total_copies = models.PositiveIntegerField(default=0, verbose_name="Total Copies")
+    available_copies = models.PositiveIntegerField(default=0, verbose_name="Available Copies")
+
+    class Meta:
+        verbose_name = "Book Stock"
+        verbose_name_plural = "Book Stock"
+        ordering = ['branch', 'book']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'branch'], name='book_stock_unique'),
+        ]
+        indexes = [
+            # "Available at branch X" reads only that branch's shelved books
+            models.Index(
+                fields=['branch', 'book'],
+                condition=models.Q(available_copies__gt=0),
+                name='book_stock_available_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} at {self.branch_id}: {self.available_copies}/{self.total_copies}"
+
+
+class StockTransfer(models.Model):
+    """Available copies of a book moved from one branch to another"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+', verbose_name="Book")
+    from_branch = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name='transfers_out', verbose_name="From Branch"
+    )
+    to_branch = models.ForeignKey(
+        Branch, on_delete=models.CASCADE, related_name='transfers_in', verbose_name="To Branch"
+    )
+    copies = models.PositiveIntegerField(verbose_name="Copies")
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Created By"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Stock Transfer"
+        verbose_name_plural = "Stock Transfers"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.copies} x {self.book_id}: {self.from_branch_id} -> {self.to_branch_id}"
+
+
+class BookCopy(models.Model):
+    """
+    A physical copy of a book, identified by the barcode on its label
+
+    Book.total_copies and available_copies stay the book-level counts
+    every listing reads; circulating a copy updates them like any loan.
+    """
+
+    AVAILABLE = 'available'
+    ON_LOAN = 'on_loan'
+    MAINTENANCE = 'maintenance'
+    LOST = 'lost'
+
+    STATUS_CHOICES = [
+        (AVAILABLE, 'Available'),
+        (ON_LOAN, 'On Loan'),
+        (MAINTENANCE, 'In Maintenance'),
+        (LOST, 'Lost'),
+    ]
+
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='copies',
+        verbose_name="Book"
+    )
+    barcode = models.CharField(max_length=64, unique=True, verbose_name="Barcode")
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='copies',
+        verbose_name="Branch"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=AVAILABLE,
+        verbose_name="Status"
+    )
+    location = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name="Location",
+        help_text="Shelf or room where the copy is kept"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Book Copy"
+        verbose_name_plural = "Book Copies"
+        ordering = ['barcode']
+
+    def __str__(self):
+        return f"{self.barcode} ({self.book_id})"
+
+    # Statuses a copy sits in off the shelf outside circulation
+    OFF_SHELF_STATUSES = (MAINTENANCE, LOST)
+
+    def save(self, *args, **kwargs):
+        """
+        Keep the branch stock in step with the copy
+
+        Adding a copy or moving it between branches counts it at its new
+        branch; sending it to maintenance or marking it lost takes it off
+        the shelf, and making it available again puts it back. Checkouts and
+        returns are left to the outbox handler (library.handlers).
+        """
+        from . import stock
+
+        adding = self._state.adding
+        stored_branch_id = getattr(self, '_stored_branch_id', None)
+        with transaction.atomic(using=kwargs.get('using')):
+            stored_status = getattr(self, '_stored_status', None)
+            if stored_status is None and not adding:
+                stored_status = (type(self)._default_manager.using(kwargs.get('using') or self._state.db)
+                                 .filter(pk=self.pk).values_list('status', flat=True).first())
+            super().save(*args, **kwargs)
+            if adding:
+                stock.move_copy(self.book_id, None, self.branch_id, shelved=self.status == self.AVAILABLE)
+            else:
+                if self.branch_id != stored_branch_id:
+                    stock.move_copy(
+                        self.book_id, stored_branch_id, self.branch_id,
+                        shelved=stored_status == self.AVAILABLE,
+                    )
+                if self.branch_id is not None:
+                    if stored_status == self.AVAILABLE and self.status in self.OFF_SHELF_STATUSES:
+                        stock.check_out(self.book_id, self.branch_id)
+                    elif stored_status in self.OFF_SHELF_STATUSES and self.status == self.AVAILABLE:
+                        stock.check_in(self.book_id, self.branch_id)
+        self._stored_branch_id = self.branch_id
+        self._stored_status = self.status
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'branch_id' in field_names:
+            instance._stored_branch_id = instance.branch_id
+        if 'status' in field_names:
+            instance._stored_status = instance.status
+        return instance
+
 
 class BookLoan(models.Model):
     """BookLoan model representing a book loan transaction"""
@@ -41,6 +248,8 @@ class BookLoan(models.Model):
         ('returned', 'Returned'),
         ('overdue', 'Overdue'),
     ]
+    # A reader holds at most one loan of a book in these statuses
+    OPEN_STATUSES = ('pending', 'active', 'overdue')
 
     # Core fields
     user = models.ForeignKey(
@@ -53,6 +262,24 @@ class BookLoan(models.Model):
         on_delete=models.CASCADE,
         verbose_name="Book"
     )
+    copy = models.ForeignKey(
+        BookCopy,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='loans',
+        verbose_name="Copy",
+        help_text="The copy handed out, for loans made by scanning a barcode"
+    )
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='loans',
+        verbose_name="Branch",
+        help_text="Branch the book is checked out from"
+    )
     
     # Date fields
     loan_date = models.DateField(
@@ -96,8 +323,21 @@ class BookLoan(models.Model):
         verbose_name = "Book Loan"
         verbose_name_plural = "Book Loans"
         ordering = ['-created_at']
-        # Prevent user from having multiple active loans of the same book
-        unique_together = [['user', 'book', 'status']]
+        constraints = [
+            # One open loan of a book per reader; returned loans of it can pile up
+            models.UniqueConstraint(
+                fields=['user', 'book'], condition=models.Q(status__in=['pending', 'active', 'overdue']),
+                name='bookloan_one_open_loan',
+            ),
+        ]
+        indexes = [
+            # Due-date scans for reminders and overdue lists
+            models.Index(fields=['status', 'due_date'], name='bookloan_status_due_idx'),
+            # Per-book due-date queue for availability forecasts (core.forecast)
+            models.Index(fields=['book', 'status', 'due_date'], name='bookloan_book_queue_idx'),
+            # First/last loan date for the admin's date drill-down (library.changelist)
+            models.Index(fields=['loan_date'], name='bookloan_loan_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.book.title} loaned to {self.user.get_full_name() or self.user.username}"
@@ -117,11 +357,36 @@ class BookLoan(models.Model):
         if self.status == 'returned' and not self.return_date:
             self.return_date = timezone.now().date()
         
-        super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using')):
+            stored_state = getattr(self, '_stored_state', (None, None))
+            if stored_state is None:
+                # Loaded with status or due_date deferred: read what is stored before overwriting it
+                stored_state = (
+                    type(self)._default_manager.using(kwargs.get('using') or self._state.db)
+                    .filter(pk=self.pk).values_list('status', 'due_date').first()
+                ) or (None, None)
+            previous_status, previous_due_date = stored_state
+            super().save(*args, **kwargs)
+            LoanEvent.record_transition(self, previous_status, previous_due_date)
+            CirculationCounter.adjust_for_status(previous_status, self.status)
+        self._stored_state = (self.status, self.due_date)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored state so save() can record transitions in LoanEvent;
+        # None when the fields were deferred and save() has to read it
+        if 'status' in field_names and 'due_date' in field_names:
+            instance._stored_state = (instance.status, instance.due_date)
+        else:
+            instance._stored_state = None
+        return instance
 
     @property
     def is_overdue(self):
         """Check if the loan is overdue"""
+        if self.status == 'overdue':
+            return True
         if self.status != 'active':
             return False
         return timezone.now().date() > self.due_date
@@ -166,8 +431,7 @@ class BookLoan(models.Model):
         """Get all overdue loans"""
         today = timezone.now().date()
         return cls.objects.filter(
-            status='active',
-            due_date__lt=today
+            models.Q(status='overdue') | models.Q(status='active', due_date__lt=today)
         )
 
     @classmethod
@@ -195,3 +459,387 @@ class BookLoan(models.Model):
             active_count=models.Count('id', filter=models.Q(status='borrowed')),
             overdue_count=models.Count('id', filter=models.Q(status='overdue'))
         )
+
+
+class OutboxEvent(models.Model):
+    """Side effect recorded in the same transaction as the change that caused it"""
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    topic = models.CharField(max_length=100, verbose_name="Topic")
+    payload = models.JSONField(default=dict, verbose_name="Payload")
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name="Status"
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Attempts")
+    available_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Available At",
+        help_text="Earliest time the event may be processed (retry backoff)"
+    )
+    claimed_by = models.CharField(max_length=32, blank=True, verbose_name="Claimed By")
+    locked_until = models.DateTimeField(null=True, blank=True, verbose_name="Locked Until")
+    last_error = models.TextField(blank=True, verbose_name="Last Error")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Outbox Event"
+        verbose_name_plural = "Outbox Events"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.pk} ({self.status})"
+
+
+class BookLoanArchive(models.Model):
+    """
+    Closed loans moved out of BookLoan by ``manage.py archive_loans``
+
+    On PostgreSQL the table is range-partitioned by ``loan_date`` with one
+    partition per year (see core.archive), so the live loan table stays small.
+    The primary key is the id the loan had in BookLoan.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        verbose_name="User"
+    )
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        verbose_name="Book"
+    )
+    # Kept as the ids the loan had: archived history outlives copies and branches
+    copy = models.ForeignKey(
+        BookCopy,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="Copy"
+    )
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name="Branch"
+    )
+    loan_date = models.DateField(verbose_name="Loan Date")
+    due_date = models.DateField(verbose_name="Due Date")
+    return_date = models.DateField(null=True, blank=True, verbose_name="Return Date")
+    status = models.CharField(
+        max_length=20,
+        choices=BookLoan.STATUS_CHOICES,
+        verbose_name="Status"
+    )
+    notes = models.TextField(blank=True, verbose_name="Notes")
+    fine_amount = models.DecimalField(
+        max_digits=6,
+        decimal_places=2,
+        default=0.00,
+        verbose_name="Fine Amount"
+    )
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Archived Book Loan"
+        verbose_name_plural = "Archived Book Loans"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'loan_date'], name='loanarchive_user_idx'),
+            models.Index(fields=['book', 'loan_date'], name='loanarchive_book_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book.title} loaned to {self.user.get_full_name() or self.user.username} (archived)"
+
+    @property
+    def loan_duration(self):
+        """Calculate loan duration in days"""
+        if self.return_date:
+            return (self.return_date - self.loan_date).days
+        return None
+
+
+class LoanEvent(models.Model):
+    """
+    Append-only log of loan transitions
+
+    Rows are never updated or deleted, and they outlive archived loans, so
+    past availability can be rebuilt from BookAvailabilitySnapshot plus the
+    events recorded after it.
+    """
+
+    CHECKOUT = 1
+    RETURN = 2
+    RENEW = 3
+    OVERDUE = 4
+
+    KIND_CHOICES = [
+        (CHECKOUT, 'Checkout'),
+        (RETURN, 'Return'),
+        (RENEW, 'Renew'),
+        (OVERDUE, 'Overdue'),
+    ]
+
+    # Change in the number of copies out for each kind of event
+    COPIES_OUT_DELTA = {CHECKOUT: 1, RETURN: -1, RENEW: 0, OVERDUE: 0}
+
+    OUT_STATUSES = ('active', 'overdue')
+
+    loan_id = models.BigIntegerField(verbose_name="Loan ID")
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+        verbose_name="Book"
+    )
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES, verbose_name="Kind")
+    occurred_at = models.DateTimeField(default=timezone.now, verbose_name="Occurred At")
+
+    class Meta:
+        verbose_name = "Loan Event"
+        verbose_name_plural = "Loan Events"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['book', 'occurred_at'], name='loanevent_book_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} of loan #{self.loan_id}"
+
+    def save(self, *args, **kwargs):
+        """Only inserts are allowed"""
+        if not self._state.adding:
+            raise ValueError("Loan events are append-only")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Loan events are append-only")
+
+    @classmethod
+    def record_transition(cls, loan, previous_status, previous_due_date):
+        """Append the event implied by a loan going from the previous state to its current one"""
+        was_out = previous_status in cls.OUT_STATUSES
+        is_out = loan.status in cls.OUT_STATUSES
+        kind = None
+        if is_out and not was_out:
+            kind = cls.CHECKOUT
+        elif was_out and loan.status == 'returned':
+            kind = cls.RETURN
+        elif previous_status == 'active' and loan.status == 'overdue':
+            kind = cls.OVERDUE
+        elif is_out and previous_due_date and loan.due_date > previous_due_date:
+            kind = cls.RENEW
+        if kind is not None:
+            cls.objects.create(loan_id=loan.pk, book_id=loan.book_id, kind=kind)
+
+
+class BookAvailabilitySnapshot(models.Model):
+    """Number of copies of a book that were out at a point in time"""
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='availability_snapshots',
+        verbose_name="Book"
+    )
+    taken_at = models.DateTimeField(verbose_name="Taken At")
+    copies_out = models.IntegerField(verbose_name="Copies Out")
+
+    class Meta:
+        verbose_name = "Book Availability Snapshot"
+        verbose_name_plural = "Book Availability Snapshots"
+        ordering = ['-taken_at']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'taken_at'], name='availability_snapshot_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} at {self.taken_at}: {self.copies_out} out"
+
+
+class CirculationCounter(models.Model):
+    """
+    Circulation totals maintained as loans and books change
+
+    Updated in the same transaction as the change, so reading the metrics
+    gauges never needs a COUNT(*) over the loan or book tables. Each
+    counter is spread over ``SHARDS`` rows (``active_loans``,
+    ``active_loans:1``, ...) and every write adjusts one of them at
+    random, so concurrent loans rarely wait on the same row lock; reads
+    sum the shards.
+    """
+
+    ACTIVE_LOANS = 'active_loans'
+    OVERDUE_LOANS = 'overdue_loans'
+    ZERO_AVAILABILITY_BOOKS = 'zero_availability_books'
+
+    # Loan status counted by each counter
+    STATUS_COUNTERS = {'active': ACTIVE_LOANS, 'overdue': OVERDUE_LOANS}
+
+    SHARDS = 16
+
+    name = models.CharField(max_length=50, primary_key=True, verbose_name="Name")
+    value = models.BigIntegerField(default=0, verbose_name="Value")
+
+    class Meta:
+        verbose_name = "Circulation Counter"
+        verbose_name_plural = "Circulation Counters"
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+    @classmethod
+    def adjust(cls, **deltas):
+        shard = random.randrange(cls.SHARDS)
+        # Rows are locked in name order, so two writers can't deadlock on them
+        for name, delta in sorted(deltas.items()):
+            row = f'{name}:{shard}' if shard else name
+            if delta and not cls.objects.filter(name=row).update(value=models.F('value') + delta):
+                cls.objects.get_or_create(name=row)
+                cls.objects.filter(name=row).update(value=models.F('value') + delta)
+
+    @classmethod
+    def adjust_for_status(cls, old_status, new_status):
+        if old_status == new_status:
+            return
+        deltas = {}
+        if old_status in cls.STATUS_COUNTERS:
+            deltas[cls.STATUS_COUNTERS[old_status]] = -1
+        if new_status in cls.STATUS_COUNTERS:
+            deltas[cls.STATUS_COUNTERS[new_status]] = deltas.get(cls.STATUS_COUNTERS[new_status], 0) + 1
+        cls.adjust(**deltas)
+
+    @classmethod
+    def as_dict(cls):
+        totals = {}
+        for row, value in cls.objects.values_list('name', 'value'):
+            name = row.partition(':')[0]
+            totals[name] = totals.get(name, 0) + value
+        return totals
+
+    @classmethod
+    def recount(cls):
+        """Recompute every counter from scratch (after bulk loads or repairs)"""
+        counts = {
+            cls.ACTIVE_LOANS: BookLoan.objects.filter(status='active').count(),
+            cls.OVERDUE_LOANS: BookLoan.objects.filter(status='overdue').count(),
+            cls.ZERO_AVAILABILITY_BOOKS: Book.objects.filter(available_copies=0).count(),
+        }
+        with transaction.atomic():
+            cls.objects.filter(name__contains=':').update(value=0)
+            for name, value in counts.items():
+                cls.objects.update_or_create(name=name, defaults={'value': value})
+        return counts
+
+
+class BookNeighbor(models.Model):
+    """
+    A book often borrowed by readers of another ("patrons also borrowed")
+
+    Precomputed by core.recommendations; ``rank`` 1 is the closest
+    neighbor, so a book's list is one range read of the unique index.
+    """
+    book = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        db_index=False,  # covered by the (book, rank) constraint
+        related_name='neighbors',
+        verbose_name="Book"
+    )
+    neighbor = models.ForeignKey(
+        Book,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name="Neighbor"
+    )
+    rank = models.PositiveSmallIntegerField(verbose_name="Rank")
+    # Share of the book's readers who also borrowed the neighbor
+    score = models.FloatField(verbose_name="Score")
+    shared_readers = models.PositiveIntegerField(verbose_name="Shared Readers")
+
+    class Meta:
+        verbose_name = "Book Neighbor"
+        verbose_name_plural = "Book Neighbors"
+        ordering = ['book', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='book_neighbor_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.neighbor_id} (#{self.rank})"
+
+
+class NeighborBuild(models.Model):
+    """A run of the recommendation builder; the last one is the incremental watermark"""
+    started_at = models.DateTimeField(verbose_name="Started At")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Finished At")
+    full = models.BooleanField(default=False, verbose_name="Full Rebuild")
+    books_updated = models.PositiveIntegerField(default=0, verbose_name="Books Updated")
+
+    class Meta:
+        verbose_name = "Neighbor Build"
+        verbose_name_plural = "Neighbor Builds"
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{'Full' if self.full else 'Incremental'} build at {self.started_at}"
+
+
+class ChangeRecord(models.Model):
+    """
+    A created, updated or deleted Book or BookLoan, for the changes feed (core.changes)
+
+    The id is the feed's sequence: clients sync by asking for records
+    after the last id they have seen.
+    """
+
+    BOOK = 'book'
+    LOAN = 'loan'
+    MODEL_CHOICES = [
+        (BOOK, 'Book'),
+        (LOAN, 'Book Loan'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=10, choices=MODEL_CHOICES, verbose_name="Model")
+    object_id = models.BigIntegerField(verbose_name="Object ID")
+    deleted = models.BooleanField(default=False, verbose_name="Deleted")
+    changed_at = models.DateTimeField(default=timezone.now, verbose_name="Changed At")
+
+    class Meta:
+        verbose_name = "Change Record"
+        verbose_name_plural = "Change Records"
+        ordering = ['id']
+        indexes = [
+            # Superseded records of an object, for compaction
+            models.Index(fields=['model', 'object_id', 'id'], name='change_object_idx'),
+            models.Index(fields=['changed_at'], name='change_changed_at_idx'),
+        ]
+
+    def __str__(self):
+        action = 'deleted' if self.deleted else 'changed'
+        return f"#{self.pk}: {self.model} {self.object_id} {action}"
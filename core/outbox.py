@@ -0,0 +1,155 @@
+"""
+Transactional outbox for loan side effects
+
+Request code calls ``publish()`` inside the same transaction as the change
+that caused the event, so the event exists if and only if the change was
+committed. The ``run_worker`` management command claims pending events in
+batches, runs the handlers registered for their topic and retries failures
+with exponential backoff.
+
+Claiming uses ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database
+supports it, so concurrent workers never wait on each other. On SQLite,
+which serializes writers anyway, a conditional UPDATE of the claim columns
+does the same job.
+"""
+
+import logging
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Published whenever a loan changes status; library.handlers adjusts availability
+LOAN_STATUS_CHANGED = 'loan.status_changed'
+
+_handlers = defaultdict(list)
+
+
+def outbox_settings():
+    return {
+        'BATCH_SIZE': 100,
+        'MAX_ATTEMPTS': 8,
+        'BACKOFF_BASE': 2,
+        'BACKOFF_MAX': 300,
+        'LEASE': 60,
+        **getattr(settings, 'OUTBOX', {}),
+    }
+
+
+def register(topic):
+    """Decorator registering a handler for an event topic"""
+    def decorator(func):
+        _handlers[topic].append(func)
+        return func
+    return decorator
+
+
+def get_handlers(topic):
+    return list(_handlers.get(topic, ()))
+
+
+def publish(topic, **payload):
+    """Record an event; call inside the transaction making the change"""
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def claim_batch(size=None, worker_id=None):
+    """Claim up to ``size`` due events for this worker and return them"""
+    config = outbox_settings()
+    size = size or config['BATCH_SIZE']
+    worker_id = worker_id or uuid.uuid4().hex
+    now = timezone.now()
+    claimable = Q(status='pending', available_at__lte=now) & (
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+    )
+
+    with transaction.atomic():
+        candidates = OutboxEvent.objects.filter(claimable).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        ids = list(candidates.values_list('id', flat=True)[:size])
+        if not ids:
+            return []
+        # Re-checking the claimable condition makes the claim safe without row locks
+        OutboxEvent.objects.filter(claimable, id__in=ids).update(
+            claimed_by=worker_id,
+            locked_until=now + timedelta(seconds=config['LEASE']),
+        )
+
+    return list(OutboxEvent.objects.filter(id__in=ids, claimed_by=worker_id).order_by('id'))
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying after ``attempts`` failures"""
+    config = outbox_settings()
+    return min(config['BACKOFF_BASE'] ** attempts, config['BACKOFF_MAX'])
+
+
+def process_event(event):
+    """
+    Run every handler of an event and record the outcome
+
+    The handlers' writes and the event's ``done`` status commit in one
+    transaction, with the event row locked, so a crash in between can't
+    deliver the event again after its effects were applied. Returns False
+    when a handler failed; an event another worker finished meanwhile is
+    skipped and counts as processed.
+    """
+    config = outbox_settings()
+    try:
+        with transaction.atomic():
+            if not OutboxEvent.objects.select_for_update().filter(pk=event.pk, status='pending').exists():
+                return True
+            for handler in get_handlers(event.topic):
+                handler(event)
+            event.status = 'done'
+            event.processed_at = timezone.now()
+            event.locked_until = None
+            event.save(update_fields=['status', 'processed_at', 'locked_until'])
+    except Exception as exc:
+        logger.exception('Outbox event %s (%s) failed', event.pk, event.topic)
+        event.status = 'pending'
+        event.processed_at = None
+        event.attempts += 1
+        event.last_error = f'{type(exc).__name__}: {exc}'
+        if event.attempts >= config['MAX_ATTEMPTS']:
+            event.status = 'failed'
+        else:
+            event.available_at = timezone.now() + timedelta(seconds=backoff(event.attempts))
+        event.locked_until = None
+        event.save(update_fields=['attempts', 'last_error', 'status', 'available_at', 'locked_until'])
+        return False
+    return True
+
+
+def process_batch(size=None, worker_id=None):
+    """Claim and process one batch; returns (processed, failed)"""
+    processed = failed = 0
+    for event in claim_batch(size, worker_id):
+        if process_event(event):
+            processed += 1
+        else:
+            failed += 1
+    return processed, failed
+
+
+def lag():
+    """Age in seconds of the oldest due pending event (0 when caught up)"""
+    oldest = (
+        OutboxEvent.objects
+        .filter(status='pending', available_at__lte=timezone.now())
+        .order_by('id')
+        .values_list('created_at', flat=True)
+        .first()
+    )
+    if oldest is None:
+        return 0.0
+    return (timezone.now() - oldest).total_seconds()
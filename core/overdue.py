@@ -0,0 +1,58 @@
+"""
+Marking loans overdue
+
+A loan is overdue once its due date has passed while it is still active.
+``mark_overdue()`` (``manage.py mark_overdue``, run daily) moves those
+loans to status ``overdue`` in batches. Each batch is one conditional
+UPDATE plus what BookLoan.save() would have written for every row: an
+OVERDUE loan event, the active/overdue counter adjustment and a change
+record for the sync feed. Book availability is unaffected, as both
+statuses count as out.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import changes
+from .models import BookLoan, ChangeRecord, CirculationCounter, LoanEvent
+
+
+def overdue_settings():
+    return {
+        'BATCH_SIZE': 1000,
+        **getattr(settings, 'OVERDUE', {}),
+    }
+
+
+def mark_batch(today, batch_size):
+    """Mark one batch of past-due active loans overdue; returns rows marked"""
+    with transaction.atomic():
+        # Locked, so a return committing meanwhile is not turned into an overdue loan
+        rows = list(
+            BookLoan.objects.select_for_update().filter(status='active', due_date__lt=today)
+            .order_by('due_date', 'id').values_list('id', 'book_id')[:batch_size]
+        )
+        if not rows:
+            return 0
+        now = timezone.now()
+        ids = [loan_id for loan_id, _ in rows]
+        BookLoan.objects.filter(id__in=ids).update(status='overdue', updated_at=now)
+        LoanEvent.objects.bulk_create(
+            LoanEvent(loan_id=loan_id, book_id=book_id, kind=LoanEvent.OVERDUE, occurred_at=now)
+            for loan_id, book_id in rows
+        )
+        CirculationCounter.adjust(active_loans=-len(rows), overdue_loans=len(rows))
+        changes.record_many(ChangeRecord.LOAN, ids, now)
+    return len(rows)
+
+
+def mark_overdue(today=None, batch_size=None):
+    """Mark every active loan due before ``today`` overdue, yielding batch sizes"""
+    today = today or timezone.now().date()
+    batch_size = batch_size or overdue_settings()['BATCH_SIZE']
+    while True:
+        marked = mark_batch(today, batch_size)
+        if not marked:
+            break
+        yield marked
@@ -0,0 +1,156 @@
+"""
+"Patrons also borrowed" recommendations
+
+Co-occurrence of books in readers' histories is the sparse product AᵀA of
+the reader x book matrix A. ``ReaderMatrix`` holds A in compressed sparse
+row form (flat ``array`` buffers: each reader's books, and each book's
+readers) built from (user, book) pairs streamed in reader order, so a
+million loans take a few dozen MB. One row of AᵀA at a time is counted
+from those arrays, cut to its top K and written to BookNeighbor; the full
+product is never materialized.
+
+A neighbor's score is the share of the book's readers who also borrowed
+it. That only depends on the book's own readers and their histories, so
+an incremental refresh recomputes exactly the books in the histories of
+readers whose loans changed since the last run. Deleted loans are only
+picked up by a full rebuild.
+"""
+
+import heapq
+from array import array
+from collections import Counter
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import BookLoan, BookLoanArchive, BookNeighbor, NeighborBuild
+
+# Loans that mean the reader actually had the book
+BORROWED_STATUSES = ('active', 'overdue', 'returned')
+
+
+def recommendation_settings():
+    return {
+        'TOP_K': 10,
+        'MIN_SHARED_READERS': 2,
+        # Readers with longer histories (staff, test accounts) are skipped:
+        # they add len² pairs and little signal
+        'MAX_HISTORY': 500,
+        'CHUNK_SIZE': 10000,
+        'BATCH_SIZE': 500,
+        # Re-read loans changed this long before the last run started, for
+        # transactions that were still open when it read the tables
+        'WATERMARK_OVERLAP': 300,
+        **getattr(settings, 'RECOMMENDATIONS', {}),
+    }
+
+
+def borrowed_pairs(users=None):
+    """
+    Distinct (user_id, book_id) pairs of live and archived loans, by user
+
+    ``users`` optionally restricts the pairs to a queryset of user ids.
+    """
+    querysets = []
+    for model in (BookLoan, BookLoanArchive):
+        queryset = model.objects.filter(status__in=BORROWED_STATUSES)
+        if users is not None:
+            queryset = queryset.filter(user_id__in=users)
+        querysets.append(queryset.order_by().values_list('user_id', 'book_id'))
+    union = querysets[0].union(querysets[1]).order_by('user_id', 'book_id')
+    return union.iterator(chunk_size=recommendation_settings()['CHUNK_SIZE'])
+
+
+class ReaderMatrix:
+    """Reader x book incidence matrix in CSR form, plus its transpose"""
+
+    def __init__(self, pairs, max_history):
+        self.history_start = array('q', [0])
+        self.history = array('q')
+        readers = {}
+        for _, group in groupby(pairs, key=lambda pair: pair[0]):
+            books = [book for _, book in group]
+            if len(books) > max_history:
+                continue
+            reader = len(self.history_start) - 1
+            self.history.extend(books)
+            self.history_start.append(len(self.history))
+            for book in books:
+                readers.setdefault(book, array('q')).append(reader)
+        self.readers = readers
+
+    def books(self):
+        return self.readers.keys()
+
+    def books_read_by(self, reader):
+        return self.history[self.history_start[reader]:self.history_start[reader + 1]]
+
+    def neighbors(self, book, top_k, min_shared):
+        """Top ``top_k`` (neighbor, score, shared_readers) of one book"""
+        readers = self.readers.get(book, ())
+        shared = Counter()
+        for reader in readers:
+            shared.update(self.books_read_by(reader))
+        shared.pop(book, None)
+        candidates = ((other, count) for other, count in shared.items() if count >= min_shared)
+        # Most shared readers first, lower id first on ties for stable output
+        top = heapq.nlargest(top_k, candidates, key=lambda item: (item[1], -item[0]))
+        return [(other, count / len(readers), count) for other, count in top]
+
+
+def write_neighbors(matrix, books, config):
+    """Replace the neighbor rows of ``books``, one short transaction per batch"""
+    books = sorted(books)
+    for start in range(0, len(books), config['BATCH_SIZE']):
+        batch = books[start:start + config['BATCH_SIZE']]
+        rows = [
+            BookNeighbor(book_id=book, neighbor_id=other, rank=rank, score=score, shared_readers=count)
+            for book in batch
+            for rank, (other, score, count) in enumerate(
+                matrix.neighbors(book, config['TOP_K'], config['MIN_SHARED_READERS']), start=1
+            )
+        ]
+        with transaction.atomic():
+            BookNeighbor.objects.filter(book_id__in=batch).delete()
+            BookNeighbor.objects.bulk_create(rows)
+
+
+def changed_readers(since):
+    """Users with loans created or updated since ``since``"""
+    return BookLoan.objects.filter(updated_at__gte=since).order_by().values('user_id').distinct()
+
+
+def refresh_neighbors(full=False):
+    """
+    Recompute "patrons also borrowed" neighbors; returns the NeighborBuild
+
+    Incremental unless ``full`` or there is no previous build.
+    """
+    config = recommendation_settings()
+    last = NeighborBuild.objects.filter(finished_at__isnull=False).first()
+    build = NeighborBuild.objects.create(started_at=timezone.now(), full=full or last is None)
+
+    if build.full:
+        matrix = ReaderMatrix(borrowed_pairs(), config['MAX_HISTORY'])
+        books = set(matrix.books())
+        stale = set(BookNeighbor.objects.values_list('book_id', flat=True).distinct()) - books
+        BookNeighbor.objects.filter(book_id__in=stale).delete()
+    else:
+        since = last.started_at - timedelta(seconds=config['WATERMARK_OVERLAP'])
+        # Books read by changed readers, then everyone who read those books
+        books = {book for _, book in borrowed_pairs(changed_readers(since))}
+        readers = (
+            BookLoan.objects.filter(book_id__in=books).order_by().values('user_id').union(
+                BookLoanArchive.objects.filter(book_id__in=books).order_by().values('user_id')
+            )
+        )
+        matrix = ReaderMatrix(borrowed_pairs(readers) if books else (), config['MAX_HISTORY'])
+
+    write_neighbors(matrix, books, config)
+    build.books_updated = len(books)
+    build.finished_at = timezone.now()
+    build.save(update_fields=['books_updated', 'finished_at'])
+    return build
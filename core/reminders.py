@@ -0,0 +1,192 @@
+"""
+Due-date reminders
+
+``iter_digests()`` streams active loans that are due in N days or already
+overdue, ordered by user, and yields one digest per user. Only one user's
+loans are held in memory at a time, so runs with 100k due loans stay bounded.
+
+Rendered messages are handed to a sender in batches. Users without an email
+address get no digest; they are counted and logged so they can be fixed. Senders are pluggable
+through ``REMINDERS['SENDER']``:
+
+    core.reminders.ConsoleSender  print messages (default in development)
+    core.reminders.FileSender     append messages to REMINDERS['FILE_PATH']
+    core.reminders.EmailSender    Django email backend over one connection
+"""
+
+import logging
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import BookLoan, LoanEvent
+
+logger = logging.getLogger(__name__)
+
+DIGEST_FIELDS = (
+    'user_id', 'user__username', 'user__first_name', 'user__last_name', 'user__email',
+    'book__title', 'book__author', 'due_date',
+)
+
+
+def reminder_settings():
+    return {
+        'DAYS_AHEAD': 3,
+        'BATCH_SIZE': 500,
+        'SENDER': 'core.reminders.ConsoleSender',
+        'FILE_PATH': 'reminders.log',
+        'SUBJECT': 'Your library loans',
+        'FROM_EMAIL': None,
+        **getattr(settings, 'REMINDERS', {}),
+    }
+
+
+def due_loans(days_ahead, today=None):
+    """Loans out (active or overdue) due in ``days_ahead`` days or past due, ordered by user"""
+    today = today or timezone.now().date()
+    return (
+        BookLoan.objects
+        .filter(status__in=LoanEvent.OUT_STATUSES)
+        .filter(Q(due_date=today + timedelta(days=days_ahead)) | Q(due_date__lt=today))
+        .order_by('user_id', 'due_date')
+        .values_list(*DIGEST_FIELDS, named=True)
+    )
+
+
+def iter_digests(days_ahead, today=None, chunk_size=2000):
+    """Yield one digest context per user, streaming rows from the database"""
+    today = today or timezone.now().date()
+    rows = due_loans(days_ahead, today).iterator(chunk_size=chunk_size)
+    for user_id, loans in groupby(rows, key=lambda row: row.user_id):
+        loans = list(loans)
+        first = loans[0]
+        overdue, due_soon = [], []
+        for loan in loans:
+            entry = {'title': loan.book__title, 'author': loan.book__author, 'due_date': loan.due_date}
+            if loan.due_date < today:
+                entry['days_overdue'] = (today - loan.due_date).days
+                overdue.append(entry)
+            else:
+                due_soon.append(entry)
+        yield {
+            'user_id': user_id,
+            'email': first.user__email,
+            'name': f'{first.user__first_name} {first.user__last_name}'.strip() or first.user__username,
+            'overdue': overdue,
+            'due_soon': due_soon,
+        }
+
+
+def render_message(template, digest, subject, from_email=None):
+    return EmailMessage(
+        subject=subject,
+        body=template.render(digest),
+        from_email=from_email,
+        to=[digest['email']],
+    )
+
+
+def render_messages(digests, subject, from_email=None):
+    """Render digests into EmailMessages with a single compiled template"""
+    template = get_template('reminders/digest.txt')
+    for digest in digests:
+        if digest['email']:
+            yield render_message(template, digest, subject, from_email)
+
+
+class BaseSender:
+    """Deliver batches of rendered messages"""
+
+    def open(self):
+        pass
+
+    def send_messages(self, messages):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ConsoleSender(BaseSender):
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def open(self):
+        if self.stream is None:
+            import sys
+            self.stream = sys.stdout
+
+    def send_messages(self, messages):
+        for message in messages:
+            self.stream.write(f"To: {', '.join(message.to)}\nSubject: {message.subject}\n\n{message.body}\n")
+        return len(messages)
+
+
+class FileSender(ConsoleSender):
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path or reminder_settings()['FILE_PATH']
+
+    def open(self):
+        self.stream = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        self.stream.close()
+
+
+class EmailSender(BaseSender):
+    """Send through Django's email backend, reusing one connection for the run"""
+
+    def open(self):
+        self.connection = get_connection()
+        self.connection.open()
+
+    def send_messages(self, messages):
+        return self.connection.send_messages(messages) or 0
+
+    def close(self):
+        self.connection.close()
+
+
+def get_sender(path=None):
+    return import_string(path or reminder_settings()['SENDER'])()
+
+
+def send_reminders(sender, days_ahead=None, today=None, batch_size=None):
+    """
+    Send one digest per user
+
+    Returns (recipients, messages sent, users skipped for having no email).
+    """
+    config = reminder_settings()
+    days_ahead = config['DAYS_AHEAD'] if days_ahead is None else days_ahead
+    batch_size = batch_size or config['BATCH_SIZE']
+    template = get_template('reminders/digest.txt')
+
+    recipients = sent = skipped = 0
+    batch = []
+    sender.open()
+    try:
+        for digest in iter_digests(days_ahead, today):
+            if not digest['email']:
+                skipped += 1
+                logger.warning('User %s has loans due but no email address; no reminder sent', digest['user_id'])
+                continue
+            recipients += 1
+            batch.append(render_message(template, digest, config['SUBJECT'], config['FROM_EMAIL']))
+            if len(batch) >= batch_size:
+                sent += sender.send_messages(batch)
+                batch = []
+        if batch:
+            sent += sender.send_messages(batch)
+    finally:
+        sender.close()
+    return recipients, sent, skipped
@@ -0,0 +1,39 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import changes, stock
+from .models import Book, BookCopy, BookLoan, ChangeRecord, CirculationCounter
+
+
+@receiver(post_delete, sender=BookLoan)
+def loan_deleted(sender, instance, **kwargs):
+    """Keep circulation counters right when loans are deleted"""
+    CirculationCounter.adjust_for_status(instance.status, None)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    if instance.available_copies == 0:
+        CirculationCounter.adjust(zero_availability_books=-1)
+
+
+@receiver(post_delete, sender=BookCopy)
+def copy_deleted(sender, instance, **kwargs):
+    """Take a deleted copy out of its branch's stock"""
+    stock.move_copy(instance.book_id, instance.branch_id, None, shelved=instance.status == BookCopy.AVAILABLE)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=BookLoan)
+def record_change(sender, instance, raw=False, **kwargs):
+    """Append the write to the changes feed (core.changes)"""
+    if not raw:
+        model = ChangeRecord.BOOK if sender is Book else ChangeRecord.LOAN
+        changes.record(model, instance.pk, changed_at=instance.updated_at)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=BookLoan)
+def record_deletion(sender, instance, **kwargs):
+    model = ChangeRecord.BOOK if sender is Book else ChangeRecord.LOAN
+    changes.record(model, instance.pk, deleted=True)
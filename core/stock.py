@@ -0,0 +1,99 @@
+"""
+Per-branch stock
+
+BookStock rows split a book's copies between branches. Checkouts and
+returns adjust the row of the branch involved in the same outbox handler
+that adjusts the library-wide Book counts (library.handlers), and
+transfers move shelved copies from one branch to another. Every change
+is a single conditional UPDATE, so concurrent desks never drive a count
+below zero.
+
+Stock rows come from the copies: adding a BookCopy at a branch, or moving
+it to another one outside circulation, counts it there, and sending a copy
+to maintenance or marking it lost takes it off the shelf (BookCopy.save).
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import BookStock, StockTransfer
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+def stock_row(book_id, branch_id):
+    return BookStock.objects.filter(book_id=book_id, branch_id=branch_id)
+
+
+def add_copies(book_id, branch_id, total=0, available=0):
+    """Add copies to a branch, creating its stock row on first use"""
+    if not stock_row(book_id, branch_id).update(
+        total_copies=F('total_copies') + total, available_copies=F('available_copies') + available,
+    ):
+        BookStock.objects.get_or_create(book_id=book_id, branch_id=branch_id)
+        stock_row(book_id, branch_id).update(
+            total_copies=F('total_copies') + total, available_copies=F('available_copies') + available,
+        )
+
+
+def move_copy(book_id, from_branch_id, to_branch_id, shelved=True):
+    """Count a copy at ``to_branch_id`` instead of ``from_branch_id`` (either may be None)"""
+    available = 1 if shelved else 0
+    if from_branch_id is not None:
+        stock_row(book_id, from_branch_id).filter(total_copies__gt=0, available_copies__gte=available).update(
+            total_copies=F('total_copies') - 1, available_copies=F('available_copies') - available,
+        )
+    if to_branch_id is not None:
+        add_copies(book_id, to_branch_id, total=1, available=available)
+
+
+def check_out(book_id, branch_id):
+    """Take one copy off the branch's shelf; returns False if none was available"""
+    if stock_row(book_id, branch_id).filter(available_copies__gt=0).update(
+        available_copies=F('available_copies') - 1,
+    ):
+        return True
+    logger.warning('No shelved copy of book %s in the stock of branch %s', book_id, branch_id)
+    return False
+
+
+def check_in(book_id, branch_id, return_branch_id=None):
+    """
+    Shelve a returned copy
+
+    A copy returned to another branch stays there: it leaves the lending
+    branch's total and joins the returning branch's stock.
+    """
+    if return_branch_id is None or return_branch_id == branch_id:
+        if not stock_row(book_id, branch_id).filter(available_copies__lt=F('total_copies')).update(
+            available_copies=F('available_copies') + 1,
+        ):
+            logger.warning('Book %s returned to branch %s, which has no copy of it out', book_id, branch_id)
+        return
+    stock_row(book_id, branch_id).filter(total_copies__gt=0).update(total_copies=F('total_copies') - 1)
+    add_copies(book_id, return_branch_id, total=1, available=1)
+
+
+def transfer(book_id, from_branch_id, to_branch_id, copies, user=None):
+    """Move ``copies`` shelved copies between branches; returns the StockTransfer"""
+    if copies <= 0:
+        raise ValueError('copies must be positive')
+    if from_branch_id == to_branch_id:
+        raise ValueError('Source and destination branches must differ')
+    with transaction.atomic():
+        moved = stock_row(book_id, from_branch_id).filter(available_copies__gte=copies).update(
+            total_copies=F('total_copies') - copies, available_copies=F('available_copies') - copies,
+        )
+        if not moved:
+            raise InsufficientStock(f'Fewer than {copies} available copies at the source branch')
+        add_copies(book_id, to_branch_id, total=copies, available=copies)
+        return StockTransfer.objects.create(
+            book_id=book_id, from_branch_id=from_branch_id, to_branch_id=to_branch_id,
+            copies=copies, created_by=user,
+        )
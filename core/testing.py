@@ -0,0 +1,16 @@
+"""
+Test runner helpers
+"""
+
+from django.test.runner import DiscoverRunner
+
+SCALE_TAG = 'scale'
+
+
+class ScaleAwareRunner(DiscoverRunner):
+    """Skip tests tagged 'scale' unless they are asked for with --tag scale"""
+
+    def __init__(self, *args, tags=None, exclude_tags=None, **kwargs):
+        if SCALE_TAG not in (tags or ()):
+            exclude_tags = {*(exclude_tags or ()), SCALE_TAG}
+        super().__init__(*args, tags=tags, exclude_tags=exclude_tags, **kwargs)
@@ -1,3 +1,948 @@
-from django.test import TestCase
+import gc
+import gzip
+import socketserver
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Count, F, Q
+from django.http import HttpResponse, JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.functional import empty
+from rest_framework.test import APIClient
+
+from bookloan import compression, metrics
+from bookloan.cache import InvalidationBus, LocalLRU, TieredCache
+from bookloan.db_routers import PrimaryReplicaRouter, replica_reads
+from bookloan.middleware import (
+    CompressionMiddleware,
+    MetricsMiddleware,
+    PerformanceMiddleware,
+    ReplicaRoutingMiddleware,
+)
+from core import archive, factories, history, inventory, outbox, overdue, reminders
+from core.models import (
+    Book, BookAvailabilitySnapshot, BookCopy, BookLoan, BookLoanArchive, Branch, ChangeRecord, CirculationCounter,
+    LoanEvent, OutboxEvent,
+)
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """
+    Minimal Redis-protocol server for cache tests
+
+    Implements the subset of commands used by Django's RedisCache and the
+    L1 invalidation bus: strings with expiry, MULTI/EXEC and pub/sub.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeRedisHandler)
+        self.data = {}
+        self.expiry = {}
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f'redis://{host}:{port}/0'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def alive(self, key):
+        expires_at = self.expiry.get(key)
+        if expires_at is not None and expires_at < time.time():
+            self.data.pop(key, None)
+            self.expiry.pop(key, None)
+        return key in self.data
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.queued = None
+        while True:
+            command = self.read_command()
+            if command is None:
+                break
+            name = command[0].decode().upper()
+            if self.queued is not None and name not in ('EXEC', 'DISCARD'):
+                self.queued.append(command)
+                self.wfile.write(b'+QUEUED\r\n')
+                continue
+            self.wfile.write(self.execute(name, command[1:]))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        parts = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            parts.append(self.rfile.read(length + 2)[:-2])
+        return parts
+
+    def execute(self, name, args):
+        server = self.server
+        with server.lock:
+            if name == 'MULTI':
+                self.queued = []
+                return b'+OK\r\n'
+            if name == 'EXEC':
+                queued, self.queued = self.queued, None
+                replies = [self.execute(c[0].decode().upper(), c[1:]) for c in queued]
+                return b'*%d\r\n' % len(replies) + b''.join(replies)
+            if name == 'GET':
+                return bulk(server.data[args[0]] if server.alive(args[0]) else None)
+            if name == 'MGET':
+                values = [server.data[k] if server.alive(k) else None for k in args]
+                return b'*%d\r\n' % len(values) + b''.join(bulk(v) for v in values)
+            if name == 'SET':
+                key, value, options = args[0], args[1], [o.upper() for o in args[2:]]
+                if b'NX' in options and server.alive(key):
+                    return bulk(None)
+                server.data[key] = value
+                server.expiry.pop(key, None)
+                if b'EX' in options:
+                    seconds = int(options[options.index(b'EX') + 1])
+                    server.expiry[key] = time.time() + seconds
+                return b'+OK\r\n'
+            if name == 'MSET':
+                for key, value in zip(args[::2], args[1::2]):
+                    server.data[key] = value
+                    server.expiry.pop(key, None)
+                return b'+OK\r\n'
+            if name == 'DEL':
+                removed = sum(1 for k in args if server.alive(k) and server.data.pop(k) is not None)
+                return b':%d\r\n' % removed
+            if name == 'EXISTS':
+                return b':%d\r\n' % sum(1 for k in args if server.alive(k))
+            if name == 'INCRBY':
+                value = int(server.data[args[0]]) + int(args[1]) if server.alive(args[0]) else int(args[1])
+                server.data[args[0]] = str(value).encode()
+                return b':%d\r\n' % value
+            if name == 'EXPIRE':
+                if not server.alive(args[0]):
+                    return b':0\r\n'
+                server.expiry[args[0]] = time.time() + int(args[1])
+                return b':1\r\n'
+            if name == 'PERSIST':
+                return b':%d\r\n' % (server.expiry.pop(args[0], None) is not None)
+            if name == 'FLUSHDB':
+                server.data.clear()
+                server.expiry.clear()
+                return b'+OK\r\n'
+            if name == 'PUBLISH':
+                listeners = list(server.subscribers.get(args[0], ()))
+                message = [b'message', args[0], args[1]]
+                for handler in listeners:
+                    handler.wfile.write(b'*3\r\n' + b''.join(bulk(part) for part in message))
+                return b':%d\r\n' % len(listeners)
+            if name == 'SUBSCRIBE':
+                replies = []
+                for count, channel in enumerate(args, start=1):
+                    server.subscribers.setdefault(channel, []).append(self)
+                    replies.append(b'*3\r\n' + bulk(b'subscribe') + bulk(channel) + b':%d\r\n' % count)
+                return b''.join(replies)
+            # PING, CLIENT SETINFO, SELECT and anything else the client sends on connect
+            return b'+OK\r\n' if name != 'PING' else b'+PONG\r\n'
+
+
+def bulk(value):
+    if value is None:
+        return b'$-1\r\n'
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+class LocalLRUTest(SimpleTestCase):
+
+    def test_evicts_least_recently_used(self):
+        local = LocalLRU(max_entries=2, timeout=60)
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+        local.set('c', 3)
+        self.assertEqual(local.get('a'), 1)
+        self.assertIs(local.get('b', None), None)
+        self.assertEqual(local.get('c'), 3)
+
+    def test_ttl_is_capped_by_l1_timeout(self):
+        local = LocalLRU(max_entries=2, timeout=0.01)
+        local.set('a', 1, timeout=3600)
+        time.sleep(0.02)
+        self.assertIs(local.get('a', None), None)
+
+
+class TieredCacheTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.redis = FakeRedisServer().start()
+        tiered = {
+            'BACKEND': 'bookloan.cache.TieredCache',
+            'OPTIONS': {'L2_ALIAS': 'shared', 'L1_TIMEOUT': 60, 'CHANNEL': 'test:invalidate'},
+        }
+        # Distinct locations: two L1s standing in for two processes
+        cls.settings_override = override_settings(CACHES={
+            'default': {**tiered, 'LOCATION': 'test-process-1'},
+            'worker': {**tiered, 'LOCATION': 'test-process-2'},
+            'shared': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': cls.redis.url,
+                'OPTIONS': {'protocol': 2},
+            },
+        })
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.redis.stop()
+        super().tearDownClass()
+
+    def wait_for(self, predicate):
+        deadline = time.monotonic() + 2
+        while not predicate() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return predicate()
+
+    def test_reads_are_served_from_l1(self):
+        cache = caches['default']
+        cache.set('book:1', {'title': 'Dune'})
+        caches['shared'].set('book:1', {'title': 'stale'})
+        self.assertEqual(cache.get('book:1'), {'title': 'Dune'})
+
+    def test_l1_miss_falls_through_to_l2(self):
+        caches['shared'].set('book:2', 'from-l2')
+        self.assertEqual(caches['default'].get('book:2'), 'from-l2')
+        self.assertEqual(caches['default'].get('missing', 'default'), 'default')
+
+    def test_writes_invalidate_other_l1s(self):
+        first, second = caches['default'], caches['worker']
+        self.assertIsInstance(second, TieredCache)
+        first.set('book:3', 'v1')
+        self.assertEqual(second.get('book:3'), 'v1')
+
+        first.set('book:3', 'v2')
+        self.assertTrue(self.wait_for(lambda: second.get('book:3') == 'v2'))
+
+        first.delete('book:3')
+        self.assertTrue(self.wait_for(lambda: second.get('book:3') is None))
+
+    def test_threads_share_the_l1(self):
+        cache = caches['default']
+        cache.set('book:4', 'v1')
+        seen = {}
+
+        def read():
+            seen['cache'] = caches['default']
+            seen['value'] = seen['cache']._local.get(cache.make_and_validate_key('book:4'))
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        self.assertIsNot(seen['cache'], cache)
+        self.assertIs(seen['cache']._local, cache._local)
+        self.assertEqual(seen['value'], 'v1')
+
+    def test_get_many_combines_tiers(self):
+        cache = caches['default']
+        cache.set('a', 1)
+        caches['shared'].set('b', 2)
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+
+
+class PerformanceMiddlewareTest(SimpleTestCase):
+
+    @override_settings(API_LOGGING={'LOG_PERFORMANCE': True})
+    def test_reports_timings(self):
+        middleware = PerformanceMiddleware(lambda request: HttpResponse('ok'))
+        with self.assertLogs('bookloan.performance', level='INFO') as logs:
+            response = middleware(RequestFactory().get('/api/books/'))
+        self.assertIn('queries=0', logs.output[0])
+        self.assertIn('app;dur=', response['Server-Timing'])
+
+    @override_settings(API_LOGGING={'LOG_PERFORMANCE': False})
+    def test_disabled(self):
+        middleware = PerformanceMiddleware(lambda request: HttpResponse('ok'))
+        self.assertNotIn('Server-Timing', middleware(RequestFactory().get('/')))
+
+
+@override_settings(DATABASE_REPLICA_ALIASES=['replica_0'], DATABASE_REPLICA_LAG=7)
+class ReplicaRoutingTest(TransactionTestCase):
+    # Not TestCase: the router keeps reads inside a transaction on the primary
+    databases = {'default', 'replica_0'}
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def count_books(self, request):
+        """Serve ``request`` through the middleware, returning the aliases queried"""
+        seen = []
+
+        def view(request):
+            with (
+                CaptureQueriesContext(connections['default']) as primary,
+                CaptureQueriesContext(connections['replica_0']) as replica,
+            ):
+                Book.objects.count()
+            seen.extend(['default'] * len(primary) + ['replica_0'] * len(replica))
+            return HttpResponse('ok')
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return seen, response
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+
+    def test_safe_reads_use_replicas(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Book), 'replica_0')
+
+    def test_read_after_write_sticks_to_primary(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(Book), 'default')
+            self.assertEqual(self.router.db_for_read(Book), 'default')
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Book), 'replica_0')
+
+    @override_settings(DATABASE_REPLICA_ALIASES=[])
+    def test_without_replicas(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Book), 'default')
+
+    def test_middleware_routes_get_requests_to_replicas(self):
+        seen, response = self.count_books(RequestFactory().get('/api/books/'))
+        self.assertEqual(seen, ['replica_0'])
+        self.assertNotIn(ReplicaRoutingMiddleware.cookie_name, response.cookies)
+
+    def test_middleware_pins_client_after_write(self):
+        middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse('ok'))
+        response = middleware(RequestFactory().post('/api/book-loans/'))
+        cookie = response.cookies[ReplicaRoutingMiddleware.cookie_name]
+        self.assertEqual(cookie['max-age'], 7)
+
+        request = RequestFactory().get('/api/books/')
+        request.COOKIES[ReplicaRoutingMiddleware.cookie_name] = '1'
+        seen, _ = self.count_books(request)
+        self.assertEqual(seen, ['default'])
+
+    @override_settings(METRICS={'ENABLED': True, 'MULTIPROCESS_DIR': None})
+    def test_replica_queries_are_counted(self):
+        def view(request):
+            Book.objects.count()
+            return HttpResponse('ok')
+
+        key = (metrics.DB_QUERIES.name, ('unmatched',))
+        before = metrics.registry.snapshot().get(key, 0)
+        MetricsMiddleware(ReplicaRoutingMiddleware(view))(RequestFactory().get('/api/books/'))
+        self.assertEqual(metrics.registry.snapshot()[key] - before, 1)
+
+
+class OutboxTest(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        outbox.register('test.event')(self.calls.append)
+        self.addCleanup(outbox._handlers.pop, 'test.event')
+
+    def test_claims_are_exclusive(self):
+        for i in range(5):
+            outbox.publish('test.event', number=i)
+        first = outbox.claim_batch(3, 'worker-a')
+        second = outbox.claim_batch(3, 'worker-b')
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse({e.id for e in first} & {e.id for e in second})
+
+    def test_process_batch_runs_handlers(self):
+        outbox.publish('test.event', number=1)
+        self.assertEqual(outbox.process_batch(), (1, 0))
+        self.assertEqual(self.calls[0].payload, {'number': 1})
+        self.assertEqual(OutboxEvent.objects.get().status, 'done')
+        self.assertEqual(outbox.lag(), 0)
+
+    @override_settings(OUTBOX={'MAX_ATTEMPTS': 2, 'BACKOFF_BASE': 2})
+    def test_failures_back_off_then_give_up(self):
+        def fail(event):
+            raise RuntimeError('boom')
+
+        outbox.register('test.failing')(fail)
+        self.addCleanup(outbox._handlers.pop, 'test.failing')
+        event = outbox.publish('test.failing')
+
+        self.assertEqual(outbox.process_batch(), (0, 1))
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 1)
+        self.assertGreater(event.available_at, timezone.now())
+        self.assertEqual(outbox.process_batch(), (0, 0))  # not due yet
+
+        OutboxEvent.objects.update(available_at=timezone.now())
+        outbox.process_batch()
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'failed')
+        self.assertIn('boom', event.last_error)
+
+    def test_done_commits_with_handler_effects(self):
+        book = Book.objects.create(title='Dune', author='Herbert', isbn='1', available_copies=0)
+
+        def restock(event):
+            Book.objects.filter(pk=book.pk).update(available_copies=F('available_copies') + 1)
+
+        outbox.register('test.restock')(restock)
+        self.addCleanup(outbox._handlers.pop, 'test.restock')
+        event = outbox.publish('test.restock')
+
+        # The status save fails: the handler's effect must roll back with it
+        with mock.patch.object(OutboxEvent, 'save', side_effect=[RuntimeError('crash'), None]):
+            self.assertFalse(outbox.process_event(event))
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 0)
+
+        OutboxEvent.objects.update(available_at=timezone.now())
+        self.assertTrue(outbox.process_event(OutboxEvent.objects.get()))
+        # Redelivering an event that is already done runs nothing
+        self.assertTrue(outbox.process_event(event))
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 1)
+
+    def test_run_worker_once(self):
+        outbox.publish('test.event')
+        out = StringIO()
+        call_command('run_worker', '--once', stdout=out)
+        self.assertIn('processed=1 failed=0', out.getvalue())
+
+    def test_return_updates_inventory_through_outbox(self):
+        user = User.objects.create_user('reader')
+        book = Book.objects.create(title='Dune', author='Herbert', isbn='1', total_copies=1, available_copies=0)
+        loan = BookLoan.objects.create(user=user, book=book, status='active', due_date=date.today() + timedelta(days=14))
+        self.client.force_login(user)
+
+        response = self.client.post(f'/api/book-loans/{loan.id}/return_book/')
+        self.assertEqual(response.status_code, 200)
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 0)
+
+        outbox.process_batch()
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 1)
+
+
+class SendRemindersTest(TestCase):
+
+    def setUp(self):
+        self.today = date(2025, 10, 1)
+        self.alice = User.objects.create_user('alice', email='alice@example.com', first_name='Alice')
+        self.bob = User.objects.create_user('bob', email='bob@example.com')
+        books = [
+            Book.objects.create(title=f'Book {i}', author='Author', isbn=str(i)) for i in range(4)
+        ]
+        self.loan(self.alice, books[0], self.today - timedelta(days=2))
+        self.loan(self.alice, books[1], self.today + timedelta(days=3))
+        self.loan(self.bob, books[2], self.today + timedelta(days=3))
+        self.loan(self.bob, books[3], self.today + timedelta(days=10))  # not due yet
+
+    def loan(self, user, book, due_date, status='active'):
+        BookLoan.objects.create(user=user, book=book, status=status, due_date=due_date)
+
+    def test_loans_marked_overdue_are_included(self):
+        book = Book.objects.create(title='Book 4', author='Author', isbn='4')
+        self.loan(self.bob, book, self.today - timedelta(days=5), status='overdue')
+        digests = list(reminders.iter_digests(3, self.today))
+        self.assertEqual(digests[1]['overdue'][0]['title'], 'Book 4')
+
+    def test_one_digest_per_user(self):
+        digests = list(reminders.iter_digests(3, self.today))
+        self.assertEqual([d['user_id'] for d in digests], [self.alice.id, self.bob.id])
+        self.assertEqual(digests[0]['overdue'][0]['days_overdue'], 2)
+        self.assertEqual(len(digests[0]['due_soon']), 1)
+        self.assertEqual(len(digests[1]['due_soon']), 1)
+
+    def test_console_sender_batches(self):
+        out = StringIO()
+        sender = reminders.ConsoleSender(out)
+        self.assertEqual(reminders.send_reminders(sender, 3, self.today, batch_size=1), (2, 2, 0))
+        self.assertIn('Hello Alice', out.getvalue())
+        self.assertIn('Book 0 by Author (due 2025-09-29, 2 days overdue)', out.getvalue())
+
+    def test_email_sender_uses_one_connection(self):
+        from django.core import mail
+        self.assertEqual(reminders.send_reminders(reminders.EmailSender(), 3, self.today), (2, 2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[1].to, ['bob@example.com'])
+
+    @override_settings(REMINDERS={'SENDER': 'core.reminders.EmailSender'})
+    def test_command_reports_recipients_and_skipped_users(self):
+        carol = User.objects.create_user('carol')
+        self.loan(carol, Book.objects.create(title='Book 4', author='Author', isbn='4'), self.today)
+        out = StringIO()
+        with self.assertLogs('core.reminders', level='WARNING') as logs:
+            call_command('send_reminders', days=0, stdout=out)
+        self.assertIn('Sent 2 reminder(s) to 2 user(s)', out.getvalue())
+        self.assertIn('Skipped 1 user(s) without an email address', out.getvalue())
+        self.assertIn(f'User {carol.id}', logs.output[0])
+
+
+class ArchiveLoansTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('reader')
+        today = timezone.now().date()
+        for i in range(5):
+            book = Book.objects.create(title=f'Book {i}', author='Author', isbn=str(i))
+            BookLoan.objects.create(
+                user=user, book=book, status='returned',
+                loan_date=today - timedelta(days=800 + i),
+                due_date=today - timedelta(days=786 + i),
+                return_date=today - timedelta(days=790 + i),
+            )
+        self.recent = BookLoan.objects.create(
+            user=user, book=book, status='active', due_date=today + timedelta(days=14),
+        )
+
+    def test_archive_loans_command_moves_old_closed_loans(self):
+        out = StringIO()
+        call_command('archive_loans', '--older-than', '365', '--batch-size', '2', stdout=out)
+        self.assertIn('Archived 5 loan(s) returned before', out.getvalue())
+        self.assertEqual(list(BookLoan.objects.values_list('id', flat=True)), [self.recent.id])
+        self.assertEqual(BookLoanArchive.objects.count(), 5)
+        self.assertEqual(BookLoanArchive.objects.filter(status='returned').count(), 5)
+
+    def test_copy_and_branch_are_archived(self):
+        loan = BookLoan.objects.filter(status='returned').first()
+        branch = Branch.objects.create(code='N', name='North')
+        loan.copy = BookCopy.objects.create(book=loan.book, barcode='N1', branch=branch)
+        loan.branch = branch
+        loan.save()
+        list(archive.archive_closed_loans())
+        archived = BookLoanArchive.objects.get(pk=loan.pk)
+        self.assertEqual((archived.copy_id, archived.branch_id), (loan.copy_id, branch.id))
+
+    def test_archiving_leaves_no_tombstones(self):
+        ChangeRecord.objects.all().delete()
+        cutoff = timezone.now().date() - timedelta(days=365)
+        with self.assertNumQueries(8):
+            # savepoint, select, insert, one delete, release; then the empty batch
+            list(archive.archive_closed_loans(cutoff))
+        self.assertFalse(ChangeRecord.objects.exists())
+
+    def test_batches(self):
+        cutoff = timezone.now().date() - timedelta(days=365)
+        self.assertEqual(list(archive.archive_closed_loans(cutoff, batch_size=2)), [2, 2, 1])
+
+
+class LoanEventTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        self.book = Book.objects.create(title='Dune', author='Herbert', isbn='1', total_copies=3)
+
+    def loan(self, **kwargs):
+        return BookLoan.objects.create(user=self.user, book=self.book, due_date=date(2025, 1, 15), **kwargs)
+
+    def kinds(self):
+        return list(LoanEvent.objects.values_list('kind', flat=True))
+
+    def test_transitions_are_recorded(self):
+        loan = self.loan(status='pending')
+        self.assertEqual(self.kinds(), [])
+        loan = BookLoan.objects.get(pk=loan.pk)
+        loan.status = 'active'
+        loan.save()
+        loan.extend_due_date()
+        loan.mark_returned()
+        self.assertEqual(self.kinds(), [LoanEvent.CHECKOUT, LoanEvent.RENEW, LoanEvent.RETURN])
+
+    def test_save_with_deferred_state(self):
+        loan = self.loan(status='active')
+        partial = BookLoan.objects.only('id', 'user').get(pk=loan.pk)
+        partial.notes = 'Cover torn'
+        partial.save()
+        partial = BookLoan.objects.only('id', 'user').get(pk=loan.pk)
+        partial.status = 'returned'
+        partial.save()
+        self.assertEqual(self.kinds(), [LoanEvent.CHECKOUT, LoanEvent.RETURN])
+        self.assertEqual(CirculationCounter.as_dict()[CirculationCounter.ACTIVE_LOANS], 0)
+
+    def test_events_are_append_only(self):
+        self.loan(status='active')
+        event = LoanEvent.objects.get()
+        with self.assertRaises(ValueError):
+            event.save()
+        with self.assertRaises(ValueError):
+            event.delete()
+
+    def test_availability_from_snapshot_and_replay(self):
+        first = self.loan(status='active')
+        LoanEvent.objects.update(occurred_at=timezone.make_aware(datetime(2025, 1, 1)))
+        self.assertEqual(history.take_snapshots(timezone.make_aware(datetime(2025, 1, 2))), 1)
+        self.assertEqual(history.take_snapshots(timezone.make_aware(datetime(2025, 1, 2, 1))), 0)
+
+        second = BookLoan.objects.create(
+            user=User.objects.create_user('other'), book=self.book, status='active', due_date=date(2025, 2, 1),
+        )
+        LoanEvent.objects.filter(loan_id=second.pk).update(occurred_at=timezone.make_aware(datetime(2025, 1, 5)))
+
+        at = timezone.make_aware(datetime(2025, 1, 10))
+        self.assertEqual(history.copies_out_at(self.book.id, at)[0], 2)
+        copies_out, snapshot_at, replayed = history.copies_out_at(self.book.id, at)
+        self.assertEqual(snapshot_at, timezone.make_aware(datetime(2025, 1, 2)))
+        self.assertEqual(replayed, 1)
+        self.assertEqual(history.copies_out_at(self.book.id, timezone.make_aware(datetime(2025, 1, 3)))[0], 1)
+        self.assertEqual(history.copies_out_at(self.book.id, timezone.make_aware(datetime(2024, 12, 31)))[0], 0)
+
+        self.client.force_login(self.user)
+        response = self.client.get(f'/api/books/{self.book.id}/availability/', {'at': '2025-01-10'})
+        self.assertEqual(response.json()['copiesOut'], 2)
+        self.assertEqual(response.json()['availableCopies'], 1)
+
+    def test_snapshots_leave_unsettled_events_to_replay(self):
+        self.loan(status='active')
+        self.assertEqual(history.take_snapshots(), 0)
+        LoanEvent.objects.update(occurred_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(history.take_snapshots(), 1)
+        self.assertLess(BookAvailabilitySnapshot.objects.get().taken_at, timezone.now() - timedelta(seconds=30))
+
+    def test_backfill_of_loans_out_before_the_log(self):
+        backfill = import_module('core.migrations.0019_backfill_checkout_events').backfill_checkout_events
+        loan = self.loan(status='active')
+        self.loan(status='returned')
+        LoanEvent.objects.all().delete()
+        backfill(django_apps, None)
+        backfill(django_apps, None)
+        self.assertEqual(list(LoanEvent.objects.values_list('loan_id', 'kind')), [(loan.pk, LoanEvent.CHECKOUT)])
+        self.assertEqual(history.copies_out_at(self.book.id, timezone.now())[0], 1)
+
+    def test_snapshot_command(self):
+        self.loan(status='active')
+        LoanEvent.objects.update(occurred_at=timezone.now() - timedelta(hours=1))
+        out = StringIO()
+        call_command('snapshot_availability', stdout=out)
+        self.assertIn('Created 1 snapshot(s)', out.getvalue())
+        self.assertEqual(BookAvailabilitySnapshot.objects.get().copies_out, 1)
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.requests = self.registry.counter('requests_total', 'Requests', ('route',))
+        self.latency = self.registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+
+    def test_thread_shards_are_merged(self):
+        def work():
+            for _ in range(100):
+                self.requests.inc(route='books')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.latency.observe(0.05)
+        self.latency.observe(3)
+
+        text = self.registry.render()
+        self.assertIn('requests_total{route="books"} 400', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn('latency_seconds_count 2', text)
+
+    def test_exited_threads_are_retired(self):
+        threads = [threading.Thread(target=self.requests.inc, kwargs={'route': 'books'}) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        gc.collect()
+        self.assertEqual(len(self.registry._shards), 0)
+        self.assertIn('requests_total{route="books"} 50', self.registry.render())
+
+    def test_workers_are_aggregated(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS={'MULTIPROCESS_DIR': directory}):
+            other = self.registry.snapshot_path(directory, pid=1)
+            other.write_text('[["requests_total", ["books"], 5]]')
+            self.requests.inc(route='books')
+            self.assertIn('requests_total{route="books"} 6', self.registry.render())
+
+    def test_circulation_counters_are_maintained(self):
+        user = User.objects.create_user('reader')
+        book = Book.objects.create(title='Dune', author='Herbert', isbn='1', total_copies=1, available_copies=1)
+        loan = BookLoan.objects.create(user=user, book=book, status='active', due_date=date(2025, 1, 15))
+        book.available_copies = 0
+        book.save()
+        self.assertEqual(CirculationCounter.as_dict(), {
+            'active_loans': 1, 'overdue_loans': 0, 'zero_availability_books': 1,
+        })
+
+        loan.status = 'overdue'
+        loan.save()
+        loan.delete()
+        book.delete()
+        self.assertEqual(CirculationCounter.as_dict(), {
+            'active_loans': 0, 'overdue_loans': 0, 'zero_availability_books': 0,
+        })
+
+    def test_counters_are_sharded(self):
+        for _ in range(40):
+            CirculationCounter.adjust(active_loans=1)
+        self.assertGreater(CirculationCounter.objects.filter(name__startswith='active_loans', value__gt=0).count(), 1)
+        self.assertEqual(CirculationCounter.as_dict()['active_loans'], 40)
+        CirculationCounter.recount()
+        self.assertEqual(CirculationCounter.as_dict()['active_loans'], 0)
+        self.assertFalse(CirculationCounter.objects.filter(name__contains=':', value__gt=0).exists())
+
+    def test_mark_overdue_feeds_the_gauge(self):
+        user = User.objects.create_user('reader')
+        book = Book.objects.create(title='Dune', author='Herbert', isbn='1', total_copies=3, available_copies=3)
+        other = Book.objects.create(title='Emma', author='Austen', isbn='2')
+        today = timezone.now().date()
+        late = BookLoan.objects.create(user=user, book=book, status='active', due_date=today - timedelta(days=1))
+        BookLoan.objects.create(user=user, book=other, status='active', due_date=today)
+
+        self.assertEqual(list(overdue.mark_overdue(today, batch_size=1)), [1])
+        late.refresh_from_db()
+        self.assertEqual(late.status, 'overdue')
+        self.assertEqual(LoanEvent.objects.filter(loan_id=late.pk).last().kind, LoanEvent.OVERDUE)
+        self.assertTrue(ChangeRecord.objects.filter(object_id=late.pk, model=ChangeRecord.LOAN).exists())
+        gauges = metrics.circulation_gauges()
+        self.assertEqual(gauges['bookloan_overdue_loans'][1], 1)
+        self.assertEqual(gauges['bookloan_active_loans'][1], 1)
+        self.assertEqual(list(overdue.mark_overdue(today)), [])
+
+        out = StringIO()
+        call_command('mark_overdue', stdout=out)
+        self.assertIn('Marked 0 loan(s) overdue', out.getvalue())
+
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.post(f'/api/book-loans/{late.pk}/return_book/').status_code, 200)
+        self.assertEqual(metrics.circulation_gauges()['bookloan_overdue_loans'][1], 0)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/books/')
+        with override_settings(METRICS={'AUTH_TOKEN': 'secret'}):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        text = response.content.decode()
+        self.assertIn('bookloan_http_requests_total{method="GET",route="api:book-list",status="', text)
+        self.assertIn('bookloan_http_request_duration_seconds_bucket{route="api:book-list",le="+Inf"}', text)
+        self.assertIn('bookloan_active_loans 0', text)
+
+
+class CompressionTest(SimpleTestCase):
+
+    def middleware(self, payload):
+        return CompressionMiddleware(lambda request: JsonResponse(payload))
+
+    def test_choose_encoding(self):
+        self.assertEqual(compression.choose_encoding('gzip, br', ('br', 'gzip')), 'br')
+        self.assertEqual(compression.choose_encoding('br;q=0, gzip', ('br', 'gzip')), 'gzip')
+        self.assertEqual(compression.choose_encoding('*', ('gzip',)), 'gzip')
+        self.assertIsNone(compression.choose_encoding('identity', ('br', 'gzip')))
+        self.assertIsNone(compression.choose_encoding('', ('gzip',)))
+
+    def test_large_json_is_compressed(self):
+        payload = {'results': [{'title': 'Dune', 'author': 'Herbert'}] * 200}
+        request = RequestFactory().get('/api/books/', HTTP_ACCEPT_ENCODING='gzip')
+        response = self.middleware(payload)(request)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn(b'Herbert', gzip.decompress(response.content))
+
+    def test_small_or_unaccepted_is_left_alone(self):
+        request = RequestFactory().get('/api/books/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(self.middleware({'ok': True})(request).has_header('Content-Encoding'))
+        request = RequestFactory().get('/api/books/')
+        response = self.middleware({'results': ['x' * 50] * 100})(request)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_collectstatic_writes_compressed_variants(self):
+        with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as root:
+            (Path(source) / 'app.js').write_text('console.log("bookloan");\n' * 200)
+            with override_settings(STATICFILES_DIRS=[source], STATIC_ROOT=root):
+                staticfiles_storage._wrapped = empty
+                try:
+                    call_command('collectstatic', interactive=False, verbosity=0)
+                    hashed = staticfiles_storage.stored_name('app.js')
+                finally:
+                    staticfiles_storage._wrapped = empty
+
+            self.assertRegex(hashed, r'^app\.[0-9a-f]{12}\.js$')
+            self.assertTrue((Path(root) / f'{hashed}.gz').exists())
+
+            request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+            response = compression.serve_precompressed(request, hashed, document_root=root)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/javascript')
+            self.assertEqual(response['Cache-Control'], compression.FAR_FUTURE)
+            body = gzip.decompress(b''.join(response.streaming_content))
+            self.assertTrue(body.startswith(b'console.log'))
+
+            response = compression.serve_precompressed(RequestFactory().get('/'), 'app.js', document_root=root)
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertFalse(response.has_header('Cache-Control'))
+
+
+class ApiWorkerProfileTest(SimpleTestCase):
+
+    def test_ui_apps_and_middleware_are_dropped(self):
+        from bookloan import settings_api_worker as profile
+
+        self.assertNotIn('django.contrib.admin', profile.INSTALLED_APPS)
+        self.assertNotIn('django_extensions', profile.INSTALLED_APPS)
+        self.assertIn('rest_framework.authtoken', profile.INSTALLED_APPS)
+        self.assertNotIn('django.contrib.sessions.middleware.SessionMiddleware', profile.MIDDLEWARE)
+        self.assertEqual(profile.REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'], ['rest_framework.renderers.JSONRenderer'])
+
+    @override_settings(ROOT_URLCONF='bookloan.urls_api')
+    def test_api_urlconf(self):
+        self.assertEqual(self.client.get('/api/books/').status_code, 401)
+        self.assertEqual(self.client.get('/django-admin/').status_code, 404)
+
+    def test_bus_forgets_parent_state_after_fork(self):
+        local = LocalLRU(max_entries=10, timeout=60)
+        local.set('key', 'value')
+        bus = InvalidationBus(client=None, channel='test')
+        bus._listeners.add(local)
+        bus._thread = object()
+        bus.after_fork()
+        self.assertIsNone(bus._thread)
+        self.assertEqual(len(local), 0)
+
+
+class SeedLibraryTest(TestCase):
+
+    def test_seeds_consistent_library(self):
+        summary = factories.seed_library(loans=5000, seed=1)
+
+        self.assertEqual(BookLoan.objects.count(), 5000)
+        self.assertEqual(summary['books'], Book.objects.count())
+        statuses = dict(BookLoan.objects.values_list('status').annotate(n=Count('id')))
+        self.assertGreater(statuses['returned'], statuses['active'])
+        self.assertFalse(BookLoan.objects.filter(status='overdue', due_date__gte=timezone.now().date()).exists())
+        self.assertFalse(BookLoan.objects.filter(status='returned', return_date__isnull=True).exists())
+        self.assertEqual(summary[CirculationCounter.ACTIVE_LOANS], statuses['active'])
+        open_loans = Count('bookloan', filter=Q(bookloan__status__in=factories.OPEN_STATUSES))
+        for book in Book.objects.annotate(out=open_loans):
+            self.assertEqual(book.available_copies, book.total_copies - book.out)
+
+    def test_popularity_is_skewed(self):
+        factories.seed_library(loans=5000, books=100, seed=2)
+
+        counts = sorted(Book.objects.annotate(n=Count('bookloan')).values_list('n', flat=True), reverse=True)
+        self.assertGreater(sum(counts[:10]), sum(counts[50:]))
+
+    def test_indexes_are_rebuilt(self):
+        def indexes():
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(cursor, BookLoan._meta.db_table)
+            return {name for name, info in constraints.items() if info['index']}
+
+        before = indexes()
+        factories.seed_library(loans=100, seed=3)
+        after = indexes()
+        self.assertEqual(before, after)
+        self.assertIn('bookloan_status_due_idx', after)
+
+
+@tag('scale')
+class LibraryAtScaleTest(TestCase):
+    """Production-sized data; run with ``manage.py test --tag scale`` or ``pytest -m scale``"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.summary = factories.seed_library(loans=1_000_000)
+
+    def test_counters_match_table(self):
+        self.assertEqual(self.summary['loans'], BookLoan.objects.count())
+        counters = CirculationCounter.as_dict()
+        self.assertEqual(counters[CirculationCounter.ACTIVE_LOANS], BookLoan.objects.filter(status='active').count())
+        self.assertEqual(counters[CirculationCounter.OVERDUE_LOANS], BookLoan.objects.filter(status='overdue').count())
+
+    def test_overdue_query_uses_index(self):
+        queryset = BookLoan.objects.filter(status='active', due_date__lt=timezone.now().date())
+        self.assertIn('bookloan_status_due_idx', queryset.explain())
+
+    def test_loan_list_is_constant_in_queries(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('scale-reader'))
+        # COUNT for the paginator and one page; no per-row queries
+        with self.assertNumQueries(2):
+            response = client.get('/api/book-loans/?fields=id,status,due_date,book.title')
+        self.assertEqual(response.status_code, 200)
+
+    def test_reconcile_inventory(self):
+        drifted = list(Book.objects.order_by('?').values_list('id', flat=True)[:1000])
+        Book.objects.filter(id__in=drifted).update(available_copies=F('available_copies') + 1)
+        start = time.monotonic()
+        report = inventory.reconcile_inventory()
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual((report['drifted'], report['fixed']), (1000, 1000))
+        self.assertEqual(inventory.reconcile_inventory()['drifted'], 0)
+
+
+class ReconcileInventoryTest(TestCase):
+
+    def setUp(self):
+        self.readers = [User.objects.create_user(f'r{i}') for i in range(3)]
+
+    def book(self, total, available, open_loans):
+        book = Book.objects.create(title='T', author='A', isbn=str(Book.objects.count()),
+                                   total_copies=total, available_copies=available)
+        for reader in self.readers[:open_loans]:
+            BookLoan.objects.create(user=reader, book=book, status='active', loan_date=timezone.now().date())
+        BookLoan.objects.create(user=self.readers[0], book=book, status='returned', loan_date=timezone.now().date())
+        return book
+
+    def test_fixes_drift(self):
+        drifted = self.book(total=3, available=3, open_loans=1)
+        correct = self.book(total=2, available=1, open_loans=1)
+        overcommitted = self.book(total=1, available=1, open_loans=2)
+        CirculationCounter.recount()
+
+        out = StringIO()
+        call_command('reconcile_inventory', '--dry-run', stdout=out)
+        self.assertIn('Would fix 2', out.getvalue())
+        self.assertEqual(Book.objects.get(pk=drifted.pk).available_copies, 3)
+
+        # The aggregate, then one transaction (a savepoint here): lock, pending events, update,
+        # changes feed records and the counter
+        with self.assertNumQueries(8):
+            report = inventory.reconcile_inventory()
+        self.assertEqual(report['drift'], [(drifted.pk, 3, 2), (overcommitted.pk, 1, 0)])
+        self.assertEqual((report['checked'], report['fixed'], report['overcommitted']), (3, 2, 1))
+        self.assertEqual(Book.objects.get(pk=drifted.pk).available_copies, 2)
+        self.assertEqual(Book.objects.get(pk=correct.pk).available_copies, 1)
+        self.assertEqual(Book.objects.get(pk=overcommitted.pk).available_copies, 0)
+        self.assertEqual(CirculationCounter.as_dict()[CirculationCounter.ZERO_AVAILABILITY_BOOKS], 1)
+
+    def test_skips_books_with_pending_loan_events(self):
+        book = self.book(total=3, available=3, open_loans=1)
+        outbox.publish(inventory.LOAN_STATUS_CHANGED, book_id=book.pk, old_status='returned', new_status='active')
+        report = inventory.reconcile_inventory()
+        self.assertEqual((report['drifted'], report['fixed'], report['skipped']), (1, 0, 1))
+        self.assertEqual(Book.objects.get(pk=book.pk).available_copies, 3)
@@ -2,7 +2,9 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils import timezone
-from core.models import Book, BookLoan
+from core.models import Book, BookCopy, BookLoan, BookStock, Branch, StockTransfer
+
+from .changelist import CachedValuesListFilter, LargeTableAdminMixin
 
 
 @admin.register(Book)
@@ -38,25 +40,74 @@ class BookAdmin(admin.ModelAdmin):
     is_available.short_description = 'Available'
 
 
+@admin.register(Branch)
+class BranchAdmin(admin.ModelAdmin):
+    """Django Admin configuration for Branch model"""
+    list_display = ['code', 'name', 'address']
+    search_fields = ['code', 'name']
+
+
+@admin.register(BookStock)
+class BookStockAdmin(admin.ModelAdmin):
+    """Django Admin configuration for BookStock model"""
+    list_display = ['book', 'branch', 'total_copies', 'available_copies']
+    list_filter = ['branch']
+    search_fields = ['book__title', 'book__isbn']
+    raw_id_fields = ['book']
+
+
+@admin.register(StockTransfer)
+class StockTransferAdmin(admin.ModelAdmin):
+    """Django Admin configuration for StockTransfer model (read-only log; transfer via the API)"""
+    list_display = ['book', 'from_branch', 'to_branch', 'copies', 'created_by', 'created_at']
+    list_filter = ['from_branch', 'to_branch']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BookCopy)
+class BookCopyAdmin(admin.ModelAdmin):
+    """Django Admin configuration for BookCopy model"""
+    list_display = ['barcode', 'book', 'branch', 'status', 'location']
+    list_filter = ['status', 'branch']
+    search_fields = ['barcode', 'book__title', 'location']
+    readonly_fields = ['created_at', 'updated_at']
+    raw_id_fields = ['book']
+
+
+class BookAuthorFilter(CachedValuesListFilter):
+    """Loans by book author, with choices read from the books table"""
+    title = 'author'
+    parameter_name = 'author'
+    field_path = 'book__author'
+
+    def choices_queryset(self):
+        return Book.objects.order_by('author').values_list('author', flat=True).distinct()
+
+
 @admin.register(BookLoan)
-class BookLoanAdmin(admin.ModelAdmin):
+class BookLoanAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Django Admin configuration for BookLoan model"""
     list_display = [
         'book', 'user', 'status', 'loan_date', 'due_date', 
         'return_date', 'is_overdue_display', 'days_overdue_display'
     ]
-    list_filter = ['status', 'loan_date', 'due_date', 'book__author']
+    list_filter = ['status', 'loan_date', 'due_date', BookAuthorFilter]
     search_fields = [
         'user__username', 'user__first_name', 'user__last_name',
         'book__title', 'book__author'
     ]
     date_hierarchy = 'loan_date'
     readonly_fields = ['created_at', 'updated_at', 'loan_duration_display']
-    raw_id_fields = ['user', 'book']
+    raw_id_fields = ['user', 'book', 'copy']
 
     fieldsets = (
         ('Loan Information', {
-            'fields': ('user', 'book', 'status')
+            'fields': ('user', 'book', 'copy', 'branch', 'status')
         }),
         ('Dates', {
             'fields': ('loan_date', 'due_date', 'return_date')
@@ -0,0 +1,106 @@
+"""
+Token authentication with cached lookups and TOKEN_AUTH expiry
+
+DRF's TokenAuthentication joins authtoken_token and auth_user on every
+request. Here the token-to-user resolution is cached in the default cache
+(in-process L1 in front of the shared cache), so authenticated requests need
+no queries in the steady state. Cached entries are dropped when the token is
+deleted (logout) or the user is saved, e.g. deactivated.
+
+TOKEN_AUTH settings:
+    TOKEN_TTL: tokens older than this are rejected and deleted
+    AUTO_REFRESH: slide the expiry forward when a token is used...
+    REFRESH_THRESHOLD: ...and has less than this left
+    CACHE_TIMEOUT: seconds a resolved token stays cached
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+def token_settings():
+    return getattr(settings, 'TOKEN_AUTH', {})
+
+
+def token_cache_key(key):
+    return f'auth:token:{key}'
+
+
+def user_tokens_cache_key(user_id):
+    return f'auth:user-token:{user_id}'
+
+
+def invalidate_token(key, user_id=None):
+    """Drop a cached token resolution"""
+    keys = [token_cache_key(key)]
+    if user_id is not None:
+        keys.append(user_tokens_cache_key(user_id))
+    cache.delete_many(keys)
+
+
+def invalidate_user_tokens(user_id):
+    """Drop the cached token resolution of a user, if any"""
+    key = cache.get(user_tokens_cache_key(user_id))
+    if key:
+        invalidate_token(key, user_id)
+
+
+def is_expired(token, now=None):
+    ttl = token_settings().get('TOKEN_TTL')
+    if ttl is None:
+        return False
+    return token.created + ttl <= (now or timezone.now())
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication backed by the cache, with expiry and sliding refresh"""
+
+    def authenticate_credentials(self, key):
+        token = self.get_token(key)
+
+        if not token.user.is_active:
+            invalidate_token(key, token.user_id)
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        now = timezone.now()
+        if is_expired(token, now):
+            # Deleting the token also drops the cache entry (see library.signals)
+            Token.objects.filter(key=key).delete()
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+
+        if self.should_refresh(token, now):
+            Token.objects.filter(key=key).update(created=now)
+            token.created = now
+            self.cache_token(token)
+
+        return (token.user, token)
+
+    def get_token(self, key):
+        token = cache.get(token_cache_key(key))
+        if token is not None:
+            return token
+        try:
+            token = Token.objects.select_related('user').get(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        self.cache_token(token)
+        return token
+
+    def cache_token(self, token):
+        timeout = token_settings().get('CACHE_TIMEOUT', 300)
+        cache.set_many({
+            token_cache_key(token.key): token,
+            user_tokens_cache_key(token.user_id): token.key,
+        }, timeout)
+
+    def should_refresh(self, token, now):
+        config = token_settings()
+        if not config.get('AUTO_REFRESH') or config.get('TOKEN_TTL') is None:
+            return False
+        remaining = token.created + config['TOKEN_TTL'] - now
+        return remaining < config.get('REFRESH_THRESHOLD', config['TOKEN_TTL'])
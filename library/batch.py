@@ -0,0 +1,148 @@
+"""
+Batch reads: several API GETs in one round trip
+
+    POST /api/batch/
+    {"requests": [{"path": "/api/dashboard/stats/"},
+                  {"path": "/api/books/available/", "query": {"branch": 2}}],
+     "concurrent": false}
+
+Each sub-request is resolved and run in-process against the same view a
+direct GET would reach. It reuses the batch request's authenticated user
+and token, so authentication and the middleware stack run once for the
+whole batch. The response lists ``{"path", "status", "body"}`` in
+request order; a failing sub-request does not fail the others.
+
+By default the sub-requests run one after another inside a single read
+transaction (read-only and repeatable-read on PostgreSQL), so they all
+see the same snapshot. ``"concurrent": true`` runs them on a small thread
+pool instead, each on its own connection and without a shared snapshot,
+and each in a copy of the batch request's context, so context variables
+such as the replica routing state (bookloan.db_routers) carry over.
+"""
+
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import serializers, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+
+def batch_settings():
+    return {
+        'MAX_REQUESTS': 20,
+        'MAX_WORKERS': 4,
+        'PATH_PREFIX': '/api/',
+        **getattr(settings, 'API_BATCH', {}),
+    }
+
+
+class SubRequestSerializer(serializers.Serializer):
+    path = serializers.CharField()
+    query = serializers.DictField(required=False, default=dict)
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = SubRequestSerializer(many=True, allow_empty=False)
+    concurrent = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        limit = batch_settings()['MAX_REQUESTS']
+        if len(value) > limit:
+            raise serializers.ValidationError(f'At most {limit} sub-requests per batch')
+        return value
+
+
+def sub_request(request, path, query):
+    """A GET for ``path`` carrying the batch request's identity"""
+    original = request._request
+    query_string = QueryDict(mutable=True)
+    for name, value in query.items():
+        query_string.setlist(name, value if isinstance(value, list) else [value])
+    query_string = query_string.urlencode()
+
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = path
+    sub.META = {**original.META, 'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query_string}
+    sub.GET = QueryDict(query_string)
+    sub.COOKIES = original.COOKIES
+    sub.user = request.user
+    # Picked up by DRF's Request in place of re-running the authenticators
+    sub._force_auth_user = request.user
+    sub._force_auth_token = request.auth
+    if hasattr(original, 'urlconf'):
+        sub.urlconf = original.urlconf
+    return sub
+
+
+def response_body(response):
+    if hasattr(response, 'data'):
+        return response.data
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(response.content)
+    return response.content.decode(response.charset or 'utf-8', errors='replace')
+
+
+class BatchView(APIView):
+    """Run a list of GET sub-requests and return their results together"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # Only reads happen here: don't pin the client to the primary (see ReplicaRoutingMiddleware)
+        request._request.read_only = True
+        items = serializer.validated_data['requests']
+
+        if serializer.validated_data['concurrent'] and len(items) > 1:
+            workers = min(batch_settings()['MAX_WORKERS'], len(items))
+            # One copy per sub-request: a context can't be entered by two threads at once
+            contexts = [copy_context() for _ in items]
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(
+                    lambda context, item: context.run(self.run_in_thread, request, item), contexts, items,
+                ))
+        else:
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+                results = [self.run(request, item) for item in items]
+        return Response({'responses': results})
+
+    def run_in_thread(self, request, item):
+        try:
+            return self.run(request, item)
+        finally:
+            connection.close()
+
+    def run(self, request, item):
+        path, query = item['path'], item['query']
+        result = {'path': path}
+        try:
+            if not path.startswith(batch_settings()['PATH_PREFIX']):
+                raise Resolver404()
+            match = resolve(path, getattr(request._request, 'urlconf', None))
+        except Resolver404:
+            return {**result, 'status': status.HTTP_404_NOT_FOUND, 'body': {'detail': 'Not found.'}}
+        if getattr(match.func, 'view_class', None) is type(self):
+            return {**result, 'status': status.HTTP_400_BAD_REQUEST, 'body': {'detail': 'Batches cannot be nested.'}}
+
+        try:
+            # A savepoint, so one failing query doesn't abort the shared transaction
+            with transaction.atomic():
+                response = match.func(sub_request(request, path, query), *match.args, **match.kwargs)
+        except Exception:
+            logger.exception('Batch sub-request to %s failed', path)
+            return {**result, 'status': status.HTTP_500_INTERNAL_SERVER_ERROR, 'body': {'detail': 'Server error.'}}
+        return {**result, 'status': response.status_code, 'body': response_body(response)}
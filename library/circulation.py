@@ -0,0 +1,88 @@
+"""
+Desk circulation by copy barcode
+
+Scanning a copy's barcode checks it out to the given reader when it is
+on the shelf and returns it when it is on loan, in one transaction. The
+copy row is locked while its state changes, so two desks scanning the
+same copy cannot both check it out. Book availability follows through
+the usual LOAN_STATUS_CHANGED outbox event.
+"""
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import NotFound, ValidationError
+
+from core import outbox
+from core.models import BookCopy, BookLoan, Branch, LoanEvent
+from .handlers import LOAN_STATUS_CHANGED
+
+CHECKOUT = 'checkout'
+RETURN = 'return'
+
+
+class CopyUnavailable(ValidationError):
+    """The copy cannot circulate (lost, in maintenance) or the loan conflicts with another one"""
+
+
+def scan(barcode, user_id=None, branch_id=None):
+    """
+    Check out or return the copy with ``barcode``; returns (action, loan)
+
+    ``branch_id`` is the desk's branch: a copy returned there moves to it.
+    """
+    if branch_id is not None and not Branch.objects.filter(pk=branch_id).exists():
+        raise ValidationError({'branch_id': f'No branch with id {branch_id}'})
+    try:
+        with transaction.atomic():
+            copy = BookCopy.objects.select_for_update().filter(barcode=barcode).first()
+            if copy is None:
+                raise NotFound(f'No copy with barcode {barcode}')
+            if copy.status == BookCopy.ON_LOAN:
+                return RETURN, return_copy(copy, branch_id)
+            if copy.status != BookCopy.AVAILABLE:
+                raise CopyUnavailable(f'Copy {barcode} is {copy.get_status_display().lower()}')
+            if user_id is None:
+                raise ValidationError({'user_id': 'Required to check out a copy'})
+            return CHECKOUT, check_out(copy, user_id)
+    except IntegrityError:
+        raise CopyUnavailable('The reader already has this book on loan')
+
+
+def check_out(copy, user_id):
+    if not User.objects.filter(pk=user_id, is_active=True).exists():
+        raise ValidationError({'user_id': f'No active reader with id {user_id}'})
+    today = timezone.now().date()
+    loan = BookLoan(
+        user_id=user_id, book_id=copy.book_id, copy=copy, branch_id=copy.branch_id, status='active',
+        loan_date=today, due_date=today + timedelta(days=14),
+    )
+    loan.save()
+    copy.status = BookCopy.ON_LOAN
+    copy.save(update_fields=['status', 'updated_at'])
+    outbox.publish(
+        LOAN_STATUS_CHANGED, loan_id=loan.id, book_id=loan.book_id, old_status=None, new_status='active',
+        branch_id=loan.branch_id,
+    )
+    return loan
+
+
+def return_copy(copy, branch_id=None):
+    loan = BookLoan.objects.filter(copy=copy, status__in=LoanEvent.OUT_STATUSES).first()
+    if loan is not None:
+        old_status = loan.status
+        loan.status = 'returned'
+        loan.return_date = timezone.now().date()
+        loan.save()
+        outbox.publish(
+            LOAN_STATUS_CHANGED, loan_id=loan.id, book_id=loan.book_id, old_status=old_status, new_status='returned',
+            branch_id=loan.branch_id, return_branch_id=branch_id,
+        )
+    # Not save(): the outbox handler moves the stock to the returning branch
+    copy.status = copy._stored_status = BookCopy.AVAILABLE
+    copy.branch_id = copy._stored_branch_id = branch_id or copy.branch_id
+    copy.updated_at = timezone.now()
+    BookCopy.objects.filter(pk=copy.pk).update(status=copy.status, branch_id=copy.branch_id, updated_at=copy.updated_at)
+    return loan
@@ -0,0 +1,145 @@
+"""
+Sparse fieldsets for API responses: ``?fields=`` and ``?expand=``
+
+    GET /api/book-loans/?fields=id,due_date,status,book.title,user.username
+    GET /api/book-loans/?expand=book
+    GET /api/books/?fields=id,title,available_copies
+
+Without either parameter responses keep their full shape. Once a client
+asks for a fieldset, relations are rendered as ids unless expanded, either
+with ``expand=book`` or by requesting a sub-field (``book.title``).
+
+The same fieldset trims the SQL: the viewset loads only the columns the
+kept fields read (``.only()``) and joins only expanded relations.
+"""
+
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+
+def parse_fieldset(query_params):
+    """
+    Return (fields, expand) from the query string, or (None, None)
+
+    ``fields`` is a set of top-level names (None for all fields) and
+    ``expand`` maps each expanded relation to its own fieldset.
+    """
+    raw_fields = query_params.get('fields')
+    raw_expand = query_params.get('expand')
+    if raw_fields is None and raw_expand is None:
+        return None, None
+
+    fields = None
+    expand = {}
+    for name in filter(None, (part.strip() for part in (raw_expand or '').split(','))):
+        expand[name] = None
+    if raw_fields is not None:
+        fields = set()
+        for name in filter(None, (part.strip() for part in raw_fields.split(','))):
+            relation, _, subfield = name.partition('.')
+            fields.add(relation)
+            if subfield:
+                subfields = expand.get(relation) or set()
+                subfields.add(subfield)
+                expand[relation] = subfields
+        fields |= set(expand)
+    return fields, expand
+
+
+class SparseFieldsMixin:
+    """
+    Serializer accepting ``fields`` and ``expand`` keyword arguments
+
+    ``Meta.expandable`` maps relation fields to the serializer used when they
+    are expanded; ``Meta.field_sources`` lists the model fields read by
+    fields that are not plain model fields (method fields, display values).
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None and expand is None:
+            return
+        expand = expand or {}
+        expandable = getattr(self.Meta, 'expandable', {})
+
+        unknown = (set(fields or ()) - set(self.fields)) | (set(expand) - set(expandable))
+        if unknown:
+            raise ValidationError({'fields': f"Unknown field(s): {', '.join(sorted(unknown))}"})
+
+        for name in list(self.fields):
+            if fields is not None and name not in fields:
+                del self.fields[name]
+            elif name in expandable:
+                if name in expand:
+                    self.fields[name] = expandable[name](read_only=True, fields=expand[name])
+                else:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    @classmethod
+    def model_fields_for(cls, fields=None, expand=None):
+        """Model fields read when serializing with this fieldset, for ``.only()``"""
+        sources = getattr(cls.Meta, 'field_sources', {})
+        expandable = getattr(cls.Meta, 'expandable', {})
+        model_fields = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        names = fields if fields is not None else cls.Meta.fields
+        needed = {'pk'}
+        for name in names:
+            if name in expandable and name in (expand or {}):
+                needed.add(name)
+                needed.update(
+                    f'{name}__{column}'
+                    for column in expandable[name].model_fields_for(expand[name]) if column != 'pk'
+                )
+            elif name in sources:
+                needed.update(sources[name])
+            elif name in model_fields:
+                needed.add(name)
+        return sorted(needed)
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields=None, expand=None):
+        """Defer unread columns and join only the expanded relations"""
+        expand = expand or {}
+        related = [name for name in getattr(cls.Meta, 'expandable', {}) if name in expand]
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*cls.model_fields_for(fields, expand))
+
+
+class SparseFieldsViewMixin:
+    """
+    Apply ``?fields=``/``?expand=`` to a viewset's reads
+
+    Only actions in ``sparse_actions`` are affected; writes and other
+    actions keep the full queryset and serializer.
+    """
+
+    sparse_actions = ('list', 'retrieve')
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            request = getattr(self, 'request', None)
+            if request is None or request.method != 'GET' or self.action not in self.sparse_actions:
+                self._fieldset = (None, None)
+            else:
+                self._fieldset = parse_fieldset(request.query_params)
+        return self._fieldset
+
+    def get_queryset(self):
+        return self.apply_fieldset(super().get_queryset())
+
+    def apply_fieldset(self, queryset):
+        """Trim a queryset to the requested fieldset; call from get_queryset overrides"""
+        fields, expand = self.get_fieldset()
+        serializer_class = self.get_serializer_class()
+        if (fields is None and expand is None) or not issubclass(serializer_class, SparseFieldsMixin):
+            return queryset
+        return serializer_class.optimize_queryset(queryset, fields, expand)
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_fieldset()
+        if fields is not None or expand is not None:
+            kwargs.setdefault('fields', fields)
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
@@ -0,0 +1,35 @@
+"""
+Outbox handlers for loan side effects (see core.outbox)
+"""
+
+from core import outbox, stock
+from core.models import Book, LoanEvent
+from core.outbox import LOAN_STATUS_CHANGED
+
+
+@outbox.register(LOAN_STATUS_CHANGED)
+def update_inventory(event):
+    """
+    Adjust book availability after a loan changes status
+
+    Loans made at a branch (payload ``branch_id``) also adjust that
+    branch's stock; ``return_branch_id`` names where the copy came back.
+    """
+    old_status = event.payload['old_status']
+    new_status = event.payload['new_status']
+    branch_id = event.payload.get('branch_id')
+    book = Book.objects.select_for_update().get(id=event.payload['book_id'])
+
+    if old_status in LoanEvent.OUT_STATUSES and new_status == 'returned':
+        # Book returned - increase available copies
+        book.available_copies += 1
+        book.save(update_fields=['available_copies', 'updated_at'])
+        if branch_id is not None:
+            stock.check_in(book.id, branch_id, event.payload.get('return_branch_id'))
+    elif old_status in (None, 'returned', 'pending') and new_status == 'active':
+        # Book borrowed again, loan approved or checked out at the desk - decrease available copies
+        if book.available_copies > 0:
+            book.available_copies -= 1
+            book.save(update_fields=['available_copies', 'updated_at'])
+        if branch_id is not None:
+            stock.check_out(book.id, branch_id)
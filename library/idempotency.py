@@ -0,0 +1,140 @@
+"""
+Idempotency keys for retried writes
+
+A client that may retry a write sends a unique ``Idempotency-Key`` header.
+The first request with a key runs normally and its response is stored in
+the shared cache for ``API_IDEMPOTENCY['TTL']`` seconds; retries with the
+same key get that response back, marked ``Idempotent-Replayed: true``,
+without running validation, business logic or database queries.
+
+Keys are scoped to the authenticated user. Reusing a key for a different
+request is rejected with 422, and a retry that arrives while the first
+request is still running gets 409. Server errors (5xx) are not stored, so
+they can be retried with the same key.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http.request import RawPostDataException
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.response import Response
+
+REPLAY_HEADER = 'Idempotent-Replayed'
+
+# Response headers kept with a stored response
+STORED_HEADERS = ('Location',)
+
+
+def idempotency_settings():
+    return {
+        'HEADER': 'Idempotency-Key',
+        'TTL': 24 * 60 * 60,
+        # How long a key stays reserved by a request that never finishes
+        'LOCK_TIMEOUT': 60,
+        'MAX_KEY_LENGTH': 255,
+        'CACHE_ALIAS': 'default',
+        **getattr(settings, 'API_IDEMPOTENCY', {}),
+    }
+
+
+class KeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed.'
+    default_code = 'idempotency_key_in_use'
+
+
+class KeyMismatch(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used for a different request.'
+    default_code = 'idempotency_key_mismatch'
+
+
+class Replay(Exception):
+    """Raised from ``initial()`` to short-circuit the handler with a stored response"""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+def fingerprint(request):
+    digest = hashlib.sha256(f'{request.method} {request.get_full_path()}\n'.encode())
+    try:
+        digest.update(request.body)
+    except RawPostDataException:  # multipart bodies are streamed, not kept
+        digest.update(repr(sorted(request.data.items())).encode())
+    return digest.hexdigest()
+
+
+class IdempotentViewMixin:
+    """
+    Honour ``Idempotency-Key`` on the actions listed in ``idempotent_actions``
+
+    Put it before other mixins that replace responses in
+    ``finalize_response``, so the original response is the one stored.
+    """
+
+    idempotent_actions = ('create', 'update', 'partial_update', 'destroy')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._idempotency_key = None
+        config = idempotency_settings()
+        key = request.headers.get(config['HEADER'])
+        # ViewSets name the action, plain APIViews list HTTP methods
+        action = getattr(self, 'action', None) or request.method.lower()
+        if not key or action not in self.idempotent_actions:
+            return
+        if len(key) > config['MAX_KEY_LENGTH']:
+            raise ParseError(f"{config['HEADER']} is longer than {config['MAX_KEY_LENGTH']} characters")
+
+        cache = caches[config['CACHE_ALIAS']]
+        cache_key = f'idempotency:{request.user.pk}:{key}'
+        request_fingerprint = fingerprint(request)
+        if cache.add(cache_key, {'fingerprint': request_fingerprint}, config['LOCK_TIMEOUT']):
+            self._idempotency_key = (cache_key, request_fingerprint)
+            return
+
+        stored = cache.get(cache_key)
+        if stored is None or 'status' not in stored:  # still running (or expired in between)
+            raise KeyInUse()
+        if stored['fingerprint'] != request_fingerprint:
+            raise KeyMismatch()
+        raise Replay(Response(
+            stored['data'], status=stored['status'], headers={**stored['headers'], REPLAY_HEADER: 'true'},
+        ))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            return exc.response
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # Unhandled errors never reach finalize_response; free the key for retries
+            self.release_idempotency_key()
+            raise
+
+    def release_idempotency_key(self):
+        reserved = getattr(self, '_idempotency_key', None)
+        self._idempotency_key = None
+        if reserved is not None:
+            caches[idempotency_settings()['CACHE_ALIAS']].delete(reserved[0])
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        reserved = getattr(self, '_idempotency_key', None)
+        if reserved is not None and response.status_code >= 500:
+            self.release_idempotency_key()
+        elif reserved is not None:
+            self._idempotency_key = None
+            cache_key, request_fingerprint = reserved
+            config = idempotency_settings()
+            caches[config['CACHE_ALIAS']].set(cache_key, {
+                'fingerprint': request_fingerprint,
+                'status': response.status_code,
+                'data': getattr(response, 'data', None),
+                'headers': {name: response[name] for name in STORED_HEADERS if response.has_header(name)},
+            }, config['TTL'])
+        return super().finalize_response(request, response, *args, **kwargs)
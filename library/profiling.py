@@ -0,0 +1,230 @@
+"""
+Opt-in profiling for API views
+
+Two modes, both hooked into the DRF dispatch of views using ProfiledViewMixin:
+
+Per-request profile
+    A staff user sends ``X-Profile: 1``. The view runs under cProfile and
+    every SQL query is timed. The response is replaced by a JSON report with
+    the hottest functions (with their callees), the SQL timeline and the
+    original response data.
+
+Sampling
+    With ``PROFILING['SAMPLING']`` enabled, a background thread samples the
+    stacks of threads serving profiled views every ``SAMPLE_INTERVAL``
+    seconds. The aggregated stacks are written to ``SAMPLE_FILE`` in the
+    collapsed format read by flamegraph.pl and speedscope. Only threads
+    inside a profiled view are inspected, so idle overhead is negligible.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.response import Response
+
+
+def profiling_settings():
+    return {
+        'ENABLED': True,
+        'HEADER': 'X-Profile',
+        'TOP_FUNCTIONS': 30,
+        'SAMPLING': False,
+        'SAMPLE_INTERVAL': 0.005,
+        'SAMPLE_FILE': 'profiles/stacks-{pid}.txt',
+        'FLUSH_INTERVAL': 30,
+        **getattr(settings, 'PROFILING', {}),
+    }
+
+
+class SQLTimeline:
+    """Execute wrapper recording when each query started and how long it took"""
+
+    def __init__(self, origin):
+        self.origin = origin
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = time.perf_counter()
+            self.queries.append({
+                'startMs': round((start - self.origin) * 1000, 3),
+                'durationMs': round((end - start) * 1000, 3),
+                'sql': sql,
+            })
+
+
+class RequestProfiler:
+    """cProfile plus SQL timeline for a single request"""
+
+    def __init__(self):
+        import cProfile  # only profiled requests pay for the import
+
+        self.profile = cProfile.Profile()
+        self.origin = time.perf_counter()
+        self.timeline = SQLTimeline(self.origin)
+        self.duration = None
+
+    def start(self):
+        for connection in connections.all():
+            connection.execute_wrappers.append(self.timeline)
+        self.profile.enable()
+        return self
+
+    def stop(self):
+        self.profile.disable()
+        self.duration = time.perf_counter() - self.origin
+        for connection in connections.all():
+            if self.timeline in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self.timeline)
+
+    def report(self, top=30):
+        import pstats
+
+        stats = pstats.Stats(self.profile)
+        stats.calc_callees()
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        functions = []
+        for func, (_, calls, total, cumulative, _) in rows:
+            callees = [(callee, values[3]) for callee, values in stats.all_callees[func].items()]
+            callees.sort(key=lambda item: item[1], reverse=True)
+            functions.append({
+                'function': pstats.func_std_string(func),
+                'calls': calls,
+                'totalMs': round(total * 1000, 3),
+                'cumulativeMs': round(cumulative * 1000, 3),
+                'callees': [pstats.func_std_string(callee) for callee, _ in callees[:5]],
+            })
+        return {
+            'durationMs': round(self.duration * 1000, 3),
+            'queryCount': len(self.timeline.queries),
+            'queryMs': round(sum(q['durationMs'] for q in self.timeline.queries), 3),
+            'functions': functions,
+            'sql': self.timeline.queries,
+        }
+
+
+class StackSampler:
+    """Aggregate sampled stacks of threads serving profiled views"""
+
+    def __init__(self, interval, path, flush_interval):
+        self.interval = interval
+        self.path = path
+        self.flush_interval = flush_interval
+        self.stacks = Counter()
+        self.active = set()
+        self.lock = threading.Lock()
+        self.pid = None
+        self.thread = None
+
+    def ensure_running(self):
+        # Restart after fork: threads do not survive it
+        if self.pid == os.getpid() and self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.stacks = Counter()
+                self.active = set()
+                self.thread = None
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+                self.thread.start()
+
+    @contextmanager
+    def track(self):
+        self.ensure_running()
+        ident = threading.get_ident()
+        self.active.add(ident)
+        try:
+            yield
+        finally:
+            self.active.discard(ident)
+
+    def sample(self):
+        frames = sys._current_frames()
+        for ident in list(self.active):
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def flush(self):
+        path = Path(str(self.path).format(pid=self.pid))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f'{stack} {count}\n')
+        os.replace(tmp, path)
+
+    def run(self):
+        last_flush = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            if self.active:
+                self.sample()
+            if time.monotonic() - last_flush >= self.flush_interval and self.stacks:
+                self.flush()
+                last_flush = time.monotonic()
+
+
+_sampler = None
+
+
+def get_sampler():
+    global _sampler
+    config = profiling_settings()
+    if not config['SAMPLING']:
+        return None
+    if _sampler is None:
+        _sampler = StackSampler(config['SAMPLE_INTERVAL'], config['SAMPLE_FILE'], config['FLUSH_INTERVAL'])
+    return _sampler
+
+
+def wants_profile(request):
+    config = profiling_settings()
+    if not config['ENABLED'] or not request.headers.get(config['HEADER']):
+        return False
+    return bool(request.user and request.user.is_staff)
+
+
+class ProfiledViewMixin:
+    """Add per-request profiling and stack sampling to a DRF view"""
+
+    def dispatch(self, request, *args, **kwargs):
+        sampler = get_sampler()
+        if sampler is None:
+            return super().dispatch(request, *args, **kwargs)
+        with sampler.track():
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Authentication has run, so only privileged users can turn this on
+        if wants_profile(request):
+            self._profiler = RequestProfiler().start()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        profiler = getattr(self, '_profiler', None)
+        if profiler is not None:
+            self._profiler = None
+            profiler.stop()
+            report = profiler.report(profiling_settings()['TOP_FUNCTIONS'])
+            report['status'] = response.status_code
+            report['response'] = getattr(response, 'data', None)
+            response = Response(report)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -1,24 +1,76 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from core.models import Book, BookLoan
+from django.db import transaction
+from core import forecast, outbox
+from core.models import Book, BookLoan, BookLoanArchive, BookNeighbor, BookStock, Branch
+from .fieldsets import SparseFieldsMixin
+from .handlers import LOAN_STATUS_CHANGED
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'first_name', 'last_name', 'email']
 
 
-class BookSerializer(serializers.ModelSerializer):
+class LoanBookSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Book as nested in loans"""
     class Meta:
         model = Book
         fields = ['id', 'title', 'author', 'isbn', 'available_copies', 'total_copies']
 
 
-class BookLoanSerializer(serializers.ModelSerializer):
+class BookSerializer(LoanBookSerializer):
+    """
+    Book with its next-available-date forecast (see core.forecast)
+
+    Reads the ``next_available_date`` annotation of ``forecast.with_forecast``
+    when present and queries it otherwise.
+    """
+    next_available_date = serializers.SerializerMethodField()
+
+    class Meta(LoanBookSerializer.Meta):
+        fields = LoanBookSerializer.Meta.fields + ['next_available_date']
+        field_sources = {'next_available_date': ['available_copies']}
+
+    def get_next_available_date(self, obj):
+        if hasattr(obj, 'next_available_date'):
+            return obj.next_available_date
+        return forecast.next_available_dates([obj])[obj.pk]
+
+
+class BranchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Branch
+        fields = ['id', 'code', 'name', 'address']
+
+
+class BookStockSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BookStock
+        fields = ['book', 'branch', 'total_copies', 'available_copies']
+
+
+class StockTransferSerializer(serializers.Serializer):
+    """Input of a transfer between branches"""
+    book_id = serializers.IntegerField()
+    to_branch_id = serializers.IntegerField()
+    copies = serializers.IntegerField(min_value=1, default=1)
+
+
+class BookNeighborSerializer(serializers.ModelSerializer):
+    """A "patrons also borrowed" entry"""
+    book = LoanBookSerializer(source='neighbor', read_only=True)
+
+    class Meta:
+        model = BookNeighbor
+        fields = ['book', 'rank', 'score', 'shared_readers']
+
+
+class BookLoanSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     user_id = serializers.IntegerField(write_only=True)
-    book = BookSerializer(read_only=True)
+    book = LoanBookSerializer(read_only=True)
     book_id = serializers.IntegerField(write_only=True)
     days_overdue = serializers.SerializerMethodField()
     status_display = serializers.CharField(source='get_status_display', read_only=True)
@@ -26,11 +78,13 @@ class BookLoanSerializer(serializers.ModelSerializer):
     class Meta:
         model = BookLoan
         fields = [
-            'id', 'user', 'user_id', 'book', 'book_id', 'loan_date', 
+            'id', 'user', 'user_id', 'book', 'book_id', 'copy', 'branch', 'loan_date', 
             'due_date', 'return_date', 'status', 'status_display', 
             'notes', 'fine_amount', 'days_overdue', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at', 'loan_date']
+        read_only_fields = ['created_at', 'updated_at', 'loan_date', 'copy', 'branch']
+        expandable = {'user': UserSerializer, 'book': LoanBookSerializer}
+        field_sources = {'status_display': ['status'], 'days_overdue': ['status', 'due_date']}
 
     def get_days_overdue(self, obj):
         """Calculate days overdue for active loans"""
@@ -50,7 +104,7 @@ class BookLoanSerializer(serializers.ModelSerializer):
         existing_loan = BookLoan.objects.filter(
             user_id=user_id, 
             book_id=data['book_id'], 
-            status='active'
+            status__in=BookLoan.OPEN_STATUSES
         )
         
         if self.instance:
@@ -67,39 +121,62 @@ class BookLoanSerializer(serializers.ModelSerializer):
         return book_loan
 
     def update(self, instance, validated_data):
-        """Update BookLoan and handle book availability"""
+        """Update BookLoan; book availability is updated by the outbox worker"""
         old_status = instance.status
         new_status = validated_data.get('status', old_status)
         
-        # Update the loan
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        
-        # Handle book availability changes
-        if old_status == 'active' and new_status == 'returned':
-            # Book returned - increase available copies
-            instance.book.available_copies += 1
-            instance.book.save()
-        elif old_status == 'returned' and new_status == 'active':
-            # Book borrowed again - decrease available copies
-            if instance.book.available_copies > 0:
-                instance.book.available_copies -= 1
-                instance.book.save()
-        elif old_status == 'pending' and new_status == 'active':
-            # Loan approved - decrease available copies
-            if instance.book.available_copies > 0:
-                instance.book.available_copies -= 1
-                instance.book.save()
+        with transaction.atomic():
+            # Update the loan
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save()
+            
+            if old_status != new_status:
+                outbox.publish(
+                    LOAN_STATUS_CHANGED,
+                    loan_id=instance.id,
+                    book_id=instance.book_id,
+                    old_status=old_status,
+                    new_status=new_status,
+                    branch_id=instance.branch_id,
+                )
         
         return instance
 
 
+class BookLoanArchiveSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Read-only representation of archived loans, shaped like BookLoanSerializer"""
+    user = UserSerializer(read_only=True)
+    book = LoanBookSerializer(read_only=True)
+    days_overdue = serializers.SerializerMethodField()
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    archived = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BookLoanArchive
+        fields = [
+            'id', 'user', 'book', 'loan_date', 'due_date', 'return_date',
+            'status', 'status_display', 'notes', 'fine_amount', 'days_overdue',
+            'created_at', 'updated_at', 'archived', 'archived_at'
+        ]
+        read_only_fields = fields
+        expandable = BookLoanSerializer.Meta.expandable
+        field_sources = {'status_display': ['status'], 'days_overdue': [], 'archived': []}
+
+    def get_days_overdue(self, obj):
+        return 0
+
+    def get_archived(self, obj):
+        return True
+
+
 class BookLoanCreateSerializer(serializers.ModelSerializer):
     """Simplified serializer for creating loans"""
+    branch_id = serializers.IntegerField(required=False, allow_null=True)
+
     class Meta:
         model = BookLoan
-        fields = ['user_id', 'book_id', 'due_date', 'notes']
+        fields = ['user_id', 'book_id', 'branch_id', 'due_date', 'notes']
 
     def validate(self, data):
         # Same validation as BookLoanSerializer
@@ -107,11 +184,16 @@ class BookLoanCreateSerializer(serializers.ModelSerializer):
         
         if book.available_copies <= 0:
             raise serializers.ValidationError("This book is not available for loan")
+
+        if data.get('branch_id') is not None and not BookStock.objects.filter(
+            book_id=data['book_id'], branch_id=data['branch_id'], available_copies__gt=0
+        ).exists():
+            raise serializers.ValidationError("This book is not available at that branch")
         
         existing_loan = BookLoan.objects.filter(
             user_id=data['user_id'], 
             book_id=data['book_id'], 
-            status='active'
+            status__in=BookLoan.OPEN_STATUSES
         )
         
         if existing_loan.exists():
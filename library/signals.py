@@ -0,0 +1,59 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core.models import Book
+
+from . import typeahead
+from .authentication import invalidate_token, invalidate_user_tokens
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Forget the cached resolution of a deleted token (logout, expiry)"""
+    invalidate_token(instance.key, instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    """Re-read the user on the next request, e.g. after deactivation"""
+    if not created:
+        invalidate_user_tokens(instance.pk)
+
+
+def update_typeahead(change, *args):
+    """Apply a write to this process's typeahead index, once it commits"""
+    def apply():
+        index = typeahead.built_index()
+        if index is not None:
+            getattr(index, change)(*args)
+
+    if typeahead.built_index() is not None:
+        transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Book)
+def book_saved_typeahead(sender, instance, **kwargs):
+    update_typeahead('upsert', typeahead.book_entry(instance.pk, instance.title, instance.author, instance.isbn))
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted_typeahead(sender, instance, **kwargs):
+    update_typeahead('remove', typeahead.BOOK, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def user_saved_typeahead(sender, instance, **kwargs):
+    if instance.is_active:
+        update_typeahead('upsert', typeahead.user_entry(
+            instance.pk, instance.username, instance.first_name, instance.last_name,
+        ))
+    else:
+        update_typeahead('remove', typeahead.USER, instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted_typeahead(sender, instance, **kwargs):
+    update_typeahead('remove', typeahead.USER, instance.pk)
@@ -1,3 +1,855 @@
-from django.test import TestCase
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from bookloan import db_routers
+
+from core import changes, recommendations
+from core.archive import archive_closed_loans
+from core import outbox
+from core.models import Book, BookCopy, BookLoan, BookNeighbor, BookStock, Branch
+from core.tests import FakeRedisServer
+from library.admin import BookLoanAdmin
+from library.authentication import CachedTokenAuthentication
+from library.batch import BatchView
+from library.fieldsets import parse_fieldset
+from library.profiling import StackSampler
+from library import typeahead
+from library.throttling import TieredRateThrottle, WindowCounterStore, parse_rate
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+def make_request(user=None, ip='10.0.0.1'):
+    request = RequestFactory().get('/api/books/', REMOTE_ADDR=ip)
+    request.user = user or AnonymousUser()
+    return request
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    API_THROTTLING={
+        'BURST_RATE': '3/min',
+        'SUSTAINED_RATE': '5/hour',
+        'ADMIN_RATE': '10/hour',
+        'CACHE_ALIAS': 'shared',
+    },
+)
+class TieredRateThrottleTest(SimpleTestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+
+    def hits(self, request, count):
+        return [TieredRateThrottle().allow_request(request, None) for _ in range(count)]
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('60/min'), (60, 60))
+        self.assertEqual(parse_rate('1000/hour'), (1000, 3600))
+
+    def test_burst_rate(self):
+        self.assertEqual(self.hits(make_request(), 4), [True, True, True, False])
+
+    def test_clients_are_counted_separately(self):
+        self.hits(make_request(ip='10.0.0.1'), 3)
+        self.assertTrue(TieredRateThrottle().allow_request(make_request(ip='10.0.0.2'), None))
+
+    @override_settings(API_THROTTLING={'BURST_RATE': '100/min', 'SUSTAINED_RATE': '5/hour'})
+    def test_sustained_rate_applies_with_burst(self):
+        self.assertEqual(self.hits(make_request(), 6), [True] * 5 + [False])
+
+    def test_admin_tier(self):
+        staff = SimpleNamespace(pk=1, is_staff=True, is_authenticated=True)
+        self.assertEqual(self.hits(make_request(user=staff), 11), [True] * 10 + [False])
+
+    def test_wait_is_reported(self):
+        throttle = TieredRateThrottle()
+        request = make_request()
+        for _ in range(4):
+            throttle.allow_request(request, None)
+        self.assertGreater(throttle.wait(), 0)
+
+
+class WindowCounterStoreRedisTest(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.redis = FakeRedisServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.redis.stop()
+        super().tearDownClass()
+
+    def test_single_pipeline(self):
+        with override_settings(CACHES={'shared': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': self.redis.url,
+            'OPTIONS': {'protocol': 2},
+        }}):
+            cache = caches['shared']
+            cache.set('prev', 4)
+            store = WindowCounterStore(cache)
+            self.assertEqual(store.hit(['cur'], ['prev'], 60), ([1], [4]))
+            self.assertEqual(store.hit(['cur'], ['prev'], 60), ([2], [4]))
+            self.assertEqual(cache.get('cur'), 2)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    TOKEN_AUTH={
+        'TOKEN_TTL': timedelta(days=30),
+        'AUTO_REFRESH': True,
+        'REFRESH_THRESHOLD': timedelta(days=7),
+        'CACHE_TIMEOUT': 300,
+    },
+)
+class CachedTokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user('reader', password='secret')
+        self.token = Token.objects.create(user=self.user)
+
+    def authenticate(self, key=None):
+        request = RequestFactory().get('/api/books/', HTTP_AUTHORIZATION=f'Token {key or self.token.key}')
+        return CachedTokenAuthentication().authenticate(request)
+
+    def test_cached_lookup_needs_no_queries(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+        self.assertEqual(user, self.user)
+        self.assertEqual(token.key, self.token.key)
+
+    def test_invalid_token(self):
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate('not-a-token')
+
+    def test_deactivation_invalidates_cache(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+
+    def test_logout_invalidates_cache(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(client.post('/api/auth/logout/').status_code, 204)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+
+    def test_expired_token_is_rejected_and_deleted(self):
+        Token.objects.filter(key=self.token.key).update(created=timezone.now() - timedelta(days=31))
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+        self.assertFalse(Token.objects.filter(key=self.token.key).exists())
+
+    def test_sliding_refresh_near_expiry(self):
+        old = timezone.now() - timedelta(days=25)
+        Token.objects.filter(key=self.token.key).update(created=old)
+        self.authenticate()
+        self.token.refresh_from_db()
+        self.assertGreater(self.token.created, old + timedelta(days=24))
+
+    def test_login_replaces_expired_token(self):
+        Token.objects.filter(key=self.token.key).update(created=timezone.now() - timedelta(days=31))
+        response = APIClient().post('/api/auth/token/', {'username': 'reader', 'password': 'secret'})
+        self.assertNotEqual(response.data['token'], self.token.key)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IncludeArchivedTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        today = timezone.now().date()
+        book = Book.objects.create(title='Dune', author='Herbert', isbn='1')
+        self.old = BookLoan.objects.create(
+            user=self.user, book=book, status='returned',
+            loan_date=today - timedelta(days=800),
+            due_date=today - timedelta(days=786),
+            return_date=today - timedelta(days=790),
+        )
+        self.current = BookLoan.objects.create(
+            user=self.user, book=book, status='active', due_date=today + timedelta(days=14),
+        )
+        list(archive_closed_loans(today - timedelta(days=365)))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_archived_loans_are_hidden_by_default(self):
+        response = self.client.get('/api/book-loans/')
+        self.assertEqual([loan['id'] for loan in response.data['results']], [self.current.id])
+
+    def test_include_archived(self):
+        response = self.client.get('/api/book-loans/', {'include_archived': '1'})
+        results = response.data['results']
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([loan['id'] for loan in results], [self.current.id, self.old.id])
+        self.assertTrue(results[1]['archived'])
+        self.assertEqual(results[1]['book']['title'], 'Dune')
+
+    def test_include_archived_with_filters(self):
+        response = self.client.get('/api/book-loans/', {'include_archived': '1', 'status': 'returned'})
+        self.assertEqual([loan['id'] for loan in response.data['results']], [self.old.id])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        Book.objects.create(title='Dune', author='Herbert', isbn='1')
+        self.client = APIClient()
+
+    def test_staff_gets_profile_report(self):
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get('/api/books/', HTTP_X_PROFILE='1')
+        report = response.json()
+        self.assertEqual(report['status'], 200)
+        self.assertEqual(report['response']['results'][0]['title'], 'Dune')
+        self.assertGreaterEqual(report['queryCount'], 1)
+        self.assertIn('core_book', report['sql'][-1]['sql'])
+        self.assertTrue(report['functions'])
+
+    def test_header_is_ignored_for_other_users(self):
+        self.client.force_authenticate(User.objects.create_user('reader'))
+        response = self.client.get('/api/books/', HTTP_X_PROFILE='1')
+        self.assertNotIn('functions', response.json())
+
+    def test_stack_sampler_writes_collapsed_stacks(self):
+        import tempfile
+        from pathlib import Path
+        path = Path(tempfile.mkdtemp()) / 'stacks-{pid}.txt'
+        sampler = StackSampler(interval=60, path=path, flush_interval=60)
+        with sampler.track():
+            sampler.sample()
+        sampler.flush()
+        content = Path(str(path).format(pid=sampler.pid)).read_text()
+        self.assertIn('test_stack_sampler_writes_collapsed_stacks (tests.py:', content)
+        self.assertTrue(content.strip().endswith(' 1'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SparseFieldsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        self.book = Book.objects.create(title='Dune', author='Herbert', isbn='1')
+        self.loan = BookLoan.objects.create(
+            user=self.user, book=self.book, status='active', due_date=timezone.now().date(), notes='x' * 500,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        loan_query = next(query['sql'] for query in queries if 'FROM "core_bookloan"' in query['sql']
+                          and 'COUNT' not in query['sql'])
+        return response, loan_query
+
+    def test_parse_fieldset(self):
+        self.assertEqual(parse_fieldset({}), (None, None))
+        self.assertEqual(
+            parse_fieldset({'fields': 'id,book.title', 'expand': 'user'}),
+            ({'id', 'book', 'user'}, {'user': None, 'book': {'title'}}),
+        )
+
+    def test_default_shape_is_unchanged(self):
+        response, sql = self.get('/api/book-loans/')
+        loan = response.data['results'][0]
+        self.assertEqual(loan['book']['title'], 'Dune')
+        self.assertIn('notes', loan)
+        self.assertIn('JOIN "core_book"', sql)
+
+    def test_fields_trim_output_and_columns(self):
+        response, sql = self.get('/api/book-loans/', fields='id,due_date,book')
+        self.assertEqual(response.data['results'], [
+            {'id': self.loan.id, 'due_date': self.loan.due_date.isoformat(), 'book': self.book.id},
+        ])
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('"notes"', sql)
+
+    def test_expand_joins_only_requested_relation(self):
+        response, sql = self.get('/api/book-loans/', fields='id,status_display,book.title')
+        self.assertEqual(response.data['results'][0], {
+            'id': self.loan.id, 'status_display': 'Active', 'book': {'title': 'Dune'},
+        })
+        self.assertIn('JOIN "core_book"', sql)
+        self.assertNotIn('auth_user', sql)
+        self.assertNotIn('"isbn"', sql)
+
+        response, sql = self.get('/api/book-loans/', expand='user')
+        loan = response.data['results'][0]
+        self.assertEqual((loan['user']['username'], loan['book']), ('reader', self.book.id))
+
+    def test_book_fields(self):
+        response = self.client.get('/api/books/available/', {'fields': 'id,title'})
+        self.assertEqual(response.data, [{'id': self.book.id, 'title': 'Dune'}])
+
+    def test_unknown_field(self):
+        response = self.client.get('/api/book-loans/', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ForecastTest(TestCase):
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.out = Book.objects.create(title='Dune', author='Herbert', isbn='1', total_copies=2, available_copies=0)
+        self.shelf = Book.objects.create(title='Emma', author='Austen', isbn='2', total_copies=1, available_copies=1)
+        self.idle = Book.objects.create(title='Ulysses', author='Joyce', isbn='3', total_copies=1, available_copies=0)
+        readers = [User.objects.create_user(f'reader{i}') for i in range(3)]
+        for reader, days, status in ((readers[0], 9, 'active'), (readers[1], 4, 'active'), (readers[2], 30, 'returned')):
+            BookLoan.objects.create(user=reader, book=self.out, status=status, due_date=self.today + timedelta(days=days))
+        self.client = APIClient()
+        self.client.force_authenticate(readers[0])
+
+    def test_forecast_is_earliest_open_due_date(self):
+        response = self.client.get(f'/api/books/{self.out.id}/')
+        self.assertEqual(response.data['next_available_date'], self.today + timedelta(days=4))
+        response = self.client.get(f'/api/books/{self.shelf.id}/')
+        self.assertIsNone(response.data['next_available_date'])
+
+    def test_bulk_forecast_is_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/books/forecast/', {'ids': f'{self.out.id},{self.shelf.id},{self.idle.id}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {row['id']: row['next_available_date'] for row in response.json()['results']},
+            {self.out.id: (self.today + timedelta(days=4)).isoformat(), self.shelf.id: None, self.idle.id: None},
+        )
+        self.assertEqual(len([q for q in queries if 'core_book' in q['sql'] and 'COUNT' not in q['sql']]), 1)
+
+    def test_loans_nest_books_without_forecast(self):
+        response = self.client.get('/api/book-loans/')
+        self.assertNotIn('next_available_date', response.data['results'][0]['book'])
+
+
+@override_settings(RECOMMENDATIONS={'MIN_SHARED_READERS': 1, 'WATERMARK_OVERLAP': 0})
+class RecommendationsTest(TestCase):
+
+    def setUp(self):
+        self.books = [Book.objects.create(title=f'Book {i}', author='A', isbn=str(i)) for i in range(4)]
+        self.readers = [User.objects.create_user(f'reader{i}') for i in range(3)]
+        # Readers of book 0 also read book 1 (twice) and book 2 (once)
+        for reader, books in ((0, [0, 1, 2]), (1, [0, 1]), (2, [3])):
+            for book in books:
+                self.borrow(reader, book)
+        self.client = APIClient()
+        self.client.force_authenticate(self.readers[0])
+
+    def borrow(self, reader, book):
+        return BookLoan.objects.create(
+            user=self.readers[reader], book=self.books[book], status='returned', due_date=timezone.now().date(),
+        )
+
+    def related(self, book):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/books/{book.id}/related/')
+        self.assertEqual(response.status_code, 200)
+        return [(item['book']['id'], item['shared_readers']) for item in response.data], queries
+
+    def test_full_build_ranks_by_shared_readers(self):
+        recommendations.refresh_neighbors(full=True)
+
+        related, queries = self.related(self.books[0])
+        self.assertEqual(related, [(self.books[1].id, 2), (self.books[2].id, 1)])
+        self.assertEqual(len([q for q in queries if 'core_bookneighbor' in q['sql']]), 1)
+        self.assertEqual(self.related(self.books[3])[0], [])
+        self.assertEqual(self.client.get('/api/books/999999/related/').status_code, 404)
+
+    def test_incremental_refresh_only_touches_changed_histories(self):
+        first = recommendations.refresh_neighbors()
+        self.assertTrue(first.full)
+
+        self.borrow(2, 0)
+        build = recommendations.refresh_neighbors()
+
+        self.assertFalse(build.full)
+        self.assertEqual(build.books_updated, 2)  # books 0 and 3, read by reader 2
+        self.assertIn((self.books[3].id, 1), self.related(self.books[0])[0])
+        self.assertEqual(self.related(self.books[3])[0], [(self.books[0].id, 1)])
+        self.assertEqual(BookNeighbor.objects.filter(book=self.books[1]).count(), 2)
+
+
+class IdempotencyKeyTest(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.user = User.objects.create_user('desk')
+        self.book = Book.objects.create(title='Dune', author='Herbert', isbn='1', total_copies=2, available_copies=2)
+        self.loan = BookLoan.objects.create(
+            user=self.user, book=self.book, status='active', due_date=timezone.now().date(),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def return_book(self, key, loan=None):
+        return self.client.post(
+            f'/api/book-loans/{(loan or self.loan).id}/return_book/', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_without_queries(self):
+        first = self.return_book('scan-1')
+        self.assertEqual(first.status_code, 200)
+
+        with self.assertNumQueries(0):
+            retry = self.return_book('scan-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+    def test_errors_are_replayed_too(self):
+        self.loan.status = 'returned'
+        self.loan.save()
+        self.assertEqual(self.return_book('scan-2').status_code, 400)
+        self.loan.status = 'active'
+        self.loan.save()
+        self.assertEqual(self.return_book('scan-2').status_code, 400)
+
+    def test_key_reused_for_another_request(self):
+        book = Book.objects.create(title='Emma', author='Austen', isbn='2')
+        other = BookLoan.objects.create(user=self.user, book=book, status='pending', due_date=timezone.now().date())
+        self.return_book('scan-3')
+        self.assertEqual(self.return_book('scan-3', loan=other).status_code, 422)
+
+    def test_key_in_flight(self):
+        caches['shared'].add(f'idempotency:{self.user.pk}:scan-4', {'fingerprint': 'x'})
+        self.assertEqual(self.return_book('scan-4').status_code, 409)
+
+    def test_without_key_nothing_is_stored(self):
+        self.assertEqual(self.return_book('').status_code, 200)
+        self.assertEqual(self.return_book('').status_code, 400)
+
+
+class ScanTest(TestCase):
+
+    def setUp(self):
+        self.reader = User.objects.create_user('reader')
+        self.book = Book.objects.create(title='Dune', author='Herbert', isbn='1', total_copies=1, available_copies=1)
+        self.copy = BookCopy.objects.create(book=self.book, barcode='B0001', location='A3')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('desk', is_staff=True))
+
+    def scan(self, barcode='B0001', **data):
+        return self.client.post(f'/api/scan/{barcode}/', data, format='json')
+
+    def test_checkout_then_return(self):
+        response = self.scan(user_id=self.reader.id)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['action'], 'checkout')
+        loan = BookLoan.objects.get(id=response.data['loan']['id'])
+        self.assertEqual((loan.status, loan.copy_id), ('active', self.copy.id))
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, BookCopy.ON_LOAN)
+        outbox.process_batch()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+
+        response = self.scan()
+        self.assertEqual(response.data['action'], 'return')
+        self.assertEqual(response.data['loan']['status'], 'returned')
+        outbox.process_batch()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+    def test_repeat_borrow(self):
+        for _ in range(2):
+            self.assertEqual(self.scan(user_id=self.reader.id).data['action'], 'checkout')
+            response = self.scan()
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.data['action'], 'return')
+            outbox.process_batch()
+        self.copy.refresh_from_db()
+        self.book.refresh_from_db()
+        self.assertEqual(self.copy.status, BookCopy.AVAILABLE)
+        self.assertEqual(self.book.available_copies, 1)
+        self.assertEqual(BookLoan.objects.filter(user=self.reader, status='returned').count(), 2)
+
+    def test_scan_is_a_few_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.scan(user_id=self.reader.id)
+        statements = [q['sql'] for q in queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        # copy, reader check, loan, change record, loan event, counter, copy status, outbox event
+        self.assertLessEqual(len(statements), 8, statements)
+
+    def test_errors(self):
+        self.assertEqual(self.scan('nope', user_id=self.reader.id).status_code, 404)
+        self.assertEqual(self.scan().status_code, 400)
+        self.assertEqual(self.scan(user_id=999999).status_code, 400)
+        self.copy.status = BookCopy.LOST
+        self.copy.save()
+        self.assertEqual(self.scan(user_id=self.reader.id).status_code, 400)
+        self.assertFalse(BookLoan.objects.exists())
+
+
+class BranchTest(TestCase):
+
+    def setUp(self):
+        self.north = Branch.objects.create(code='N', name='North')
+        self.south = Branch.objects.create(code='S', name='South')
+        self.book = Book.objects.create(title='Dune', author='Herbert', isbn='1', total_copies=3, available_copies=3)
+        self.other = Book.objects.create(title='Emma', author='Austen', isbn='2', total_copies=1, available_copies=1)
+        for barcode, book, branch in (
+            ('N1', self.book, self.north), ('N2', self.book, self.north),
+            ('S1', self.book, self.south), ('S2', self.other, self.south),
+        ):
+            BookCopy.objects.create(book=book, barcode=barcode, branch=branch)
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def stock_of(self, book, branch):
+        row = BookStock.objects.get(book=book, branch=branch)
+        return row.total_copies, row.available_copies
+
+    def available_at(self, branch):
+        response = self.client.get('/api/books/available/', {'branch': branch.id})
+        return {book['id'] for book in response.data}
+
+    def test_available_filter_by_branch(self):
+        self.assertEqual(self.available_at(self.north), {self.book.id})
+        self.assertEqual(self.available_at(self.south), {self.book.id, self.other.id})
+        plan = Book.objects.filter(stock__branch=self.north, stock__available_copies__gt=0).explain()
+        self.assertIn('book_stock_available_idx', plan)
+
+    def test_copies_make_the_stock(self):
+        self.assertEqual(self.stock_of(self.book, self.north), (2, 2))
+        self.assertEqual(self.stock_of(self.other, self.south), (1, 1))
+        copy = BookCopy.objects.get(barcode='N2')
+        copy.branch = self.south
+        copy.save()
+        self.assertEqual(self.stock_of(self.book, self.north), (1, 1))
+        self.assertEqual(self.stock_of(self.book, self.south), (2, 2))
+        copy.delete()
+        self.assertEqual(self.stock_of(self.book, self.south), (1, 1))
+
+    def test_lost_copies_leave_the_shelf(self):
+        copy = BookCopy.objects.get(barcode='N2')
+        copy.status = BookCopy.LOST
+        copy.save()
+        self.assertEqual(self.stock_of(self.book, self.north), (2, 1))
+        copy.status = BookCopy.AVAILABLE
+        copy.save()
+        self.assertEqual(self.stock_of(self.book, self.north), (2, 2))
+        maintenance = BookCopy.objects.only('id', 'book', 'branch').get(barcode='N1')
+        maintenance.status = BookCopy.MAINTENANCE
+        maintenance.save()
+        self.assertEqual(self.stock_of(self.book, self.north), (2, 1))
+        copy.status = BookCopy.LOST
+        copy.branch = self.south
+        copy.save()
+        self.assertEqual(self.stock_of(self.book, self.north), (1, 0))
+        self.assertEqual(self.stock_of(self.book, self.south), (2, 1))
+
+    def test_scan_at_unknown_branch(self):
+        reader = User.objects.create_user('reader')
+        response = self.client.post('/api/scan/N1/', {'user_id': reader.id, 'branch_id': 999999}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('branch_id', response.data)
+
+    def test_branch_checkout_and_return_elsewhere(self):
+        copy = BookCopy.objects.get(barcode='N1')
+        reader = User.objects.create_user('reader')
+        self.client.post('/api/scan/N1/', {'user_id': reader.id}, format='json')
+        outbox.process_batch()
+        self.assertEqual(self.stock_of(self.book, self.north), (2, 1))
+
+        self.client.post('/api/scan/N1/', {'branch_id': self.south.id}, format='json')
+        outbox.process_batch()
+        self.assertEqual(self.stock_of(self.book, self.north), (1, 1))
+        self.assertEqual(self.stock_of(self.book, self.south), (2, 2))
+        copy.refresh_from_db()
+        self.assertEqual(copy.branch, self.south)
+
+    def test_transfer(self):
+        url = f'/api/branches/{self.north.id}/transfer/'
+        response = self.client.post(url, {'book_id': self.book.id, 'to_branch_id': self.south.id, 'copies': 2})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual((response.data['from_branch'], response.data['to_branch']), (self.north.id, self.south.id))
+        self.assertEqual(self.stock_of(self.book, self.north), (0, 0))
+        self.assertEqual(self.stock_of(self.book, self.south), (3, 3))
+        self.assertNotIn(self.book.id, self.available_at(self.north))
+
+        response = self.client.post(url, {'book_id': self.book.id, 'to_branch_id': self.south.id})
+        self.assertEqual(response.status_code, 400)
+
+
+class BatchTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('dash', is_staff=True)
+        Book.objects.create(title='Dune', author='Herbert', isbn='1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, *paths, **options):
+        requests = [{'path': path} if isinstance(path, str) else path for path in paths]
+        response = self.client.post('/api/batch/', {'requests': requests, **options}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['responses']
+
+    def test_matches_direct_requests(self):
+        responses = self.batch(
+            '/api/dashboard/stats/',
+            '/api/loan-statistics/',
+            {'path': '/api/books/available/', 'query': {'fields': 'id,title'}},
+        )
+        self.assertEqual([r['status'] for r in responses], [200, 200, 200])
+        self.assertEqual(responses[1]['body'], self.client.get('/api/loan-statistics/').json())
+        self.assertEqual(responses[2]['body'], [{'id': Book.objects.get().id, 'title': 'Dune'}])
+
+    def test_authenticates_once(self):
+        token = Token.objects.create(user=self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        with CaptureQueriesContext(connection) as queries:
+            client.post('/api/batch/', {'requests': [{'path': '/api/books/'}] * 3}, format='json')
+        self.assertLessEqual(len([q for q in queries if 'authtoken_token' in q['sql']]), 1)
+
+    def test_failures_stay_in_their_slot(self):
+        responses = self.batch('/api/nope/', '/django-admin/', '/api/batch/', '/api/books/')
+        self.assertEqual([r['status'] for r in responses], [404, 404, 400, 200])
+
+    def test_limits(self):
+        response = self.client.post('/api/batch/', {'requests': [{'path': '/api/books/'}] * 21}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ConcurrentBatchTest(TransactionTestCase):
+
+    def test_concurrent_sub_requests(self):
+        Book.objects.create(title='Dune', author='Herbert', isbn='1')
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('dash'))
+        paths = ['/api/books/', '/api/books/available/', '/api/loan-statistics/', '/api/nope/']
+        response = client.post('/api/batch/', {'requests': [{'path': p} for p in paths], 'concurrent': True},
+                               format='json')
+        self.assertEqual([r['path'] for r in response.json()['responses']], paths)
+        self.assertEqual([r['status'] for r in response.json()['responses']], [200, 200, 200, 404])
+        self.assertEqual(response.json()['responses'][0]['body']['count'], 1)
+
+    def test_sub_requests_see_the_request_context(self):
+        seen = []
+        run = BatchView.run
+
+        def record(view, request, item):
+            seen.append(db_routers._use_replicas.get())
+            return run(view, request, item)
+
+        request = APIRequestFactory().post(
+            '/api/batch/', {'requests': [{'path': '/api/books/'}] * 3, 'concurrent': True}, format='json',
+        )
+        force_authenticate(request, User.objects.create_user('dash'))
+        with mock.patch.object(BatchView, 'run', record), db_routers.replica_reads():
+            response = BatchView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(seen, [True, True, True])
+
+
+# Render admin pages without a collectstatic manifest
+@override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class BookLoanChangelistTest(TestCase):
+    url = '/django-admin/core/bookloan/'
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        today = timezone.now().date()
+        books = [Book.objects.create(title=f'B{i}', author=f'Author {i % 2}', isbn=str(i)) for i in range(5)]
+        readers = [User.objects.create_user(f'r{i}') for i in range(5)]
+        self.loans = [
+            BookLoan.objects.create(user=reader, book=book, loan_date=today - timedelta(days=40 * i))
+            for i, (reader, book) in enumerate(zip(readers, books))
+        ]
+
+    def loan_counts(self, queries):
+        return [q['sql'] for q in queries if 'COUNT(' in q['sql'] and 'core_bookloan' in q['sql']]
+
+    @override_settings(ADMIN_CHANGELIST={'ESTIMATE_THRESHOLD': 3})
+    def test_estimated_count_above_threshold(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 5)
+        self.assertEqual(self.loan_counts(queries), [])
+
+    def test_exact_count_below_threshold(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['cl'].result_count, 5)
+        self.assertEqual(len(self.loan_counts(queries)), 1)
+
+    def test_keyset_pages(self):
+        seen = []
+        url = self.url
+        with mock.patch.object(BookLoanAdmin, 'list_per_page', 2):
+            while url:
+                cl = self.client.get(url).context['cl']
+                seen += [loan.pk for loan in cl.result_list]
+                url = cl.next_page_url and self.url + cl.next_page_url
+        self.assertEqual(seen, sorted((loan.pk for loan in self.loans), reverse=True))
+
+    def test_filter_choices_and_dates_are_cached(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Author 1')
+        self.assertFalse([q for q in queries if 'DISTINCT' in q['sql'] or 'MIN(' in q['sql']])
+        first = min(loan.loan_date for loan in self.loans)
+        self.assertContains(response, f'loan_date__year={first.year}')
+        response = self.client.get(self.url, {'author': 'Author 1'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+
+class TypeaheadTest(TestCase):
+
+    def setUp(self):
+        typeahead.reset_index()
+        self.addCleanup(typeahead.reset_index)
+        self.dune = Book.objects.create(title='Dune', author='Frank Herbert', isbn='978-0441172719')
+        self.messiah = Book.objects.create(title='Dune Messiah', author='Frank Herbert', isbn='978-0593098233')
+        self.zola = Book.objects.create(title='Germinal', author='Émile Zola', isbn='978-0140447422')
+        self.staff = User.objects.create_user('dunstan', first_name='Dun', last_name='Stan', is_staff=True)
+        for i in range(2):
+            BookLoan.objects.create(user=User.objects.create_user(f'r{i}'), book=self.messiah)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def suggest(self, q, **params):
+        response = self.client.get('/api/typeahead/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(r['type'], r['id']) for r in response.json()['results']]
+
+    def test_prefixes_rank_by_loans(self):
+        self.assertEqual(self.suggest('du', types='book'), [('book', self.messiah.pk), ('book', self.dune.pk)])
+        self.assertEqual(self.suggest('dune mes'), [('book', self.messiah.pk)])
+        self.assertEqual(self.suggest('emi'), [('book', self.zola.pk)])
+        self.assertEqual(self.suggest('97801404'), [('book', self.zola.pk)])
+        self.assertIn(('user', self.staff.pk), self.suggest('du'))
+        self.assertEqual(self.suggest('du', limit=1), [('book', self.messiah.pk)])
+
+    def test_readers_only_for_staff(self):
+        self.client.force_authenticate(User.objects.create_user('dunn'))
+        self.assertNotIn('user', {kind for kind, _ in self.suggest('du')})
+        self.assertEqual(self.client.get('/api/typeahead/', {'q': 'd'}).status_code, 400)
+
+    def test_writes_update_the_built_index(self):
+        self.suggest('du')
+        with self.captureOnCommitCallbacks(execute=True):
+            children = Book.objects.create(title='Children of Dune', author='Frank Herbert', isbn='1')
+            self.dune.title = 'Arrakis'
+            self.dune.save()
+            self.zola.delete()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.suggest('dune', types='book'), [('book', self.messiah.pk), ('book', children.pk)])
+            self.assertEqual(self.suggest('arr'), [('book', self.dune.pk)])
+            self.assertEqual(self.suggest('zola'), [])
+        self.assertFalse([q for q in queries if 'core_book' in q['sql']])
+
+    def test_stale_index_is_served_while_another_thread_rebuilds(self):
+        old = typeahead.get_index()
+        old.built_at -= typeahead.typeahead_settings()['MAX_AGE'] + 1
+        with typeahead._index_lock:
+            with self.assertNumQueries(0):
+                self.assertIs(typeahead.get_index(), old)
+        rebuilt = typeahead.get_index()
+        self.assertIsNot(rebuilt, old)
+        self.assertIs(typeahead.get_index(), rebuilt)
+
+    def test_memory_budget_keeps_the_most_borrowed(self):
+        entries = typeahead.ranked_entries()
+        index = typeahead.PrefixIndex(entries, memory_budget=1000)
+        self.assertFalse(index.complete)
+        self.assertEqual(index.entries, entries[:len(index.entries)])
+        self.assertEqual(index.entries[0][:2], ('book', self.messiah.pk))
+
+
+@override_settings(CHANGES={'SETTLE_SECONDS': 0, 'PAGE_SIZE': 500, 'RETENTION_DAYS': 30})
+class ChangesFeedTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('kiosk'))
+        self.book = Book.objects.create(title='Dune', author='Herbert', isbn='1')
+
+    def sync(self, token, **params):
+        response = self.client.get('/api/changes/', {'since': token, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_returns_latest_state_and_tombstones(self):
+        token = self.client.get('/api/changes/').json()['next']
+        self.assertEqual(self.sync(token)['books'], [])
+
+        reader = User.objects.create_user('reader')
+        loan = BookLoan.objects.create(user=reader, book=self.book)
+        loan.status = 'active'
+        loan.save()
+        gone = BookLoan.objects.create(user=reader, book=Book.objects.create(title='Emma', author='Austen', isbn='2'))
+        gone_book, gone_loan = gone.book_id, gone.pk
+        gone.delete()
+        Book.objects.filter(pk=gone_book).delete()
+        self.book.title = 'Dune (2nd ed.)'
+        self.book.save()
+
+        with self.assertNumQueries(3):  # records, books, loans
+            result = self.client.get('/api/changes/', {'since': token}).json()
+        self.assertEqual([book['title'] for book in result['books']], ['Dune (2nd ed.)'])
+        self.assertEqual([(loan['id'], loan['status'], loan['book']) for loan in result['loans']],
+                         [(loan.pk, 'active', self.book.pk)])
+        self.assertEqual(result['deleted'], {'books': [gone_book], 'loans': [gone_loan]})
+        self.assertFalse(result['more'])
+        self.assertEqual(self.sync(result['next'])['loans'], [])
+
+    def test_pages_and_compaction(self):
+        token = self.client.get('/api/changes/').json()['next']
+        for copies in range(2, 5):
+            self.book.total_copies = copies
+            self.book.save()
+        other = Book.objects.create(title='Emma', author='Austen', isbn='2')
+        with override_settings(CHANGES={'SETTLE_SECONDS': 0, 'PAGE_SIZE': 2, 'RETENTION_DAYS': 30}):
+            first = self.sync(token)
+            second = self.sync(first['next'])
+            third = self.sync(second['next'])
+        self.assertTrue(first['more'])
+        self.assertEqual([book['id'] for book in first['books'] + second['books']], [self.book.pk, self.book.pk, other.pk])
+        self.assertEqual(third['books'], [])
+
+        self.assertEqual(changes.compact_changes(), 3)
+        self.assertEqual([book['id'] for book in self.sync(token)['books']], [self.book.pk, other.pk])
+
+    def test_unsettled_changes_wait(self):
+        token = self.client.get('/api/changes/').json()['next']
+        with override_settings(CHANGES={'SETTLE_SECONDS': 60, 'PAGE_SIZE': 500, 'RETENTION_DAYS': 30}):
+            Book.objects.create(title='Emma', author='Austen', isbn='2')
+            result = self.sync(token)
+            self.assertEqual(result['books'], [])
+            self.assertEqual(result['next'].split('.')[0], token.split('.')[0])
+
+    def test_bad_tokens(self):
+        self.assertEqual(self.client.get('/api/changes/', {'since': 'nope'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/changes/', {'since': changes.make_token(0, issued=0)}).status_code, 410)
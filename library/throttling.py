@@ -0,0 +1,129 @@
+"""
+Rate limiting for the BookLoan API
+
+DRF's SimpleRateThrottle keeps a list of request timestamps per client and
+rewrites it on every request. These throttles use sliding-window counters
+instead: two integers per rate and client (current and previous window), so
+memory is fixed no matter the rate. The previous window is weighted by how
+much of it still overlaps the sliding window.
+
+All counters for a request are incremented and read in a single cache round
+trip (one pipeline on Redis).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Parse '60/min' style rates into (requests, seconds)"""
+    num, period = rate.split('/')
+    return int(num), DURATIONS[period[0]]
+
+
+class WindowCounterStore:
+    """Increment and read sliding-window counters in one cache round trip"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def hit(self, current_keys, previous_keys, timeout):
+        """
+        Increment every current-window counter and read every previous-window
+        counter. Returns (current_counts, previous_counts).
+        """
+        client_factory = getattr(getattr(self.cache, '_cache', None), 'get_client', None)
+        if client_factory is not None:
+            return self._hit_redis(client_factory(write=True), current_keys, previous_keys, timeout)
+        return self._hit_generic(current_keys, previous_keys, timeout)
+
+    def _hit_redis(self, client, current_keys, previous_keys, timeout):
+        pipeline = client.pipeline(transaction=False)
+        for key in current_keys:
+            key = self.cache.make_and_validate_key(key)
+            pipeline.incr(key)
+            pipeline.expire(key, timeout)
+        for key in previous_keys:
+            pipeline.get(self.cache.make_and_validate_key(key))
+        results = pipeline.execute()
+        current = results[:len(current_keys) * 2:2]
+        previous = [int(value or 0) for value in results[len(current_keys) * 2:]]
+        return current, previous
+
+    def _hit_generic(self, current_keys, previous_keys, timeout):
+        current = []
+        for key in current_keys:
+            self.cache.add(key, 0, timeout)
+            try:
+                current.append(self.cache.incr(key))
+            except ValueError:
+                # Expired between add() and incr()
+                self.cache.set(key, 1, timeout)
+                current.append(1)
+        found = self.cache.get_many(previous_keys)
+        return current, [int(found.get(key, 0)) for key in previous_keys]
+
+
+class TieredRateThrottle(BaseThrottle):
+    """
+    Apply the API_THROTTLING tiers together
+
+    Regular clients are limited by both BURST_RATE and SUSTAINED_RATE; staff
+    users get the separate ADMIN_RATE tier instead. Authenticated clients are
+    keyed by user id, anonymous ones by IP address.
+    """
+
+    cache_prefix = 'throttle'
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    @property
+    def config(self):
+        return getattr(settings, 'API_THROTTLING', {})
+
+    def get_rates(self, request):
+        if request.user and request.user.is_staff:
+            names = ['ADMIN_RATE']
+        else:
+            names = ['BURST_RATE', 'SUSTAINED_RATE']
+        return [(name.lower(), *parse_rate(self.config[name])) for name in names if self.config.get(name)]
+
+    def get_client_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'anon:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        rates = self.get_rates(request)
+        if not rates:
+            return True
+
+        now = time.time()
+        client = self.get_client_key(request)
+        current_keys, previous_keys = [], []
+        for name, _, duration in rates:
+            window = int(now // duration)
+            current_keys.append(f'{self.cache_prefix}:{name}:{client}:{window}')
+            previous_keys.append(f'{self.cache_prefix}:{name}:{client}:{window - 1}')
+
+        store = WindowCounterStore(caches[self.config.get('CACHE_ALIAS', 'default')])
+        timeout = max(duration for _, _, duration in rates) * 2
+        current, previous = store.hit(current_keys, previous_keys, timeout)
+
+        waits = []
+        for (name, num_requests, duration), cur, prev in zip(rates, current, previous):
+            elapsed = (now % duration) / duration
+            estimated = prev * (1 - elapsed) + cur
+            if estimated > num_requests:
+                waits.append(duration * (1 - elapsed))
+        self.wait_seconds = max(waits) if waits else None
+        return not waits
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,343 @@
+"""
+Typeahead suggestions for books and readers
+
+    GET /api/typeahead/?q=dune her&types=book,user&limit=10
+
+Every book (title, author, ISBN) and active user (username, first and last
+name) is an entry of an in-memory prefix index held by each process. Text
+is normalized to lowercase ASCII-folded word tokens; a query matches an
+entry when each of its words is a prefix of one of the entry's tokens.
+
+The index is a set of flat arrays rather than a trie or per-token objects:
+
+* entries are numbered by popularity (loans), most borrowed first, so an
+  entry's number is its rank and "top K" means "K smallest numbers";
+* ``vocabulary`` is the sorted list of distinct tokens, so the tokens
+  starting with a prefix are one contiguous slice found with ``bisect``;
+* ``postings`` holds, token after token, the ascending entry numbers of
+  each token, with ``starts`` marking where each token's run begins, so
+  the entries of a prefix are again one contiguous slice.
+
+It is built lazily on the first query and rebuilt after
+``API_TYPEAHEAD['MAX_AGE']`` seconds by the one request that claims the
+rebuild; the others keep searching the old index meanwhile, so only the
+very first build makes requests wait. Book and User writes in this process
+are applied right away through a small overlay (see library/signals.py);
+writes made by other workers show up at their next rebuild. Entries are
+added in rank order until ``MEMORY_BUDGET`` bytes are used, so on a huge
+catalogue the least borrowed entries are the ones left out.
+"""
+
+import heapq
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Count
+from rest_framework import serializers
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.models import Book, BookLoan
+
+BOOK, USER = 'book', 'user'
+KINDS = (BOOK, USER)
+
+WORD = re.compile(r'\w+')
+
+# Beyond the last character any token can start with
+PREFIX_END = '\U0010ffff'
+
+
+def typeahead_settings():
+    return {
+        'MIN_PREFIX': 2,
+        'LIMIT': 10,
+        'MAX_LIMIT': 50,
+        'MEMORY_BUDGET': 64 * 1024 * 1024,
+        'MAX_AGE': 15 * 60,
+        # Overlay entries after which the next query rebuilds the index
+        'MAX_PENDING': 10000,
+        # Prefixes matching more postings than this keep their sorted entries in a small LRU
+        'WIDE_PREFIX': 512,
+        'PREFIX_CACHE_SIZE': 256,
+        **getattr(settings, 'API_TYPEAHEAD', {}),
+    }
+
+
+def tokenize(text):
+    """Lowercase, accent-free word tokens of ``text``"""
+    if text.isascii():
+        return WORD.findall(text.lower())
+    folded = unicodedata.normalize('NFKD', text.casefold())
+    return WORD.findall(''.join(char for char in folded if not unicodedata.combining(char)))
+
+
+def book_entry(book_id, title, author, isbn):
+    return (BOOK, book_id, title, author, isbn)
+
+
+def user_entry(user_id, username, first_name, last_name):
+    return (USER, user_id, username, f'{first_name} {last_name}'.strip(), '')
+
+
+def entry_tokens(entry):
+    kind, _, label, detail, extra = entry
+    tokens = set(tokenize(label)) | set(tokenize(detail))
+    if extra:
+        # ISBNs are typed with or without hyphens
+        words = tokenize(extra)
+        tokens.update(words)
+        tokens.add(''.join(words))
+    return tokens
+
+
+def entry_size(entry, tokens):
+    """Rough bytes held for one entry and its postings"""
+    return sys.getsizeof(entry) + sum(map(sys.getsizeof, entry[2:])) + 8 * len(tokens)
+
+
+def ranked_entries():
+    """Books and active users, most loans first"""
+    book_loans = Counter(dict(BookLoan.objects.order_by().values_list('book_id').annotate(Count('id'))))
+    user_loans = Counter(dict(BookLoan.objects.order_by().values_list('user_id').annotate(Count('id'))))
+    entries = [
+        (book_loans[row[0]], book_entry(*row))
+        for row in Book.objects.values_list('id', 'title', 'author', 'isbn').iterator(chunk_size=10000)
+    ]
+    entries += [
+        (user_loans[row[0]], user_entry(*row))
+        for row in User.objects.filter(is_active=True)
+        .values_list('id', 'username', 'first_name', 'last_name').iterator(chunk_size=10000)
+    ]
+    entries.sort(key=lambda item: (-item[0], item[1][0], item[1][1]))
+    return [entry for _, entry in entries]
+
+
+class PrefixIndex:
+    """Sorted-array prefix index over ranked entries, plus an overlay of later writes"""
+
+    def __init__(self, entries, memory_budget):
+        self.built_at = time.monotonic()
+        self.entries = []
+        self.complete = True
+        postings_by_token = {}
+        used = 0
+        for entry in entries:
+            tokens = entry_tokens(entry)
+            used += entry_size(entry, tokens) + sum(
+                sys.getsizeof(token) + 16 for token in tokens if token not in postings_by_token
+            )
+            if used > memory_budget:
+                self.complete = False
+                break
+            number = len(self.entries)
+            self.entries.append(entry)
+            for token in tokens:
+                postings_by_token.setdefault(token, array('l')).append(number)
+
+        self.vocabulary = sorted(postings_by_token)
+        self.starts = array('l', [0])
+        self.postings = array('l')
+        for token in self.vocabulary:
+            self.postings.extend(postings_by_token[token])
+            self.starts.append(len(self.postings))
+
+        self.positions = {(kind, pk): number for number, (kind, pk, *_) in enumerate(self.entries)}
+        # Entries whose base postings are out of date (changed or deleted)
+        self.stale = set()
+        # Sorted (token, entry number) pairs of entries added or changed since the build
+        self.overlay = []
+        self.prefix_cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return len(self.overlay) + len(self.stale)
+
+    def upsert(self, entry):
+        with self.lock:
+            number = self.positions.get(entry[:2])
+            if number is not None and self.entries[number] == entry:
+                return  # e.g. a login updating last_login
+            if number is None:
+                number = len(self.entries)
+                self.entries.append(entry)
+                self.positions[entry[:2]] = number
+            else:
+                self.stale.add(number)
+                self.entries[number] = entry
+                self.overlay = [item for item in self.overlay if item[1] != number]
+            for token in entry_tokens(entry):
+                insort(self.overlay, (token, number))
+
+    def remove(self, kind, pk):
+        with self.lock:
+            number = self.positions.pop((kind, pk), None)
+            if number is not None:
+                self.stale.add(number)
+                self.entries[number] = None
+                self.overlay = [item for item in self.overlay if item[1] != number]
+
+    def base_candidates(self, prefix):
+        """Entry numbers with a base token starting with ``prefix``, ascending"""
+        low = bisect_left(self.vocabulary, prefix)
+        high = bisect_left(self.vocabulary, prefix + PREFIX_END, low)
+        start, end = self.starts[low], self.starts[high]
+        if end - start <= typeahead_settings()['WIDE_PREFIX']:
+            return sorted(set(self.postings[start:end]))
+        with self.lock:
+            cached = self.prefix_cache.get(prefix)
+            if cached is not None:
+                self.prefix_cache.move_to_end(prefix)
+                return cached
+        cached = array('l', sorted(set(self.postings[start:end])))
+        with self.lock:
+            self.prefix_cache[prefix] = cached
+            if len(self.prefix_cache) > typeahead_settings()['PREFIX_CACHE_SIZE']:
+                self.prefix_cache.popitem(last=False)
+        return cached
+
+    def changed_candidates(self, prefix):
+        """Entry numbers with an overlay token starting with ``prefix``"""
+        overlay = self.overlay
+        numbers = set()
+        for position in range(bisect_left(overlay, (prefix,)), len(overlay)):
+            token, number = overlay[position]
+            if not token.startswith(prefix):
+                break
+            numbers.add(number)
+        return numbers
+
+    def search(self, query, kinds=KINDS, limit=10):
+        """Up to ``limit`` entries matching every word of ``query``, by rank"""
+        matches = sorted((PrefixMatch(self, word) for word in set(tokenize(query))), key=len)
+        if not matches:
+            return []
+        # Walk the rarest word's entries; the other words only need membership tests
+        driver, others = matches[0], matches[1:]
+        results = []
+        for number in driver:
+            entry = self.entries[number]
+            if entry is None or entry[0] not in kinds:
+                continue
+            if all(number in match for match in others):
+                results.append(entry)
+                if len(results) == limit:
+                    break
+        return results
+
+
+class PrefixMatch:
+    """The entries matching one query word, in rank order"""
+
+    def __init__(self, index, prefix):
+        self.base = index.base_candidates(prefix)
+        self.stale = index.stale
+        self.changed = index.changed_candidates(prefix)
+
+    def __len__(self):
+        return len(self.base) + len(self.changed)
+
+    def __contains__(self, number):
+        if number in self.changed:
+            return True
+        if number in self.stale:
+            return False
+        position = bisect_left(self.base, number)
+        return position < len(self.base) and self.base[position] == number
+
+    def __iter__(self):
+        stale = self.stale
+        base = (number for number in self.base if number not in stale)
+        previous = None
+        for number in heapq.merge(base, sorted(self.changed)):
+            if number != previous:
+                yield number
+            previous = number
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """This process's index, built on first use and when it is due"""
+    global _index
+    config = typeahead_settings()
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                _index = PrefixIndex(ranked_entries(), config['MEMORY_BUDGET'])
+            return _index
+    if time.monotonic() - index.built_at > config['MAX_AGE'] or index.pending > config['MAX_PENDING']:
+        # Another thread already rebuilding: keep serving the current index
+        if _index_lock.acquire(blocking=False):
+            try:
+                if _index is index:
+                    _index = PrefixIndex(ranked_entries(), config['MEMORY_BUDGET'])
+                index = _index
+            finally:
+                _index_lock.release()
+    return index
+
+
+def built_index():
+    """The index if this process has built one, else None (nothing to keep up to date)"""
+    return _index
+
+
+def reset_index():
+    global _index
+    _index = None
+
+
+class TypeaheadQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(trim_whitespace=True)
+    types = serializers.CharField(required=False)
+    limit = serializers.IntegerField(required=False, min_value=1)
+
+    def validate_q(self, value):
+        minimum = typeahead_settings()['MIN_PREFIX']
+        if len(value) < minimum:
+            raise serializers.ValidationError(f'Type at least {minimum} characters')
+        return value
+
+    def validate_types(self, value):
+        types = [kind.strip() for kind in value.split(',') if kind.strip()]
+        unknown = set(types) - set(KINDS)
+        if unknown:
+            raise serializers.ValidationError(f"Unknown types: {', '.join(sorted(unknown))}")
+        return tuple(types)
+
+
+class TypeaheadView(APIView):
+    """Suggest books and (for staff) readers for what has been typed so far"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = TypeaheadQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        config = typeahead_settings()
+        kinds = serializer.validated_data.get('types') or KINDS
+        if not request.user.is_staff:
+            kinds = tuple(kind for kind in kinds if kind != USER)
+        limit = min(serializer.validated_data.get('limit') or config['LIMIT'], config['MAX_LIMIT'])
+
+        entries = get_index().search(serializer.validated_data['q'], kinds, limit) if kinds else []
+        return Response({
+            'query': serializer.validated_data['q'],
+            'results': [
+                {'type': kind, 'id': pk, 'label': label, 'detail': detail}
+                for kind, pk, label, detail, _ in entries
+            ],
+        })
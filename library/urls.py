@@ -1,23 +1,47 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from rest_framework.authtoken.views import obtain_auth_token
 
-from .views import BookLoanViewSet, BookViewSet, DashboardStatsView
+from .batch import BatchView
+from .typeahead import TypeaheadView
+from .views import (
+    BookLoanViewSet,
+    BookViewSet,
+    BranchViewSet,
+    ChangesView,
+    DashboardStatsView,
+    LogoutView,
+    ObtainExpiringAuthToken,
+    ScanView,
+)
 
 # Create a router for ViewSets
 router = DefaultRouter()
 router.register(r'book-loans', BookLoanViewSet, basename='bookloan')
 router.register(r'books', BookViewSet, basename='book')
+router.register(r'branches', BranchViewSet, basename='branch')
 
 app_name = 'api'
 
 urlpatterns = [
     # API Authentication
-    path('auth/token/', obtain_auth_token, name='api_token_auth'),
+    path('auth/token/', ObtainExpiringAuthToken.as_view(), name='api_token_auth'),
+    path('auth/logout/', LogoutView.as_view(), name='api_logout'),
     
     # Dashboard stats
     path('dashboard/stats/', DashboardStatsView.as_view(), name='dashboard_stats'),
     
+    # Several GETs in one round trip
+    path('batch/', BatchView.as_view(), name='batch'),
+    
+    # Suggestions while typing (books; readers for staff)
+    path('typeahead/', TypeaheadView.as_view(), name='typeahead'),
+    
+    # Incremental sync of books and loans
+    path('changes/', ChangesView.as_view(), name='changes'),
+    
+    # Desk circulation by copy barcode
+    path('scan/<str:barcode>/', ScanView.as_view(), name='scan'),
+    
     # Loan statistics (for compatibility with Vue component)
     path('loan-statistics/', BookLoanViewSet.as_view({'get': 'statistics'}), name='loan_statistics'),
     
@@ -29,10 +53,14 @@ urlpatterns = [
 API Endpoints Available:
 
 Authentication:
-- POST /api/auth/token/ - Get auth token
+- POST /api/auth/token/ - Get auth token (expired tokens are replaced)
+- POST /api/auth/logout/ - Delete the current auth token
 
 Dashboard:
 - GET /api/dashboard/stats/ - Get dashboard statistics
+- POST /api/batch/ - Run several GETs at once ({"requests": [{"path": "/api/..."}]})
+- GET /api/changes/?since=TOKEN - Books and loans changed or deleted since a sync token
+- GET /api/typeahead/?q=dune&types=book,user&limit=10 - Book and reader suggestions by word prefix
 
 Book Loans:
 - GET /api/book-loans/ - List all loans (with filtering/search)
@@ -52,7 +80,18 @@ Book Loan Actions:
 Books:
 - GET /api/books/ - List all books (read-only)
 - GET /api/books/{id}/ - Get specific book
-- GET /api/books/available/ - Get available books
+- GET /api/books/available/ - Get available books (?branch=ID: available at that branch)
+- GET /api/books/forecast/?ids=1,2 - Next-available date of books with no copies left
+- GET /api/books/{id}/related/ - Books also borrowed by this book's readers
+- GET /api/books/{id}/availability/?at=2025-01-31 - Copies out / available at a past time
+
+Branches:
+- GET /api/branches/ - List branches
+- GET /api/branches/{id}/stock/?available=1 - Per-book stock of a branch
+- POST /api/branches/{id}/transfer/ - Move copies to another branch (staff)
+
+Circulation:
+- POST /api/scan/{barcode}/ - Check a copy out ({"user_id": N}) or return it ({"branch_id": B})
 
 Query Parameters for Filtering:
 - status: Filter by loan status (borrowed, returned)
@@ -60,6 +99,7 @@ Query Parameters for Filtering:
 - user__username: Filter by username
 - search: Search in user names, book titles, authors, notes
 - ordering: Order by loan_date, due_date, return_date, created_at
+- include_archived=1: Also list loans moved to the archive (manage.py archive_loans)
 
 Examples:
 - GET /api/book-loans/?status=borrowed - Get active loans
@@ -1,29 +1,48 @@
 from django.utils import timezone
-from django.db.models import Q, F
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db import transaction
+from django.db.models import Q, F, BooleanField, Value
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from datetime import datetime, timedelta
 
-from core.models import BookLoan, Book
+from core import changes, forecast, history, outbox, stock
+from core.models import BookLoan, BookLoanArchive, Book, BookNeighbor, BookStock, Branch, ChangeRecord, LoanEvent
+from .fieldsets import SparseFieldsViewMixin
+from . import circulation
+from .handlers import LOAN_STATUS_CHANGED
+from .idempotency import IdempotentViewMixin
+from .profiling import ProfiledViewMixin
 from .serializers import (
     BookLoanSerializer, 
+    BookLoanArchiveSerializer,
     BookLoanCreateSerializer, 
+    LoanBookSerializer,
+    BookNeighborSerializer,
     BookSerializer, 
+    BookStockSerializer,
+    BranchSerializer,
+    StockTransferSerializer,
     UserSerializer
 )
 
 
-class BookLoanViewSet(viewsets.ModelViewSet):
+class BookLoanViewSet(IdempotentViewMixin, ProfiledViewMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing BookLoan entries
-    Provides CRUD operations and additional features
+    Provides CRUD operations and additional features;
+    reads accept ?fields= and ?expand= (see library.fieldsets),
+    writes accept an Idempotency-Key header (see library.idempotency)
     """
     serializer_class = BookLoanSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    sparse_actions = ('list', 'retrieve', 'overdue', 'user_loans')
+    idempotent_actions = IdempotentViewMixin.idempotent_actions + ('return_book', 'renew_loan')
     
     # Filter options
     filterset_fields = ['status', 'user', 'book', 'user__username']
@@ -35,22 +54,8 @@ class BookLoanViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Optimized queryset with related fields"""
         queryset = BookLoan.objects.select_related('user', 'book').all()
-        
-        # Add calculated field for overdue days
-        today = timezone.now().date()
-        queryset = queryset.extra(
-            select={
-                'days_overdue': f"""
-                    CASE 
-                        WHEN status = 'borrowed' AND due_date < '{today}' 
-                        THEN (JULIANDAY('{today}') - JULIANDAY(due_date))
-                        ELSE 0 
-                    END
-                """
-            }
-        )
-        
-        return queryset
+        # days_overdue is computed by the BookLoan.days_overdue property
+        return self.apply_fieldset(queryset)
 
     def get_serializer_class(self):
         """Use different serializer for create action"""
@@ -58,13 +63,54 @@ class BookLoanViewSet(viewsets.ModelViewSet):
             return BookLoanCreateSerializer
         return BookLoanSerializer
 
+    def include_archived(self):
+        return self.request.query_params.get('include_archived') in ('1', 'true', 'yes')
+
+    def list(self, request, *args, **kwargs):
+        """List loans; ?include_archived=1 also returns archived loans"""
+        if not self.include_archived():
+            return super().list(request, *args, **kwargs)
+
+        live = self.filter_queryset(self.get_queryset())
+        archived = self.filter_queryset(BookLoanArchive.objects.select_related('user', 'book'))
+
+        # Paginate over a narrow union of ids and sort keys, then load one page
+        ordering = list(live.query.order_by or self.ordering)
+        sort_fields = [field.lstrip('-') for field in ordering]
+        keys = live.order_by().values('id', *sort_fields).annotate(
+            archived=Value(False, output_field=BooleanField())
+        ).union(
+            archived.order_by().values('id', *sort_fields).annotate(
+                archived=Value(True, output_field=BooleanField())
+            ),
+            all=True,
+        ).order_by(*ordering)
+
+        page = self.paginate_queryset(keys)
+        rows = page if page is not None else list(keys)
+        fields, expand = self.get_fieldset()
+        archives = BookLoanArchive.objects.select_related('user', 'book')
+        if fields is not None or expand is not None:
+            archives = BookLoanArchiveSerializer.optimize_queryset(archives, fields, expand)
+        loans = self.get_queryset().in_bulk([row['id'] for row in rows if not row['archived']])
+        archives = archives.in_bulk([row['id'] for row in rows if row['archived']])
+        kwargs = {'context': self.get_serializer_context(), 'fields': fields, 'expand': expand}
+        data = [
+            BookLoanArchiveSerializer(archives[row['id']], **kwargs).data if row['archived']
+            else BookLoanSerializer(loans[row['id']], **kwargs).data
+            for row in rows
+        ]
+
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
     @action(detail=False, methods=['get'])
     def overdue(self, request):
         """Get all overdue loans"""
         today = timezone.now().date()
         overdue_loans = self.get_queryset().filter(
-            status='active',
-            due_date__lt=today
+            Q(status='overdue') | Q(status='active', due_date__lt=today)
         )
         
         serializer = self.get_serializer(overdue_loans, many=True)
@@ -80,8 +126,7 @@ class BookLoanViewSet(viewsets.ModelViewSet):
             'totalLoans': queryset.count(),
             'activeLoans': queryset.filter(status='active').count(),
             'overdueLoans': queryset.filter(
-                status='active',
-                due_date__lt=today
+                Q(status='overdue') | Q(status='active', due_date__lt=today)
             ).count(),
         }
         
@@ -89,22 +134,37 @@ class BookLoanViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def return_book(self, request, pk=None):
-        """Mark a book as returned"""
+        """Mark a book as returned; {"branch_id": B} when returned at another branch"""
         loan = self.get_object()
+        return_branch_id = request.data.get('branch_id')
+        if return_branch_id is not None:
+            try:
+                return_branch_id = Branch.objects.values_list('pk', flat=True).get(pk=int(return_branch_id))
+            except (TypeError, ValueError, Branch.DoesNotExist):
+                return Response({'error': 'Unknown branch'}, status=status.HTTP_400_BAD_REQUEST)
         
-        if loan.status != 'active':
+        if loan.status not in LoanEvent.OUT_STATUSES:
             return Response(
                 {'error': 'This book is not currently on loan'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        loan.status = 'returned'
-        loan.return_date = timezone.now().date()
-        loan.save()
-        
-        # Increase book availability
-        loan.book.available_copies += 1
-        loan.book.save()
+        with transaction.atomic():
+            old_status = loan.status
+            loan.status = 'returned'
+            loan.return_date = timezone.now().date()
+            loan.save()
+            
+            # Book availability is increased by the outbox worker
+            outbox.publish(
+                LOAN_STATUS_CHANGED,
+                loan_id=loan.id,
+                book_id=loan.book_id,
+                old_status=old_status,
+                new_status='returned',
+                branch_id=loan.branch_id,
+                return_branch_id=return_branch_id,
+            )
         
         serializer = self.get_serializer(loan)
         return Response(serializer.data)
@@ -142,9 +202,10 @@ class BookLoanViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class BookViewSet(viewsets.ReadOnlyModelViewSet):
+class BookViewSet(ProfiledViewMixin, SparseFieldsViewMixin, viewsets.ReadOnlyModelViewSet):
     """
-    ViewSet for Books (read-only for loan management)
+    ViewSet for Books (read-only for loan management);
+    reads accept ?fields= (see library.fieldsets)
     """
     queryset = Book.objects.all()
     serializer_class = BookSerializer
@@ -152,21 +213,260 @@ class BookViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['author']
     search_fields = ['title', 'author', 'isbn']
+    sparse_actions = ('list', 'retrieve', 'available')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields, _ = self.get_fieldset()
+        if fields is None or 'next_available_date' in fields:
+            queryset = forecast.with_forecast(queryset)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def forecast(self, request):
+        """
+        Next-available dates for a page of books (?ids=1,2,3 or the list filters)
+
+        The books and their forecasts come from a single query.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).only('id', 'available_copies')
+        if request.query_params.get('ids'):
+            try:
+                ids = [int(pk) for pk in request.query_params['ids'].split(',') if pk.strip()]
+            except ValueError:
+                return Response({'error': 'ids must be a comma-separated list of integers'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(pk__in=ids)
+        page = self.paginate_queryset(queryset)
+        fields = ['id', 'available_copies', 'next_available_date']
+        serializer = self.get_serializer(page if page is not None else queryset, many=True, fields=fields)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def available(self, request):
-        """Get books available for loan"""
-        available_books = self.queryset.filter(available_copies__gt=0)
+        """Get books available for loan, anywhere or at one branch (?branch=ID)"""
+        available_books = self.get_queryset().filter(available_copies__gt=0)
+        branch = request.query_params.get('branch')
+        if branch:
+            if not branch.isdigit():
+                return Response({'error': 'branch must be a branch id'}, status=status.HTTP_400_BAD_REQUEST)
+            # Served by the partial (branch) index over stock rows with copies on the shelf
+            available_books = available_books.filter(stock__branch_id=branch, stock__available_copies__gt=0)
         serializer = self.get_serializer(available_books, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """
+        "Patrons also borrowed" for a book, precomputed by build_recommendations
+
+        One lookup on the (book, rank) index; the book itself is only
+        fetched to tell a missing book from one without neighbors.
+        """
+        if not str(pk).isdigit():
+            raise NotFound()
+        neighbors = BookNeighbor.objects.filter(book_id=pk).select_related('neighbor').order_by('rank')
+        serializer = BookNeighborSerializer(neighbors, many=True)
+        if not serializer.data and not Book.objects.filter(pk=pk).exists():
+            raise NotFound()
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        """Get how many copies were out at a past time (?at=YYYY-MM-DD[THH:MM:SS])"""
+        book = self.get_object()
+        at = timezone.now()
+        if request.query_params.get('at'):
+            value = request.query_params['at']
+            at = parse_datetime(value)
+            if at is None and parse_date(value) is not None:
+                # A bare date means the end of that day
+                at = datetime.combine(parse_date(value), datetime.max.time())
+            if at is None:
+                return Response(
+                    {'error': 'at must be an ISO date or datetime'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+
+        copies_out, snapshot_at, replayed = history.copies_out_at(book.id, at)
+        return Response({
+            'book': book.id,
+            'at': at,
+            'copiesOut': copies_out,
+            'availableCopies': max(book.total_copies - copies_out, 0),
+            'snapshotAt': snapshot_at,
+            'eventsReplayed': replayed,
+        })
+
+
+class BranchViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Library branches, their stock and transfers between them
+    """
+    queryset = Branch.objects.all()
+    serializer_class = BranchSerializer
+    permission_classes = [IsAuthenticated]
+
+    @action(detail=True, methods=['get'])
+    def stock(self, request, pk=None):
+        """Stock rows of a branch; ?available=1 keeps books with copies on the shelf"""
+        rows = BookStock.objects.filter(branch_id=self.get_object().pk).order_by('book')
+        if request.query_params.get('available') in ('1', 'true', 'yes'):
+            rows = rows.filter(available_copies__gt=0)
+        page = self.paginate_queryset(rows)
+        serializer = BookStockSerializer(page if page is not None else rows, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
+    def transfer(self, request, pk=None):
+        """Move shelved copies of a book from this branch to another"""
+        source = self.get_object()
+        serializer = StockTransferSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if not Branch.objects.filter(pk=data['to_branch_id']).exists():
+            return Response({'error': 'Unknown destination branch'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            transfer = stock.transfer(
+                data['book_id'], source.pk, data['to_branch_id'], data['copies'], user=request.user,
+            )
+        except (ValueError, stock.InsufficientStock) as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'id': transfer.id,
+            'book': transfer.book_id,
+            'from_branch': transfer.from_branch_id,
+            'to_branch': transfer.to_branch_id,
+            'copies': transfer.copies,
+        }, status=status.HTTP_201_CREATED)
+
 
 # Additional API Views for dashboard data
 from rest_framework.views import APIView
+from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.views import ObtainAuthToken
 from django.contrib.auth.models import User
 
+from .authentication import is_expired
+
+
+class ObtainExpiringAuthToken(ObtainAuthToken):
+    """
+    Return the user's token, replacing it if it has expired (TOKEN_AUTH['TOKEN_TTL'])
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token, created = Token.objects.get_or_create(user=user)
+        if not created and is_expired(token):
+            token.delete()
+            token = Token.objects.create(user=user)
+        return Response({'token': token.key})
+
+
+class LogoutView(APIView):
+    """
+    Delete the current auth token
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if isinstance(request.auth, Token):
+            Token.objects.filter(key=request.auth.key).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ScanView(IdempotentViewMixin, ProfiledViewMixin, APIView):
+    """
+    Check out or return a copy by its barcode in one request
+
+    POST /api/scan/{barcode}/ with {"user_id": N} checks a shelved copy out
+    to reader N; scanning a copy that is on loan returns it, to the desk's
+    branch when {"branch_id": B} is given.
+    """
+    permission_classes = [IsAuthenticated]
+    idempotent_actions = ('post',)
+
+    # Loan fields that need no query beyond the scan itself
+    loan_fields = {'id', 'user', 'book', 'copy', 'branch', 'loan_date', 'due_date', 'return_date', 'status'}
+
+    def post(self, request, barcode):
+        ids = {}
+        for name in ('user_id', 'branch_id'):
+            ids[name] = request.data.get(name)
+            if ids[name] is not None:
+                try:
+                    ids[name] = int(ids[name])
+                except (TypeError, ValueError):
+                    return Response({name: 'Must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        action, loan = circulation.scan(barcode, **ids)
+        return Response({
+            'action': action,
+            'barcode': barcode,
+            'loan': BookLoanSerializer(loan, fields=self.loan_fields).data if loan is not None else None,
+        }, status=status.HTTP_201_CREATED if action == circulation.CHECKOUT else status.HTTP_200_OK)
+
+
+class ChangesView(ProfiledViewMixin, APIView):
+    """
+    Books and loans created, updated or deleted since a sync token
+
+    GET /api/changes/ returns a token for the current state; after loading
+    the full lists once, clients pass it back as ?since= and apply the
+    changed rows and deleted ids. While "more" is true, they fetch again
+    right away with the new "next" token. 410 means the token is too old
+    to catch up from and the lists have to be reloaded.
+    """
+    permission_classes = [IsAuthenticated]
+
+    # Relations are sent as ids: clients already have (or sync) the books
+    loan_fields = {
+        'id', 'user', 'book', 'copy', 'branch', 'loan_date', 'due_date', 'return_date',
+        'status', 'notes', 'fine_amount', 'updated_at',
+    }
+
+    def get(self, request):
+        since = request.query_params.get('since')
+        if not since:
+            return Response(self.payload(changes.settled_sequence()))
+        try:
+            sequence = changes.parse_token(since)
+        except changes.ExpiredToken as error:
+            return Response({'detail': str(error)}, status=status.HTTP_410_GONE)
+        except changes.InvalidToken as error:
+            return Response({'since': [str(error)]}, status=status.HTTP_400_BAD_REQUEST)
+
+        changed, deleted, last_sequence, more = changes.read_changes(sequence)
+        books = list(Book.objects.filter(id__in=changed[ChangeRecord.BOOK]).order_by('id'))
+        loans = list(BookLoan.objects.filter(id__in=changed[ChangeRecord.LOAN]).order_by('id'))
+        # Deleted after the page's last record: report them now, the tombstone comes later
+        deleted[ChangeRecord.BOOK] += sorted(set(changed[ChangeRecord.BOOK]) - {book.id for book in books})
+        deleted[ChangeRecord.LOAN] += sorted(set(changed[ChangeRecord.LOAN]) - {loan.id for loan in loans})
+        return Response(self.payload(last_sequence, books, loans, deleted, more))
+
+    def payload(self, sequence, books=(), loans=(), deleted=None, more=False):
+        deleted = deleted or {}
+        return {
+            'next': changes.make_token(sequence),
+            'more': more,
+            'books': LoanBookSerializer(books, many=True).data,
+            'loans': BookLoanSerializer(loans, many=True, fields=self.loan_fields).data,
+            'deleted': {
+                'books': deleted.get(ChangeRecord.BOOK, []),
+                'loans': deleted.get(ChangeRecord.LOAN, []),
+            },
+        }
+
 
-class DashboardStatsView(APIView):
+class DashboardStatsView(ProfiledViewMixin, APIView):
     """
     Dashboard statistics view
     """
@@ -184,8 +484,7 @@ class DashboardStatsView(APIView):
         
         # Overdue loans
         overdue_loans = BookLoan.objects.filter(
-            status='active',
-            due_date__lt=today
+            Q(status='overdue') | Q(status='active', due_date__lt=today)
         ).count()
         
         # Recent activity
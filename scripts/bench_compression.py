@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Benchmark bytes on the wire for /api/books/ with and without compression.
+
+Seeds a temporary SQLite database with books, requests one page of
+/api/books/ with each Accept-Encoding and reports the response size and
+the time spent in the request, compression included.
+
+Usage:
+    python scripts/bench_compression.py
+    python scripts/bench_compression.py --books 5000 --requests 200
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookloan.settings')
+
+
+def seed(count):
+    from core.models import Book
+
+    Book.objects.bulk_create(
+        Book(
+            title=f'The Collected Works of Author {i} Volume {i % 12}',
+            author=f'Author {i % 500}',
+            isbn=f'{9780000000000 + i}',
+            total_copies=3,
+            available_copies=i % 4,
+        )
+        for i in range(count)
+    )
+
+
+def run_mode(client, label, accept_encoding, count):
+    sizes, timings = [], []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get('/api/books/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        timings.append((time.perf_counter() - start) * 1000)
+        sizes.append(len(response.content))
+    encoding = response.get('Content-Encoding', 'identity')
+    print(
+        f'{label:<10} {encoding:<9} bytes={sizes[-1]:>8} '
+        f'mean={statistics.mean(timings):7.3f}ms p50={sorted(timings)[len(timings) // 2]:7.3f}ms'
+    )
+    return sizes[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=100)
+    args = parser.parse_args()
+
+    from django.conf import settings
+
+    settings.DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': str(Path(tempfile.mkdtemp()) / 'bench.sqlite3'),
+    }
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                       'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.API_LOGGING = {**settings.API_LOGGING, 'LOG_PERFORMANCE': False}
+
+    import django
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from rest_framework.test import APIClient
+
+    from bookloan import compression
+
+    call_command('migrate', verbosity=0)
+    seed(args.books)
+    client = APIClient()
+    client.force_authenticate(User.objects.create_user('bench'))
+
+    print(f'{args.books} books, one page of /api/books/, {args.requests} requests per mode')
+    if compression.brotli is None:
+        print('brotli is not installed (pip install bookloan[compression]); br falls back to gzip')
+    identity = run_mode(client, 'identity', 'identity', args.requests)
+    for label, accept in (('gzip', 'gzip'), ('br', 'br, gzip')):
+        size = run_mode(client, label, accept, args.requests)
+        print(f'{"":<10} {100 * (1 - size / identity):.1f}% smaller than identity')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Benchmark per-request database latency: new connections, persistent
+connections and the psycopg pool, one after the other on the same database.
+
+Each simulated request goes through Django's request_started/request_finished
+signals (which open and close or return connections according to CONN_MAX_AGE
+and the pool) and runs a single query, so the difference between the modes is
+the connection setup cost. The pool only exists on PostgreSQL with
+psycopg[pool] installed; it is skipped otherwise.
+
+Usage:
+    python scripts/bench_db_pooling.py               # configured database (Postgres)
+    python scripts/bench_db_pooling.py --sqlite      # local SQLite stand-in, no pool
+    python scripts/bench_db_pooling.py --requests 2000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookloan.settings')
+
+
+def simulate_requests(count):
+    from django.core import signals
+    from django.db import connection
+
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        signals.request_started.send(sender=None)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        signals.request_finished.send(sender=None)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def run_mode(label, conn_max_age, count, pool=None):
+    from django.db import connection
+
+    connection.close()
+    if hasattr(connection, 'close_pool'):
+        connection.close_pool()
+    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    connection.settings_dict['OPTIONS'].pop('pool', None)
+    if pool is not None:
+        connection.settings_dict['OPTIONS']['pool'] = pool
+    connection.close_at = None
+    simulate_requests(min(count, 50))  # warm up
+    timings = sorted(simulate_requests(count))
+    connection.close()
+    print(
+        f'{label:<24} mean={statistics.mean(timings):7.3f}ms '
+        f'p50={timings[len(timings) // 2]:7.3f}ms '
+        f'p99={timings[int(len(timings) * 0.99) - 1]:7.3f}ms'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--sqlite', action='store_true', help='use a temporary SQLite file database')
+    args = parser.parse_args()
+
+    from django.conf import settings
+
+    if args.sqlite:
+        database = Path(tempfile.mkdtemp()) / 'bench.sqlite3'
+        settings.DATABASES['default'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': str(database),
+            'CONN_HEALTH_CHECKS': True,
+        }
+
+    import django
+    django.setup()
+
+    from django.db import connection
+
+    print(f'Backend: {connection.vendor}, {args.requests} requests')
+    pool = connection.settings_dict['OPTIONS'].get('pool') or {'min_size': 2, 'max_size': 10, 'timeout': 10}
+    run_mode('new connection', 0, args.requests)
+    run_mode('persistent (60s)', 60, args.requests)
+    if connection.vendor != 'postgresql':
+        print('psycopg pool             skipped: PostgreSQL only')
+        return
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        print('psycopg pool             skipped: install psycopg[pool]')
+        return
+    run_mode('psycopg pool', 0, args.requests, pool=pool)
+
+
+if __name__ == '__main__':
+    main()
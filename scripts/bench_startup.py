@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Benchmark cold start: import/setup time and first-request latency.
+
+Each run starts a fresh interpreter that builds the WSGI application for a
+settings module and sends it two anonymous GET /api/books/ requests, the
+way a freshly scheduled pod would receive traffic. Reported per profile
+(median of the runs):
+
+    setup    time to import the project and build the WSGI application
+    first    latency of the first request (lazy imports, URLconf, DRF setup)
+    forked   latency of the first request in a worker forked after
+             bookloan.prefork.warm_up(), as with gunicorn preload_app
+    second   latency of a warm request, for comparison
+    modules  number of modules imported after the first request
+
+Usage:
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --runs 10
+    python scripts/bench_startup.py --settings bookloan.settings_api_worker
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PROFILES = ['bookloan.settings', 'bookloan.settings_api_worker']
+
+
+def request(application, path):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+    }
+    status = []
+    start = time.perf_counter()
+    body = b''.join(application(environ, lambda code, headers, exc_info=None: status.append(code)))
+    elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, status[0], len(body)
+
+
+def child():
+    """Measure one cold start in this (fresh) interpreter"""
+    start = time.perf_counter()
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+    setup = (time.perf_counter() - start) * 1000
+    forked = first_request_after_fork(application)
+    first, status, _ = request(application, '/api/books/')
+    second, _, _ = request(application, '/api/books/')
+    print(json.dumps({
+        'setup': setup, 'first': first, 'forked': forked, 'second': second,
+        'status': status, 'modules': len(sys.modules),
+    }))
+
+
+def first_request_after_fork(application):
+    """Warm up like a preloading master, fork, and time the worker's first request"""
+    from bookloan.prefork import after_fork, warm_up
+
+    read_end, write_end = os.pipe()
+    # Warm a fork of this process, so the cold numbers above stay cold
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        warm_up()
+        worker = os.fork()
+        if worker == 0:
+            after_fork()
+            elapsed, _, _ = request(application, '/api/books/')
+            os.write(write_end, str(elapsed).encode())
+            os._exit(0)
+        os.waitpid(worker, 0)
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as result:
+        elapsed = float(result.read())
+    os.waitpid(pid, 0)
+    return elapsed
+
+
+def run(settings_module, runs):
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': settings_module,
+        # No Redis needed: anonymous requests are rejected before throttling
+        'CACHE_BACKEND': os.environ.get('CACHE_BACKEND', 'locmem'),
+    }
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, __file__, '--child'],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    median = {key: statistics.median(sample[key] for sample in samples) for key in ('setup', 'first', 'forked', 'second')}
+    print(
+        f'{settings_module:<32} setup={median["setup"]:7.1f}ms first={median["first"]:7.1f}ms '
+        f'forked={median["forked"]:6.2f}ms second={median["second"]:6.2f}ms '
+        f'modules={samples[-1]["modules"]} status={samples[-1]["status"]}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--settings', action='append', help='settings module to measure (repeatable)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, str(ROOT))
+        child()
+        return
+    for settings_module in args.settings or PROFILES:
+        run(settings_module, args.runs)
+
+
+if __name__ == '__main__':
+    main()
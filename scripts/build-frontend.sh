@@ -106,6 +106,13 @@ if [ -f "$MANAGE_PY" ]; then
     
     if [ $? -eq 0 ]; then
         echo -e "${GREEN}✅ Django static files collected${NC}"
+        # collectstatic hashes file names and writes .br/.gz variants (bookloan.compression)
+        STATIC_ROOT_DIR="$PROJECT_DIR/staticfiles"
+        if [ -d "$STATIC_ROOT_DIR" ]; then
+            GZ_COUNT=$(find "$STATIC_ROOT_DIR" -type f -name '*.gz' | wc -l)
+            BR_COUNT=$(find "$STATIC_ROOT_DIR" -type f -name '*.br' | wc -l)
+            echo -e "   Precompressed variants: $GZ_COUNT gzip, $BR_COUNT brotli"
+        fi
     else
         echo -e "${YELLOW}⚠️  Django collectstatic failed (this is okay if settings aren't configured)${NC}"
     fi